@@ -0,0 +1,307 @@
+"""
+Precomputed analysis cubes
+
+When enabled (``TABLE_CUBES=1`` or ``TableGenerator(cubes=True)``), every
+table plan is materialized at load time into a cube. Each cell is one
+combination of the subject-level filter dimensions (arm, sex, exact age,
+race, country) and the plan's own grouping keys, and holds:
+
+- the number of records,
+- count/mean/M2/min/max of every analysis value,
+- first row position per value (to keep first-appearance ordering),
+- the set of subjects contributing to the cell (subject_sets.SubjectSetColumn).
+
+CubeRelation implements the same relation interface as
+table_engine.FrameRelation. The executors then roll tables up from cells
+instead of raw rows. Distinct-subject counts union the cells' subject sets, so they
+stay exact even when cells share subjects. Filters that touch columns
+outside the cube grain fall back to the raw-row path.
+
+Cube sets are cached per data directory. Concurrent first requests for a
+directory (threaded server, warmup scheduler) wait for one build instead of
+each building the full set.
+"""
+
+import os
+import threading
+
+import numpy as np
+import pandas as pd
+
+import filter_language
+from subject_sets import SubjectIndex, SubjectSetColumn
+from table_engine import ARM_VAR, SUBJECT_VAR, STATISTICS, band_values
+
+# Subject-level filter dimensions materialized in every cube
+DIMENSIONS = ('TRT', 'SEX', 'AGE', 'RACE', 'COUNTRY')
+
+STACKED_VALUE = 'AVAL'
+
+# data directory -> (data signature, CubeSet)
+_CUBE_CACHE = {}
+_CUBE_LOCK = threading.Lock()
+# data directory -> lock held while its cubes are built
+_BUILD_LOCKS = {}
+
+
+def _moments(grouped, value):
+    """Per-cell count, mean, M2 (sum of squared deviations), min and max"""
+    stats = grouped[value].agg(['count', 'mean', 'var', 'min', 'max'])
+    stats['m2'] = (stats['var'] * (stats['count'] - 1)).fillna(0.0)
+    return stats.drop(columns='var').add_prefix(f'_{value}_')
+
+
+class Cube:
+    """One plan's aggregates at the grain of DIMENSIONS plus the plan keys"""
+
+    def __init__(self, plan, frame, demographics):
+        self.plan = plan
+        self.source_columns = set(frame.columns) | set(demographics.columns)
+
+        dims = [d for d in DIMENSIONS if d in frame.columns or d in demographics.columns]
+        keys = [k for k in plan.keys if k not in dims]
+        values = list(plan.values)
+
+        base = frame[[c for c in plan.columns if c in frame.columns]]
+        demo_columns = [d for d in dims if d not in base.columns]
+        if demo_columns:
+            base = base.merge(demographics[[SUBJECT_VAR] + demo_columns], on=SUBJECT_VAR, how='left')
+
+        stack_as = plan.spec.get('analysis', {}).get('stack_as')
+        if stack_as:
+            base = base.melt(id_vars=[c for c in base.columns if c not in values],
+                             value_vars=values, var_name=stack_as, value_name=STACKED_VALUE)
+            keys.append(stack_as)
+            values = [STACKED_VALUE]
+        self.stack_as = stack_as
+        # float32 measurements are accumulated in float64
+        base = base.astype({v: np.float64 for v in values if base[v].dtype == np.float32})
+
+        base = base.assign(_row=np.arange(len(base)))
+        self.grain = dims + keys
+        grouped = base.groupby(self.grain, sort=False, dropna=False, observed=True)
+
+        cells = grouped.agg(_records=('_row', 'size'), _first_row=('_row', 'min'))
+        for value in values:
+            cells = cells.join(_moments(grouped, value))
+            first = base['_row'].where(base[value].notna())
+            cells[f'_{value}_first_row'] = first.groupby(grouped.ngroup().to_numpy()).min().to_numpy()
+        cells = cells.reset_index()
+        cells['_cell'] = np.arange(len(cells))
+        self.cells = cells
+        self.values = values
+
+        subjects = SubjectIndex(demographics[SUBJECT_VAR])
+        self.subject_sets = SubjectSetColumn(
+            grouped.ngroup().to_numpy(),
+            subjects.codes(base[SUBJECT_VAR]),
+            len(cells), subjects.universe
+        )
+
+    def supports(self, compiled_filter, extra_columns=()):
+        """True if every filter/extra column is in the grain or absent from the data"""
+        for column in set(compiled_filter.columns) | set(extra_columns):
+            if column not in self.grain and column in self.source_columns:
+                return False
+        return True
+
+    def relation(self, compiled_filter):
+        return CubeRelation(self, compiled_filter.apply(self.cells))
+
+
+class CubeRelation:
+    """Relation answered by rolling up cube cells (see table_engine.FrameRelation)"""
+
+    def __init__(self, cube, cells, value=None):
+        self.cube = cube
+        self.cells = cells
+        self.value = value
+
+    def _live(self):
+        """Cells contributing at least one record (one non-null value after dropna)"""
+        if self.value is None:
+            return self.cells
+        return self.cells[self.cells[f'_{self.value}_count'] > 0]
+
+    def _records(self, cells):
+        return cells[f'_{self.value}_count'] if self.value else cells['_records']
+
+    def __len__(self):
+        return int(self._records(self.cells).sum())
+
+    def levels(self, variable, order='appearance'):
+        if isinstance(order, list):
+            return order
+        first_row = f'_{self.value}_first_row' if self.value else '_first_row'
+        first = self._live().groupby(variable, sort=False, dropna=False)[first_row].min()
+        levels = list(first.sort_values(kind='stable').index)
+        if order == 'sorted':
+            return sorted(level for level in levels if not pd.isna(level))
+        return levels
+
+    def aggregate(self, keys, measure, value=None):
+        cells = self._live()
+        grouped = cells.groupby(keys, sort=False, observed=True)
+
+        if measure == 'records':
+            return self._records(cells).groupby([cells[k] for k in keys], sort=False).sum()
+
+        if measure == 'subjects':
+            codes = grouped.ngroup().to_numpy()
+            index = grouped.size().index
+            valid = codes >= 0
+            counts = self.cube.subject_sets.union_counts(
+                cells['_cell'].to_numpy()[valid], codes[valid], len(index)
+            )
+            return pd.Series(counts, index=index)
+
+        if measure == 'statistics':
+            prefix = f'_{value}_'
+            cells = cells[cells[f'{prefix}count'] > 0]
+            n = cells[f'{prefix}count']
+            by = [cells[k] for k in keys]
+            total = n.groupby(by, sort=False).sum()
+            weighted = (n * cells[f'{prefix}mean']).groupby(by, sort=False).sum()
+            mean = weighted / total
+
+            cell_mean = cells[f'{prefix}mean']
+            group_mean = mean.reindex(pd.MultiIndex.from_arrays(by) if len(keys) > 1 else by[0]).to_numpy()
+            spread = cells[f'{prefix}m2'] + n * (cell_mean.to_numpy() - group_mean) ** 2
+            m2 = spread.groupby(by, sort=False).sum()
+
+            result = pd.DataFrame({
+                'count': total.astype('int64'),
+                'mean': mean,
+                'std': np.sqrt(m2 / (total - 1)).where(total > 1),
+                'min': cells[f'{prefix}min'].groupby(by, sort=False).min(),
+                'max': cells[f'{prefix}max'].groupby(by, sort=False).max(),
+            })
+            return result[STATISTICS]
+
+        raise ValueError(f"Unknown measure: {measure}")
+
+    def where(self, variable, equals=None, not_in=None):
+        mask = pd.Series(True, index=self.cells.index)
+        if equals is not None:
+            mask &= self.cells[variable] == equals
+        if not_in:
+            mask &= ~self.cells[variable].isin(not_in)
+        return CubeRelation(self.cube, self.cells[mask], self.value)
+
+    def stack(self, id_vars, variables, var_name, value_name):
+        # Cubes for stacked specs are materialized already stacked
+        if var_name != self.cube.stack_as:
+            raise ValueError(f"Cube was not stacked as {var_name}")
+        return self
+
+    def dropna(self, column):
+        if column not in self.cube.values:
+            column = STACKED_VALUE
+        return CubeRelation(self.cube, self.cells[self.cells[f'_{column}_count'] > 0], column)
+
+    def with_subgroup(self, name, source, bins=None, labels=None):
+        values = self.cells[source]
+        if bins is not None:
+            values = band_values(values, bins, labels)
+        return CubeRelation(self.cube, self.cells.assign(**{name: values}), self.value)
+
+
+class PopulationCube:
+    """Subject counts per combination of DIMENSIONS (denominators)"""
+
+    def __init__(self, demographics):
+        self.dims = [d for d in DIMENSIONS if d in demographics.columns]
+        self.source_columns = set(demographics.columns)
+        self.cells = (demographics.groupby(self.dims, dropna=False, observed=True)
+                      .size().rename('_records').reset_index())
+
+    def supports(self, compiled_filter, subgroup=None):
+        columns = set(compiled_filter.columns)
+        if subgroup is not None:
+            columns.add(subgroup['variable'])
+        return all(c in self.dims or c not in self.source_columns for c in columns)
+
+    def population_counts(self, compiled_filter, subgroup=None):
+        cells = compiled_filter.apply(self.cells)
+        if subgroup is None:
+            return cells.groupby(ARM_VAR)['_records'].sum().to_dict()
+
+        values = cells[subgroup['variable']]
+        if 'bins' in subgroup:
+            values = band_values(values, subgroup['bins'], subgroup['labels'])
+        counts = cells.groupby([values.rename('_level'), cells[ARM_VAR]])['_records'].sum()
+        counts = counts[counts > 0]
+        return {level: counts.xs(level).to_dict() for level in counts.index.unique(level=0)}
+
+
+class CubeSet:
+    """Cubes for every plan plus the population cube, built from loaded datasets"""
+
+    def __init__(self, generator, plans):
+        self.population = PopulationCube(generator.demographics)
+        # Grades tables grade every record value, so they always read raw rows
+        self.cubes = {
+            name: Cube(plan, generator.get_domain(plan.domain), generator.demographics)
+            for name, plan in plans.items() if plan.kind != 'grades'
+        }
+
+    def relation(self, plan, filters, extra_columns=()):
+        """Cube relation for plan, or None if the filters need raw rows"""
+        cube = self.cubes.get(plan.name)
+        compiled = filter_language.compile_filters(filters)
+        if cube is None or not cube.supports(compiled, extra_columns):
+            return None
+        return cube.relation(compiled)
+
+    def population_counts(self, filters, subgroup=None):
+        compiled = filter_language.compile_filters(filters)
+        if not self.population.supports(compiled, subgroup):
+            return None
+        return self.population.population_counts(compiled, subgroup)
+
+
+def data_signature(data_path, datasets):
+    """(file, mtime, size) of every dataset file; changes when data is refreshed"""
+    signature = []
+    for filename in datasets.values():
+        path = os.path.join(data_path, filename)
+        if os.path.exists(path):
+            stat = os.stat(path)
+            signature.append((filename, stat.st_mtime, stat.st_size))
+    return tuple(signature)
+
+
+def _cached_cubes(key, signature):
+    with _CUBE_LOCK:
+        cached = _CUBE_CACHE.get(key)
+        if cached is not None and cached[0] == signature:
+            return cached[1]
+        return None
+
+
+def get_cubes(generator, plans, datasets):
+    """Cubes for generator's data directory, rebuilt only when the data changes
+
+    One build per directory at a time: concurrent callers wait for it and
+    share its cubes. Different directories build in parallel.
+    """
+    key = os.path.abspath(generator.data_path)
+    signature = data_signature(generator.data_path, datasets)
+    cubes = _cached_cubes(key, signature)
+    if cubes is not None:
+        return cubes
+    with _CUBE_LOCK:
+        build_lock = _BUILD_LOCKS.setdefault(key, threading.Lock())
+    with build_lock:
+        cubes = _cached_cubes(key, signature)
+        if cubes is None:
+            cubes = CubeSet(generator, plans)
+            with _CUBE_LOCK:
+                _CUBE_CACHE[key] = (signature, cubes)
+        return cubes
+
+
+def drop_cubes(data_path):
+    """Forget cached cubes for a data directory (e.g. when its study is evicted)"""
+    with _CUBE_LOCK:
+        _CUBE_CACHE.pop(os.path.abspath(data_path), None)
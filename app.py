@@ -1,16 +1,29 @@
-from flask import Flask, render_template, request, jsonify
-import pandas as pd
-import numpy as np
-from datetime import datetime
+import startup
+from flask import Flask, Response, render_template, request, jsonify
 import os
-import json
-from data_generator import generate_sample_data
-from table_generator import TableGenerator
+import sys
+
+# pandas and the table engine are imported inside the handlers (and by the
+# background warm-up) so the server can open its socket without waiting for them
 
 app = Flask(__name__)
+startup.readiness.record_import()
+
+@app.before_request
+def start_warmup():
+    """Under a WSGI server the first request (e.g. a readiness probe) starts warm-up"""
+    startup.readiness.start()
 
-# Initialize sample data
-generate_sample_data()
+@app.after_request
+def record_request(response):
+    startup.readiness.record_request()
+    return response
+
+@app.route('/api/ready')
+def ready():
+    """Readiness probe: 200 once warm-up finished, 503 while warming or failed"""
+    report = startup.readiness.report()
+    return jsonify(report), 200 if report['status'] == 'ready' else 503
 
 @app.route('/')
 def index():
@@ -20,46 +33,220 @@ def index():
 @app.route('/api/tables')
 def get_available_tables():
     """Get list of available table types"""
-    tables = {
-        'adverse_events': 'Adverse Events Summary',
-        'demographics': 'Demographics Table', 
-        'vital_signs': 'Vital Signs Summary',
-        'laboratory': 'Laboratory Values Summary',
-        'concomitant_meds': 'Concomitant Medications',
-        'disposition': 'Subject Disposition'
-    }
-    return jsonify(tables)
+    import table_engine
+    return jsonify(table_engine.available_tables())
 
 @app.route('/api/generate_table', methods=['POST'])
 def generate_table():
     """Generate the requested table"""
+    import filter_language
+    import pooled_analysis
+    import study_registry
+    import table_engine
+    from table_generator import TableGenerator
+
     try:
         data = request.get_json()
         table_type = data.get('table_type')
         filters = data.get('filters', {})
+        study = data.get('study')
+        studies = data.get('studies')
         
-        generator = TableGenerator()
-        
-        if table_type == 'adverse_events':
-            result = generator.generate_adverse_events_table(filters)
-        elif table_type == 'demographics':
-            result = generator.generate_demographics_table(filters)
-        elif table_type == 'vital_signs':
-            result = generator.generate_vital_signs_table(filters)
-        elif table_type == 'laboratory':
-            result = generator.generate_laboratory_table(filters)
-        elif table_type == 'concomitant_meds':
-            result = generator.generate_conmed_table(filters)
-        elif table_type == 'disposition':
-            result = generator.generate_disposition_table(filters)
-        else:
+        if table_type not in table_engine.PLANS:
             return jsonify({'error': 'Invalid table type'}), 400
+        unknown = [s for s in (studies or [study]) if s and s not in study_registry.get_registry().studies]
+        if unknown:
+            return jsonify({'error': f'Unknown study: {unknown[0]}'}), 400
+
+        if studies:
+            generator = pooled_analysis.PooledTableGenerator(studies, synonyms=data.get('synonyms'))
+        else:
+            generator = TableGenerator(study=study)
+
+        result = generator.generate_table(table_type, filters)
             
         return jsonify(result)
         
+    except filter_language.FilterError as e:
+        return jsonify({'error': str(e)}), 400
+
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/subgroup_matrix', methods=['POST'])
+def subgroup_matrix():
+    """Generate tables for every level of the requested subgroup variables"""
+    import filter_language
+    import pooled_analysis
+    import study_registry
+    import subgroup_analysis
+    import table_engine
+    from table_generator import TableGenerator
+
+    try:
+        data = request.get_json()
+        table_types = data.get('table_types') or list(table_engine.PLANS)
+        subgroups = data.get('subgroups', [])
+        filters = data.get('filters', {})
+        study = data.get('study')
+        studies = data.get('studies')
+
+        unknown = [t for t in table_types if t not in table_engine.PLANS]
+        if unknown:
+            return jsonify({'error': f'Invalid table type: {unknown[0]}'}), 400
+        unknown = [s for s in subgroups if s not in subgroup_analysis.SUBGROUPS]
+        if not subgroups or unknown:
+            return jsonify({'error': f'Invalid subgroups: {unknown or subgroups}'}), 400
+        unknown = [s for s in (studies or [study]) if s and s not in study_registry.get_registry().studies]
+        if unknown:
+            return jsonify({'error': f'Unknown study: {unknown[0]}'}), 400
+
+        if studies:
+            generator = pooled_analysis.PooledTableGenerator(studies, synonyms=data.get('synonyms'))
+        else:
+            generator = TableGenerator(study=study)
+        result = {
+            table_type: generator.generate_subgroup_tables(table_type, subgroups, filters)
+            for table_type in table_types
+        }
+        return jsonify(result)
+
+    except filter_language.FilterError as e:
+        return jsonify({'error': str(e)}), 400
+
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/figures')
+def get_available_figures():
+    """Get list of available figure types"""
+    import figure_data
+    return jsonify(figure_data.available_figures())
+
+@app.route('/api/figure_data', methods=['POST'])
+def get_figure_data():
+    """Pre-aggregated, downsampled plot data for one figure"""
+    import figure_data
+    import filter_language
+    import pooled_analysis
+    import study_registry
+    from table_generator import TableGenerator
+
+    try:
+        data = request.get_json()
+        figure = data.get('figure')
+        filters = data.get('filters', {})
+        options = data.get('options', {})
+        study = data.get('study')
+        studies = data.get('studies')
+
+        if figure not in figure_data.FIGURES:
+            return jsonify({'error': 'Invalid figure type'}), 400
+        unknown = [s for s in (studies or [study]) if s and s not in study_registry.get_registry().studies]
+        if unknown:
+            return jsonify({'error': f'Unknown study: {unknown[0]}'}), 400
+
+        if studies:
+            generator = pooled_analysis.PooledTableGenerator(studies, synonyms=data.get('synonyms'))
+        else:
+            generator = TableGenerator(study=study)
+        return jsonify(generator.generate_figure(figure, filters, options))
+
+    except (filter_language.FilterError, figure_data.FigureError) as e:
+        return jsonify({'error': str(e)}), 400
+
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@app.route('/api/results/<key>')
+def get_stored_result(key):
+    """A stored result (with its manifest) by manifest key, for traceability"""
+    import result_store
+    if len(key) != 64 or any(c not in '0123456789abcdef' for c in key):
+        return jsonify({'error': 'Invalid result key'}), 400
+    result = result_store.get_store().get(key)
+    if result is None:
+        return jsonify({'error': 'Result not found'}), 404
+    return jsonify(result)
+
+@app.route('/api/subjects', methods=['POST'])
+def subjects():
+    """Count (and optionally list) subjects matching a subject-set query"""
+    import filter_language
+    from table_generator import TableGenerator
+
+    try:
+        data = request.get_json()
+        query = data.get('query')
+        if query is None:
+            return jsonify({'error': 'Missing query'}), 400
+
+        generator = TableGenerator(backend='pandas', study=data.get('study'))
+        subject_set = generator.subject_set(query)
+        result = {'count': len(subject_set)}
+        if data.get('list_subjects'):
+            result['subjects'] = generator.subjects.to_ids(subject_set)
+        return jsonify(result)
+
+    except (filter_language.FilterError, ValueError) as e:
+        return jsonify({'error': str(e)}), 400
+
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/studies')
+def get_studies():
+    """Registered studies, which are loaded, and memory use against the budget
+
+    ?detail=1 adds rows, bytes and dtypes per dataset of every loaded study.
+    """
+    import study_registry
+    registry = study_registry.get_registry()
+    registry.discover()
+    return jsonify(registry.report(detail=request.args.get('detail') in ('1', 'true')))
+
+@app.route('/api/warmup')
+def get_warmup():
+    """Warm/cold state of the precomputed default tables and result cache stats"""
+    import warmup_scheduler
+    return jsonify(warmup_scheduler.get_scheduler().report())
+
+@app.route('/api/live')
+def live_table():
+    """Server-Sent Events: changes to an open table whenever its data changes
+
+    Query parameters: table_type, study, filters (JSON) and since (the
+    manifest key of the table the client shows). See live_updates.
+    """
+    import json
+    import filter_language
+    import live_updates
+    import study_registry
+    import table_engine
+
+    table_type = request.args.get('table_type')
+    study = request.args.get('study') or study_registry.DEFAULT_STUDY
+    if table_type not in table_engine.PLANS:
+        return jsonify({'error': 'Invalid table type'}), 400
+    if study not in study_registry.get_registry().studies:
+        return jsonify({'error': f'Unknown study: {study}'}), 400
+    try:
+        filters = json.loads(request.args.get('filters') or '{}')
+        filter_language.compile_filters(filters)
+    except ValueError as e:
+        # Malformed JSON or a filter_language.FilterError
+        return jsonify({'error': str(e)}), 400
+
+    stream = live_updates.get_hub().stream(study, table_type, filters, since=request.args.get('since'))
+    return Response(stream, mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+@app.route('/api/live/status')
+def get_live_status():
+    """Open live views, their subscriber counts and refresh statistics"""
+    import live_updates
+    return jsonify(live_updates.get_hub().report())
+
 @app.route('/api/datasets')
 def get_datasets():
     """Get information about available datasets"""
@@ -74,4 +261,11 @@ def get_datasets():
     return jsonify(datasets)
 
 if __name__ == '__main__':
+    if '--generate-data' in sys.argv:
+        from data_generator import generate_sample_data
+        generate_sample_data()
+
+    # With the debug reloader, only the serving child process warms up
+    if os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        startup.readiness.start()
     app.run(debug=True, host='0.0.0.0', port=8080)
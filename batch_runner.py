@@ -0,0 +1,300 @@
+#!/usr/bin/env python3
+
+"""
+Batch runner for headless table production
+
+Reads a batch file listing studies, populations (named filter sets) and
+tables. It generates every table for every study and population in a
+process pool and writes HTML, CSV and/or RTF files to
+``<output>/<study>/<population>/<table>.<format>``. Flask is not involved.
+
+A table is skipped when its result manifest key (input file hashes,
+filters and code version; see result_store) matches the last run recorded
+in ``<output>/batch_index.json`` and all its files still exist. Per-table
+timings are printed as tables finish.
+
+    python batch_runner.py batch.json
+    python batch_runner.py batch.json --workers 4 --formats rtf --force
+"""
+
+import argparse
+import html
+import json
+import os
+import re
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import pandas as pd
+
+import filter_language
+import study_registry
+import table_engine
+from table_generator import TableGenerator, result_manifest
+
+FORMATS = ('html', 'csv', 'rtf')
+BATCH_INDEX = 'batch_index.json'
+NAME_PATTERN = re.compile(r'^[A-Za-z0-9_.-]+$')
+
+# Generators of this worker process, one per study (datasets stay loaded)
+_GENERATORS = {}
+
+
+def load_batch(path):
+    """Batch file with defaults applied and table/population names and filters checked"""
+    with open(path) as f:
+        batch = json.load(f)
+    tables = batch.get('tables', 'all')
+    if tables == 'all':
+        tables = list(table_engine.PLANS)
+    unknown = [t for t in tables if t not in table_engine.PLANS]
+    if unknown:
+        raise ValueError(f"Unknown tables in {path}: {unknown}")
+    formats = batch.get('formats', list(FORMATS))
+    unknown = [f for f in formats if f not in FORMATS]
+    if unknown:
+        raise ValueError(f"Unknown formats in {path}: {unknown}")
+    populations = batch.get('populations', {'all': {}})
+    for name in list(populations) + list(batch.get('studies', [])):
+        if not NAME_PATTERN.match(name):
+            raise ValueError(f"Names must be letters, digits, '.', '_' or '-': {name!r}")
+    for name, filters in populations.items():
+        try:
+            filter_language.compile_filters(filters)
+        except filter_language.FilterError as e:
+            raise ValueError(f"Population {name!r} in {path}: {e}") from e
+    return {
+        'output_dir': batch.get('output_dir', 'output'),
+        'formats': formats,
+        'studies': batch.get('studies', [study_registry.DEFAULT_STUDY]),
+        'populations': populations,
+        'tables': tables,
+    }
+
+
+def plan_jobs(batch, output_dir):
+    """One job per (study, population, table), grouped by study"""
+    jobs = []
+    for study in batch['studies']:
+        for population, filters in batch['populations'].items():
+            for table in batch['tables']:
+                base = os.path.join(output_dir, study, population, table)
+                jobs.append({
+                    'id': f'{study}/{population}/{table}',
+                    'study': study,
+                    'population': population,
+                    'filters': filters,
+                    'table': table,
+                    'outputs': {fmt: f'{base}.{fmt}' for fmt in batch['formats']},
+                })
+    return jobs
+
+
+def _headers(columns):
+    """Column headings as the web tables show them"""
+    return [column.replace('_', ' ').title() for column in columns]
+
+
+def write_html(result, path, population, manifest):
+    document = f"""<!DOCTYPE html>
+<html lang="en">
+<head>
+    <meta charset="UTF-8">
+    <title>{html.escape(result['title'])}</title>
+    <style>
+        body {{ font-family: 'Segoe UI', Arial, sans-serif; margin: 20px; color: #333; }}
+        .clinical-table {{ width: 100%; border-collapse: collapse; margin-top: 20px; }}
+        .clinical-table th {{ background: #4a5568; color: white; padding: 12px; text-align: left; }}
+        .clinical-table td {{ padding: 10px; border-bottom: 1px solid #e2e8f0; }}
+        .clinical-table tr:nth-child(even) {{ background: #f7fafc; }}
+        .table-title {{ color: #4a5568; font-size: 1.5em; margin-bottom: 8px; }}
+        .table-subtitle {{ color: #718096; margin-bottom: 20px; font-style: italic; }}
+        .export-info {{ margin-bottom: 20px; padding: 15px; background: #f0f9ff; border-left: 4px solid #0ea5e9; }}
+    </style>
+</head>
+<body>
+    <div class="export-info">
+        <strong>Population:</strong> {html.escape(population)}<br>
+        Generated on: {manifest['generated_at']}<br>
+        Result key: {manifest['key']}<br>
+        Source: Clinical Trials Safety Tables Generator
+    </div>
+    {result['table_html']}
+</body>
+</html>
+"""
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write(document)
+
+
+def write_csv(result, path):
+    """All data columns, like the web CSV export"""
+    frame = pd.DataFrame(result['data'])
+    if frame.empty:
+        frame = pd.DataFrame(columns=result['columns'])
+    frame.to_csv(path, index=False)
+
+
+def _rtf_text(value):
+    if value is None or (isinstance(value, float) and pd.isna(value)):
+        return ''
+    text = str(value).replace('\\', '\\\\').replace('{', '\\{').replace('}', '\\}')
+    return ''.join(ch if ord(ch) < 128 else f'\\u{ord(ch) if ord(ch) < 32768 else ord(ch) - 65536}?'
+                   for ch in text)
+
+
+def write_rtf(result, path, population, manifest):
+    """Landscape RTF table: title, subtitle, header row, one row per record"""
+    columns = result['columns']
+    width = 14400 // max(len(columns), 1)
+    cell_edges = ''.join(f'\\clbrdrb\\brdrs\\cellx{width * (i + 1)}' for i in range(len(columns)))
+
+    def row(values, header=False):
+        start, end = ('\\b ', '\\b0') if header else ('', '')
+        cells = ''.join(f'\\pard\\intbl {start}{_rtf_text(v)}{end}\\cell ' for v in values)
+        repeat = '\\trhdr' if header else ''
+        return f'\\trowd\\trgaph80{repeat}{cell_edges}\n{cells}\\row'
+
+    body = [
+        '{\\rtf1\\ansi\\deff0{\\fonttbl{\\f0 Courier New;}}',
+        '\\paperw15840\\paperh12240\\landscape\\margl720\\margr720\\margt720\\margb720\\fs18',
+        f'\\pard\\qc\\b {_rtf_text(result["title"])}\\b0\\par',
+        f'\\pard\\qc\\i {_rtf_text(result["subtitle"])}\\i0\\par',
+        f'\\pard\\qc Population: {_rtf_text(population)}\\par\\par',
+        row(_headers(columns), header=True),
+    ]
+    body.extend(row([record.get(column) for column in columns]) for record in result['data'])
+    body.append(f'\\pard\\par\\pard\\fs14 Generated {_rtf_text(manifest["generated_at"])}; '
+                f'result key {manifest["key"]}\\par')
+    body.append('}')
+    with open(path, 'w', encoding='ascii') as f:
+        f.write('\n'.join(body))
+
+
+def run_job(job, backend, cubes):
+    """Generate one table and write its files (runs in a worker process)"""
+    started = time.perf_counter()
+    try:
+        generator = _GENERATORS.get(job['study'])
+        if generator is None:
+            generator = TableGenerator(backend=backend, cubes=cubes, study=job['study'])
+            _GENERATORS[job['study']] = generator
+        result = generator.generate_table(job['table'], job['filters'])
+        manifest = result['manifest']
+        for fmt, path in job['outputs'].items():
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            if fmt == 'html':
+                write_html(result, path, job['population'], manifest)
+            elif fmt == 'csv':
+                write_csv(result, path)
+            else:
+                write_rtf(result, path, job['population'], manifest)
+        return {'id': job['id'], 'key': manifest['key'], 'rows': len(result['data']),
+                'files': sorted(job['outputs'].values()),
+                'seconds': round(time.perf_counter() - started, 4)}
+    except Exception as e:
+        return {'id': job['id'], 'error': str(e), 'seconds': round(time.perf_counter() - started, 4)}
+
+
+def read_index(output_dir):
+    path = os.path.join(output_dir, BATCH_INDEX)
+    if not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        return json.load(f)
+
+
+def write_index(output_dir, index):
+    os.makedirs(output_dir, exist_ok=True)
+    path = os.path.join(output_dir, BATCH_INDEX)
+    with open(path + '.tmp', 'w') as f:
+        json.dump(index, f, indent=2, sort_keys=True)
+    os.replace(path + '.tmp', path)
+
+
+def is_unchanged(job, key, index):
+    """True if the last run produced this result key and every file still exists"""
+    previous = index.get(job['id'])
+    return (previous is not None and previous.get('key') == key
+            and all(os.path.exists(path) for path in job['outputs'].values())
+            and set(previous.get('files', [])) >= set(job['outputs'].values()))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Generate tables for every study and population in a batch file")
+    parser.add_argument('batch', help="Batch file (JSON) listing studies, populations and tables")
+    parser.add_argument('--output', help="Output directory (overrides output_dir in the batch file)")
+    parser.add_argument('--formats', help="Comma-separated formats to write (html,csv,rtf)")
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1,
+                        help="Worker processes (default: CPU count; 1 runs in-process)")
+    parser.add_argument('--backend', default=os.environ.get('TABLE_BACKEND', 'pandas'),
+                        help="Table backend: pandas, sqlite or duckdb")
+    parser.add_argument('--cubes', action='store_true', help="Use precomputed analysis cubes")
+    parser.add_argument('--force', action='store_true', help="Regenerate tables even if inputs are unchanged")
+    args = parser.parse_args(argv)
+
+    try:
+        batch = load_batch(args.batch)
+        if args.formats:
+            batch['formats'] = [f.strip() for f in args.formats.split(',') if f.strip()]
+            unknown = [f for f in batch['formats'] if f not in FORMATS]
+            if unknown:
+                raise ValueError(f"Unknown formats: {unknown}")
+        registry = study_registry.get_registry()
+        unknown = [s for s in batch['studies'] if s not in registry.studies]
+        if unknown:
+            raise ValueError(f"Unknown studies: {unknown}")
+    except (OSError, ValueError) as e:
+        print(f"Error: {e}")
+        return 2
+
+    output_dir = args.output or batch['output_dir']
+    cubes = args.cubes and args.backend == 'pandas'
+    index = read_index(output_dir)
+    jobs = plan_jobs(batch, output_dir)
+
+    pending = []
+    skipped = 0
+    for job in jobs:
+        key = result_manifest(job['study'], 'table', job['table'], job['filters'],
+                              backend=args.backend, cubes=cubes)['key']
+        if not args.force and is_unchanged(job, key, index):
+            skipped += 1
+        else:
+            pending.append(job)
+    print(f"{len(jobs)} tables: {len(pending)} to generate, {skipped} unchanged")
+
+    started = time.perf_counter()
+    outcomes = []
+
+    def record(outcome):
+        outcomes.append(outcome)
+        if 'error' in outcome:
+            print(f"  FAILED  {outcome['id']:<48} {outcome['error']}")
+            return
+        index[outcome['id']] = {'key': outcome['key'], 'files': outcome['files'],
+                                'rows': outcome['rows'], 'seconds': outcome['seconds']}
+        print(f"  {outcome['seconds']:>7.3f}s {outcome['id']:<48} {outcome['rows']} rows")
+
+    if args.workers <= 1 or len(pending) <= 1:
+        for job in pending:
+            record(run_job(job, args.backend, cubes))
+    else:
+        with ProcessPoolExecutor(max_workers=args.workers) as pool:
+            futures = [pool.submit(run_job, job, args.backend, cubes) for job in pending]
+            for future in as_completed(futures):
+                record(future.result())
+
+    write_index(output_dir, index)
+    elapsed = time.perf_counter() - started
+    failures = sum(1 for outcome in outcomes if 'error' in outcome)
+    table_seconds = sum(outcome['seconds'] for outcome in outcomes)
+    print(f"Generated {len(pending) - failures} tables in {elapsed:.2f}s "
+          f"({table_seconds:.2f}s of table time), {skipped} unchanged, {failures} failed; "
+          f"output in {output_dir}")
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,213 @@
+"""
+Load-time schema and validation of the study datasets
+
+Every dataset is typed as soon as it is read:
+
+- subject-level and coded text columns become pandas categoricals. Those
+  that several datasets share (SUBJID, TRT, VISIT: SHARED_KEYS) then get one
+  sorted dictionary per study, so a subject or arm has the same code in
+  every domain and cross-domain lookups and merges work on the codes,
+- integer columns (AGE) are downcast to the smallest integer type that fits,
+- measurements (vitals, weight/height/BMI) become float32. Lab values stay
+  float64: they are recorded at the precision their means are reported at,
+  so float32 rounding would move summaries that fall on a rounding tie,
+- dates are parsed to datetime64.
+
+Unlisted columns are kept as read. A drop fails fast with a SchemaError
+listing every problem found:
+
+- missing columns,
+- values that do not parse as their declared type,
+- duplicate SUBJIDs in demographics,
+- subjects in any other domain that are not in demographics (referential
+  integrity, checked on the category dictionaries rather than row by row).
+"""
+
+import numpy as np
+import pandas as pd
+
+SUBJECT_VAR = 'SUBJID'
+
+# Column -> storage type ('category', 'integer', 'float32', 'float64' or 'date')
+SCHEMAS = {
+    'demographics': {
+        'SUBJID': 'category', 'TRT': 'category', 'AGE': 'integer', 'SEX': 'category',
+        'RACE': 'category', 'WEIGHT': 'float32', 'HEIGHT': 'float32',
+        'COUNTRY': 'category', 'BMI': 'float32',
+    },
+    'adverse_events': {
+        'SUBJID': 'category', 'TRT': 'category', 'AETERM': 'category', 'AESEV': 'category',
+        'AEREL': 'category', 'AESTDT': 'date', 'AEENDT': 'date', 'AEOUT': 'category',
+    },
+    'vital_signs': {
+        'SUBJID': 'category', 'TRT': 'category', 'VISIT': 'category', 'SBP': 'float32',
+        'DBP': 'float32', 'PULSE': 'float32', 'TEMP': 'float32', 'WEIGHT': 'float32',
+    },
+    'laboratory': {
+        'SUBJID': 'category', 'TRT': 'category', 'VISIT': 'category', 'LBTEST': 'category',
+        'LBVAL': 'float64', 'LBUNIT': 'category',
+    },
+    'conmed': {
+        'SUBJID': 'category', 'TRT': 'category', 'CMTRT': 'category', 'CMDOSE': 'category',
+        'CMFREQ': 'category', 'CMSTDT': 'date',
+    },
+    'disposition': {
+        'SUBJID': 'category', 'TRT': 'category', 'DSDECOD': 'category', 'DSTERM': 'category',
+    },
+}
+
+# Categorical columns of several datasets, coded with one dictionary per study
+SHARED_KEYS = tuple(sorted({
+    column
+    for schema in SCHEMAS.values() for column, kind in schema.items()
+    if kind == 'category' and sum(column in other for other in SCHEMAS.values()) > 1
+}))
+
+DATE_FORMAT = '%Y-%m-%d'
+
+
+class SchemaError(ValueError):
+    """Raised when a study's datasets do not match their schema"""
+
+    def __init__(self, study, problems):
+        self.study = study
+        self.problems = problems
+        super().__init__(f"Study {study} failed validation: " + '; '.join(problems))
+
+
+def _examples(values, limit=3):
+    return ', '.join(repr(v) for v in list(values)[:limit])
+
+
+def _unparsed(original, parsed):
+    """Values that were present but did not parse"""
+    return original[original.notna() & parsed.isna()]
+
+
+def coerce_column(series, kind):
+    """(typed series, problem or None) for one column"""
+    if kind == 'category':
+        if isinstance(series.dtype, pd.CategoricalDtype):
+            return series, None
+        return series.astype('category'), None
+
+    if kind == 'date':
+        if pd.api.types.is_datetime64_any_dtype(series.dtype):
+            return series, None
+        parsed = pd.to_datetime(series, format=DATE_FORMAT, errors='coerce')
+        bad = _unparsed(series, parsed)
+        if len(bad):
+            return series, f"{len(bad)} values are not {DATE_FORMAT} dates (e.g. {_examples(bad)})"
+        return parsed, None
+
+    parsed = pd.to_numeric(series, errors='coerce')
+    bad = _unparsed(series, parsed)
+    if len(bad):
+        return series, f"{len(bad)} values are not numeric (e.g. {_examples(bad)})"
+    if kind == 'integer':
+        if parsed.isna().any():
+            # Missing values need a float column
+            return parsed.astype(np.float32), None
+        if not (parsed == np.round(parsed)).all():
+            fractional = parsed[parsed != np.round(parsed)]
+            return series, f"{len(fractional)} values are not integers (e.g. {_examples(fractional)})"
+        return pd.to_numeric(parsed.astype(np.int64), downcast='integer'), None
+    return parsed.astype(kind), None
+
+
+def apply_schema(name, frame):
+    """(typed frame, problems) for one dataset; unknown datasets pass through"""
+    schema = SCHEMAS.get(name)
+    if schema is None:
+        return frame, []
+    problems = [f"{name}: missing column {column}" for column in schema if column not in frame.columns]
+    typed = {}
+    for column, kind in schema.items():
+        if column not in frame.columns:
+            continue
+        series, problem = coerce_column(frame[column], kind)
+        if problem:
+            problems.append(f"{name}.{column}: {problem}")
+        elif series is not frame[column]:
+            typed[column] = series
+    if typed:
+        frame = frame.assign(**typed)
+    return frame, problems
+
+
+def _distinct(series):
+    if isinstance(series.dtype, pd.CategoricalDtype):
+        # Categories present in the column (shared dictionaries hold more)
+        codes = series.cat.codes.to_numpy()
+        present = np.bincount(codes[codes >= 0], minlength=len(series.cat.categories)) > 0
+        return pd.Index(series.cat.categories[present])
+    return pd.Index(series.dropna().unique())
+
+
+def share_dictionaries(frames):
+    """frames with every SHARED_KEYS column recoded to one sorted dictionary per study
+
+    Columns whose categories already are the shared dictionary (e.g. mapped
+    from a column store written after sharing) are kept as they are.
+    """
+    frames = dict(frames)
+    for column in SHARED_KEYS:
+        names = [name for name, frame in frames.items()
+                 if column in frame.columns and isinstance(frame[column].dtype, pd.CategoricalDtype)]
+        if len(names) < 2:
+            continue
+        categories = frames[names[0]][column].cat.categories
+        for name in names[1:]:
+            categories = categories.union(frames[name][column].cat.categories)
+        for name in names:
+            series = frames[name][column]
+            if not series.cat.categories.equals(categories):
+                frames[name] = frames[name].assign(**{column: series.cat.set_categories(categories)})
+    return frames
+
+
+def check_references(frames):
+    """Referential-integrity problems across a study's datasets"""
+    demographics = frames.get('demographics')
+    if demographics is None or SUBJECT_VAR not in demographics.columns:
+        return []
+    problems = []
+    subjects = demographics[SUBJECT_VAR]
+    duplicated = subjects[subjects.duplicated()]
+    if len(duplicated):
+        problems.append(f"demographics: {len(duplicated)} duplicate {SUBJECT_VAR} values "
+                        f"(e.g. {_examples(duplicated.unique())})")
+    if subjects.isna().any():
+        problems.append(f"demographics: {int(subjects.isna().sum())} rows without {SUBJECT_VAR}")
+
+    known = _distinct(subjects)
+    for name, frame in frames.items():
+        if name == 'demographics' or SUBJECT_VAR not in frame.columns:
+            continue
+        unknown = _distinct(frame[SUBJECT_VAR]).difference(known)
+        if len(unknown):
+            rows = int(frame[SUBJECT_VAR].isin(unknown).sum())
+            problems.append(f"{name}: {rows} rows for {len(unknown)} subjects not in demographics "
+                            f"(e.g. {_examples(unknown)})")
+    return problems
+
+
+def memory_summary(frames, parsed_bytes=None):
+    """{dataset: rows, bytes, parsed_bytes and dtypes} plus totals, for reports"""
+    datasets = {}
+    for name, frame in frames.items():
+        entry = {
+            'rows': len(frame),
+            'bytes': int(frame.memory_usage(index=True, deep=True).sum()),
+            'dtypes': {column: str(dtype) for column, dtype in frame.dtypes.items()},
+        }
+        if parsed_bytes and name in parsed_bytes:
+            entry['parsed_bytes'] = parsed_bytes[name]
+        datasets[name] = entry
+    summary = {
+        'datasets': datasets,
+        'bytes': sum(entry['bytes'] for entry in datasets.values()),
+    }
+    if parsed_bytes:
+        summary['parsed_bytes'] = sum(parsed_bytes.values())
+    return summary
@@ -0,0 +1,386 @@
+"""
+Plot data for figures
+
+Pre-aggregated, downsampled series that the browser can draw directly,
+computed on the same relations and plans as the tables:
+
+- ``mean_over_time``: per-visit mean with 95% CI for each parameter and arm
+  (vital signs or laboratory),
+- ``spaghetti``: subject-level trajectories of one parameter, capped at
+  ``max_subjects`` subjects and ``max_points`` points per trajectory
+  (Largest-Triangle-Three-Buckets downsampling),
+- ``ae_dot_plot``: AE incidence per arm with the risk difference vs the
+  reference arm, most frequent terms first,
+- ``box_plot``: quartiles, 1.5 IQR whiskers and the most extreme outliers
+  per visit, parameter and arm.
+
+Means and incidence go through generator.relation, so they work on every
+backend and for pooled studies. Spaghetti and box plots need subject-level
+rows; they read the study's frames (also when tables use a SQL backend).
+"""
+
+import math
+
+import numpy as np
+import pandas as pd
+
+import table_engine
+from subgroup_analysis import REFERENCE_ARM, Z_95, risk_difference
+from table_engine import ARM_VAR, SUBJECT_VAR
+
+# Figure domain -> table plan the figure is computed from
+MEASUREMENT_PLANS = {
+    'vital_signs': 'vital_signs',
+    'laboratory': 'laboratory',
+}
+TIME_VAR = 'VISIT'
+VALUE_VAR = 'AVAL'
+
+DEFAULTS = {
+    'max_points': 500,
+    'max_subjects': 200,
+    'max_terms': 30,
+    'max_outliers': 20,
+}
+# Upper bound of every size option, whatever the request asks for
+LIMITS = {
+    'max_points': 10000,
+    'max_subjects': 5000,
+    'max_terms': 500,
+    'max_outliers': 1000,
+}
+
+
+class FigureError(ValueError):
+    """Raised for unknown figures or options that do not fit the figure"""
+
+
+def lttb(x, y, threshold):
+    """Indexes of the Largest-Triangle-Three-Buckets downsample of (x, y)
+
+    Keeps the first and last point and, for each of threshold - 2 buckets,
+    the point forming the largest triangle with the previously kept point
+    and the average of the next bucket.
+    """
+    n = len(x)
+    if threshold >= n or threshold < 3:
+        return np.arange(n)
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    every = (n - 2) / (threshold - 2)
+
+    selected = np.empty(threshold, dtype=np.int64)
+    selected[0] = 0
+    a = 0
+    for i in range(threshold - 2):
+        start = int(i * every) + 1
+        end = int((i + 1) * every) + 1
+        next_start, next_end = end, min(int((i + 2) * every) + 1, n)
+        if next_start >= next_end:
+            next_start, next_end = n - 1, n
+        avg_x = x[next_start:next_end].mean()
+        avg_y = y[next_start:next_end].mean()
+        area = np.abs((x[a] - avg_x) * (y[start:end] - y[a]) - (x[a] - x[start:end]) * (avg_y - y[a]))
+        a = start + int(np.argmax(area))
+        selected[i + 1] = a
+    selected[-1] = n - 1
+    return selected
+
+
+def figure_options(options):
+    """Size options with defaults applied and clamped to LIMITS"""
+    resolved = {}
+    for name, default in DEFAULTS.items():
+        value = options.get(name, default)
+        try:
+            value = int(value)
+        except (TypeError, ValueError):
+            raise FigureError(f"{name} must be an integer, got {value!r}")
+        resolved[name] = max(1, min(value, LIMITS[name]))
+    return resolved
+
+
+def _option_strings(options, name):
+    """A list-of-strings option, or None when it is not given"""
+    value = options.get(name)
+    if value is None:
+        return None
+    if not isinstance(value, list) or not all(isinstance(v, str) for v in value):
+        raise FigureError(f"{name} must be a list of strings, got {value!r}")
+    return value
+
+
+def _measurement_plan(domain):
+    if domain not in MEASUREMENT_PLANS:
+        raise FigureError(f"Figure domain must be one of {sorted(MEASUREMENT_PLANS)}, got {domain!r}")
+    plan = table_engine.PLANS[MEASUREMENT_PLANS[domain]]
+    analysis = plan.spec['analysis']
+    parameter = analysis.get('stack_as') or next(
+        key['variable'] for key in plan.spec['by'] if key['variable'] not in (TIME_VAR, ARM_VAR)
+    )
+    return plan, parameter
+
+
+def _parameter_order(plan, parameter):
+    for key in plan.spec['by']:
+        if key['variable'] == parameter and key.get('order') == 'spec':
+            return plan.spec['analysis']['variables']
+    return 'appearance'
+
+
+def _stacked(plan, relation):
+    """Relation of (visit, parameter, arm, AVAL) measurements, like run_descriptive"""
+    analysis = plan.spec['analysis']
+    keys = [key['variable'] for key in plan.spec['by']]
+    if analysis.get('stack_as'):
+        id_vars = [k for k in keys if k != analysis['stack_as']]
+        relation = relation.stack(id_vars, analysis['variables'], analysis['stack_as'], VALUE_VAR)
+        value = VALUE_VAR
+    else:
+        value = analysis['variable']
+    return relation.dropna(value), value
+
+
+def _stacked_frame(plan, generator, filters, parameter):
+    """Filtered subject-level measurements as a frame (pandas rows)"""
+    analysis = plan.spec['analysis']
+    frame = table_engine.prepare_frame(plan, _row_generator(generator), filters)
+    if analysis.get('stack_as'):
+        keep = [c for c in frame.columns if c not in analysis['variables']]
+        frame = frame.melt(id_vars=keep, value_vars=analysis['variables'],
+                           var_name=parameter, value_name=VALUE_VAR)
+    else:
+        frame = frame.rename(columns={analysis['variable']: VALUE_VAR})
+    return frame.dropna(subset=[VALUE_VAR])
+
+
+def _row_generator(generator):
+    """A generator with in-memory frames for the same study"""
+    if hasattr(generator, 'studies'):
+        raise FigureError("Subject-level figures run against a single study")
+    if generator.store is None:
+        return generator
+    return generator.__class__(backend='pandas', cubes=False, study=generator.study)
+
+
+def _number(value, decimals=3):
+    if value is None or pd.isna(value):
+        return None
+    return round(float(value), decimals)
+
+
+def mean_over_time(generator, filters, options):
+    """Per-visit mean with a 95% CI for every parameter and arm"""
+    plan, parameter = _measurement_plan(options.get('domain', 'vital_signs'))
+    sizes = figure_options(options)
+    relation, value = _stacked(plan, generator.relation(plan, filters))
+    if not len(relation):
+        return {'x': [], 'series': [], 'source_rows': 0}
+
+    visits = relation.levels(TIME_VAR, 'appearance')
+    parameters = relation.levels(parameter, _parameter_order(plan, parameter))
+    wanted = _option_strings(options, 'parameters')
+    if wanted:
+        parameters = [p for p in parameters if p in wanted]
+    arms = relation.levels(ARM_VAR, 'sorted')
+    stats = relation.aggregate([parameter, ARM_VAR, TIME_VAR], 'statistics', value).reset_index()
+    visit_index = {visit: i for i, visit in enumerate(visits)}
+    stats['_x'] = [visit_index[v] for v in stats[TIME_VAR]]
+    by_series = dict(list(stats.groupby([parameter, ARM_VAR], sort=False, observed=True)))
+
+    series = []
+    for name in parameters:
+        for arm in arms:
+            cells = by_series.get((name, arm))
+            if cells is None:
+                continue
+            cells = cells.sort_values('_x')
+            n = cells['count'].to_numpy()
+            half = Z_95 * cells['std'].to_numpy() / np.sqrt(np.maximum(n, 1))
+            half = np.where(n > 1, half, np.nan)
+            keep = lttb(cells['_x'].to_numpy(), cells['mean'].to_numpy(), sizes['max_points'])
+            points = [
+                {
+                    'x': cells[TIME_VAR].iloc[i], 'x_index': int(cells['_x'].iloc[i]), 'n': int(n[i]),
+                    'mean': _number(cells['mean'].iloc[i]), 'sd': _number(cells['std'].iloc[i]),
+                    'ci_lower': _number(cells['mean'].iloc[i] - half[i]),
+                    'ci_upper': _number(cells['mean'].iloc[i] + half[i]),
+                }
+                for i in keep
+            ]
+            series.append({'parameter': name, 'arm': arm, 'points': points})
+    return {'x': visits, 'parameter_variable': parameter, 'series': series,
+            'source_rows': int(len(relation))}
+
+
+def spaghetti(generator, filters, options):
+    """Subject-level trajectories of one parameter, downsampled"""
+    plan, parameter = _measurement_plan(options.get('domain', 'laboratory'))
+    sizes = figure_options(options)
+    name = options.get('parameter')
+    if name is not None and not isinstance(name, str):
+        raise FigureError(f"parameter must be a string, got {name!r}")
+    empty = {'x': [], 'parameter': name, 'subjects': [],
+             'subjects_total': 0, 'subjects_shown': 0, 'points_total': 0, 'points_shown': 0}
+    frame = _stacked_frame(plan, generator, filters, parameter)
+    if frame.empty:
+        return empty
+
+    name = name or frame[parameter].iloc[0]
+    frame = frame[frame[parameter] == name]
+    if frame.empty:
+        # Unknown parameter, or none of its records pass the filters
+        return dict(empty, parameter=name)
+    visits = list(pd.unique(frame[TIME_VAR]))
+    x = pd.Index(visits).get_indexer(frame[TIME_VAR])
+    codes = frame[table_engine.SUBJECT_CODE].to_numpy()
+
+    # Evenly spaced subjects (by subject index) so every arm stays represented
+    subjects = np.unique(codes)
+    if len(subjects) > sizes['max_subjects']:
+        picks = np.linspace(0, len(subjects) - 1, sizes['max_subjects']).round().astype(int)
+        subjects = subjects[np.unique(picks)]
+    shown = np.isin(codes, subjects)
+
+    order = np.lexsort((x[shown], codes[shown]))
+    codes_shown = codes[shown][order]
+    x_shown = x[shown][order]
+    y_shown = frame[VALUE_VAR].to_numpy()[shown][order]
+    ids = frame[SUBJECT_VAR].to_numpy()[shown][order]
+    arms = frame[ARM_VAR].to_numpy()[shown][order]
+    bounds = np.flatnonzero(np.diff(codes_shown)) + 1
+    starts = np.concatenate([[0], bounds])
+    ends = np.concatenate([bounds, [len(codes_shown)]])
+
+    trajectories = []
+    points_shown = 0
+    for start, end in zip(starts, ends):
+        keep = start + lttb(x_shown[start:end], y_shown[start:end], sizes['max_points'])
+        points_shown += len(keep)
+        trajectories.append({
+            'subject': ids[start], 'arm': arms[start],
+            'x': x_shown[keep].tolist(),
+            'y': [_number(v) for v in y_shown[keep]],
+        })
+    return {
+        'x': visits, 'parameter': name, 'subjects': trajectories,
+        'subjects_total': int(len(np.unique(codes))), 'subjects_shown': len(trajectories),
+        'points_total': int(len(frame)), 'points_shown': points_shown,
+    }
+
+
+def ae_dot_plot(generator, filters, options):
+    """AE incidence per arm and risk difference vs the reference arm, by term"""
+    plan = table_engine.PLANS['adverse_events']
+    sizes = figure_options(options)
+    row_var = plan.spec['rows']['variable']
+    measure = plan.spec.get('count', 'subjects')
+    reference = options.get('reference', REFERENCE_ARM)
+
+    relation = generator.relation(plan, filters)
+    totals = generator.population_counts(filters)
+    arms = sorted(arm for arm, n in totals.items() if n)
+    if not len(relation) or not arms:
+        return {'arms': arms, 'reference': reference, 'terms': [], 'terms_total': 0}
+
+    counts = relation.aggregate([row_var, ARM_VAR], measure).unstack(ARM_VAR)
+    counts = counts.reindex(columns=arms).fillna(0).astype(int)
+    denominators = np.array([totals[arm] for arm in arms])
+    overall = counts.sum(axis=1) / denominators.sum()
+    counts = counts.loc[overall.sort_values(ascending=False, kind='stable').index]
+
+    terms = []
+    for term, row in counts.head(sizes['max_terms']).iterrows():
+        cells = []
+        for arm, total in zip(arms, denominators):
+            n = int(row[arm])
+            cell = {'arm': arm, 'n': n, 'N': int(total), 'percent': round(n / total * 100, 1)}
+            if arm != reference and reference in arms:
+                diff, lower, upper = risk_difference(n, total, int(row[reference]), totals[reference])
+                cell.update({'risk_difference': diff, 'ci_lower': lower, 'ci_upper': upper})
+            cells.append(cell)
+        terms.append({'term': term, 'percent': round(float(overall[term]) * 100, 1), 'arms': cells})
+    return {'arms': arms, 'reference': reference if reference in arms else None,
+            'terms': terms, 'terms_total': int(len(counts))}
+
+
+def box_plot(generator, filters, options):
+    """Quartiles, whiskers and extreme outliers per visit, parameter and arm"""
+    plan, parameter = _measurement_plan(options.get('domain', 'laboratory'))
+    sizes = figure_options(options)
+    frame = _stacked_frame(plan, generator, filters, parameter)
+    wanted = _option_strings(options, 'parameters')
+    if wanted:
+        frame = frame[frame[parameter].isin(wanted)]
+    if frame.empty:
+        return {'boxes': [], 'parameter_variable': parameter, 'source_rows': 0}
+
+    keys = [TIME_VAR, parameter, ARM_VAR]
+    grouped = frame.groupby(keys, sort=False, observed=True)[VALUE_VAR]
+    group = grouped.ngroup().to_numpy()
+    values = frame[VALUE_VAR].to_numpy(dtype=np.float64)
+
+    summary = grouped.agg(['count', 'mean'])
+    quartiles = grouped.quantile([0.25, 0.5, 0.75]).unstack().reindex(summary.index)
+    q1 = quartiles[0.25].to_numpy()
+    q3 = quartiles[0.75].to_numpy()
+    low = (q1 - 1.5 * (q3 - q1))[group]
+    high = (q3 + 1.5 * (q3 - q1))[group]
+    inside = (values >= low) & (values <= high)
+
+    n_groups = len(summary)
+    whisker_low = pd.Series(values[inside]).groupby(group[inside]).min().reindex(range(n_groups))
+    whisker_high = pd.Series(values[inside]).groupby(group[inside]).max().reindex(range(n_groups))
+
+    # Most extreme outliers first, at most max_outliers per box
+    outliers = pd.DataFrame({'group': group[~inside], 'value': values[~inside]})
+    median = quartiles[0.5].to_numpy()
+    outliers['distance'] = np.abs(outliers['value'] - median[outliers['group']])
+    outliers = outliers.sort_values(['group', 'distance'], ascending=[True, False], kind='stable')
+    outlier_totals = outliers.groupby('group').size()
+    outliers = outliers[outliers.groupby('group').cumcount() < sizes['max_outliers']]
+    by_group = {g: part['value'].tolist() for g, part in outliers.groupby('group')}
+
+    boxes = []
+    for position, key in enumerate(summary.index):
+        box = dict(zip([TIME_VAR, parameter, ARM_VAR], key))
+        box.update({
+            'n': int(summary['count'].iloc[position]),
+            'mean': _number(summary['mean'].iloc[position]),
+            'q1': _number(q1[position]),
+            'median': _number(median[position]),
+            'q3': _number(q3[position]),
+            'whisker_low': _number(whisker_low.iloc[position]),
+            'whisker_high': _number(whisker_high.iloc[position]),
+            'outliers': [_number(v) for v in by_group.get(position, [])],
+            'outliers_total': int(outlier_totals.get(position, 0)),
+        })
+        boxes.append(box)
+
+    # Visits in appearance order, parameters in plan order, arms sorted
+    visits = {v: i for i, v in enumerate(pd.unique(frame[TIME_VAR]))}
+    order = _parameter_order(plan, parameter)
+    parameters = {p: i for i, p in enumerate(order if isinstance(order, list) else pd.unique(frame[parameter]))}
+    boxes.sort(key=lambda b: (visits[b[TIME_VAR]], parameters.get(b[parameter], math.inf), b[ARM_VAR]))
+    return {'boxes': boxes, 'parameter_variable': parameter, 'source_rows': int(len(frame))}
+
+
+# Figure name -> (label, builder)
+FIGURES = {
+    'mean_over_time': ('Mean over time with 95% CI', mean_over_time),
+    'spaghetti': ('Subject trajectories', spaghetti),
+    'ae_dot_plot': ('Adverse event dot plot', ae_dot_plot),
+    'box_plot': ('Box plot by visit', box_plot),
+}
+
+
+def available_figures():
+    """Figure name -> label (for the API)"""
+    return {name: label for name, (label, _) in FIGURES.items()}
+
+
+def build_figure(generator, figure, filters=None, options=None):
+    """Plot data of one figure for a TableGenerator (or pooled generator)"""
+    if figure not in FIGURES:
+        raise FigureError(f"Unknown figure: {figure}")
+    return FIGURES[figure][1](generator, filters or {}, options or {})
@@ -0,0 +1,326 @@
+"""
+Filter expression language
+
+Filters arrive from the API as a dict. The familiar shortcut keys
+(treatment, sex, age_min, age_max, race, country, bmi_min, bmi_max, visit,
+start_date_from, start_date_to) are combined with AND together with an
+optional free-form ``where`` expression:
+
+    {"or": [{"column": "AETERM", "in": ["Nausea", "Vomiting"]},
+            {"not": {"column": "AESEV", "eq": "Mild"}}]}
+
+Leaf operators: eq, ne, lt, le, gt, ge, in, not_in, between ([low, high],
+inclusive). Everything is normalized into one expression tree, validated
+against COLUMN_TYPES and compiled once per distinct filter set. It is then
+evaluated as a single combined boolean mask, so a complex population costs
+one indexing pass.
+
+A missing value matches no leaf except ``ne`` and ``not_in``, which are the
+exact negations of ``eq`` and ``in``; ``not`` negates the two-valued result
+of its subexpression. A row with no AEOUT therefore passes
+``{"not": {"column": "AEOUT", "eq": "Recovered"}}``. The SQL backend
+translates filters under the same rule.
+
+A term whose column is not present in a frame is pruned (not applicable),
+e.g. a VISIT filter does not restrict the demographics denominators. Only
+AND terms are pruned; an or/not subexpression that uses an absent column is
+dropped as a whole (see prune).
+"""
+
+import json
+from datetime import date
+from functools import lru_cache
+
+import numpy as np
+import pandas as pd
+
+# Logical type of every column that may appear in a filter
+COLUMN_TYPES = {
+    'SUBJID': 'string', 'TRT': 'string',
+    'AGE': 'numeric', 'SEX': 'string', 'RACE': 'string', 'COUNTRY': 'string',
+    'WEIGHT': 'numeric', 'HEIGHT': 'numeric', 'BMI': 'numeric',
+    'AETERM': 'string', 'AESEV': 'string', 'AEREL': 'string', 'AEOUT': 'string',
+    'AESTDT': 'date', 'AEENDT': 'date',
+    'VISIT': 'string', 'SBP': 'numeric', 'DBP': 'numeric', 'PULSE': 'numeric', 'TEMP': 'numeric',
+    'LBTEST': 'string', 'LBVAL': 'numeric', 'LBUNIT': 'string',
+    'CMTRT': 'string', 'CMDOSE': 'string', 'CMFREQ': 'string', 'CMSTDT': 'date',
+    'DSDECOD': 'string', 'DSTERM': 'string',
+}
+
+# Start-date columns targeted by the start_date_from/start_date_to shortcuts
+START_DATE_COLUMNS = ('AESTDT', 'CMSTDT')
+
+# Shortcut key -> (column, operator)
+SHORTCUTS = {
+    'treatment': ('TRT', 'in'),
+    'sex': ('SEX', 'in'),
+    'race': ('RACE', 'in'),
+    'country': ('COUNTRY', 'in'),
+    'visit': ('VISIT', 'in'),
+    'age_min': ('AGE', 'ge'),
+    'age_max': ('AGE', 'le'),
+    'bmi_min': ('BMI', 'ge'),
+    'bmi_max': ('BMI', 'le'),
+}
+
+COMPARISONS = ('eq', 'ne', 'lt', 'le', 'gt', 'ge')
+OPERATORS = COMPARISONS + ('in', 'not_in', 'between')
+ALLOWED_OPERATORS = {
+    'string': ('eq', 'ne', 'in', 'not_in'),
+    'numeric': OPERATORS,
+    'date': OPERATORS,
+}
+
+
+class FilterError(ValueError):
+    """Raised for malformed filters or filters that do not match column types"""
+
+
+def _is_empty(value):
+    return value is None or value == '' or value == []
+
+
+def _leaf(column, operator, value):
+    return {'column': column, 'op': operator, 'value': value}
+
+
+def normalize(filters):
+    """Translate an API filter dict into a single canonical expression tree
+
+    Returns None when no filter applies.
+    """
+    if not filters:
+        return None
+    if not isinstance(filters, dict):
+        raise FilterError("Filters must be an object")
+
+    terms = []
+    for key, value in filters.items():
+        if _is_empty(value):
+            continue
+        if key in SHORTCUTS:
+            column, operator = SHORTCUTS[key]
+            if operator == 'in' and not isinstance(value, list):
+                value = [value]
+            terms.append(_leaf(column, operator, value))
+        elif key in ('start_date_from', 'start_date_to'):
+            operator = 'ge' if key.endswith('_from') else 'le'
+            # One term per start-date column: no dataset has more than one, and
+            # AND terms on absent columns prune soundly (see prune)
+            terms.extend(_leaf(column, operator, value) for column in START_DATE_COLUMNS)
+        elif key == 'where':
+            terms.append(_parse(value))
+        else:
+            raise FilterError(f"Unknown filter: {key}")
+
+    if not terms:
+        return None
+    return terms[0] if len(terms) == 1 else {'and': terms}
+
+
+def _parse(node):
+    """Parse a user 'where' expression into the canonical tree form"""
+    if not isinstance(node, dict):
+        raise FilterError(f"Invalid filter expression: {node!r}")
+    for logical in ('and', 'or'):
+        if logical in node:
+            children = node[logical]
+            if not isinstance(children, list) or not children:
+                raise FilterError(f"'{logical}' needs a non-empty list")
+            return {logical: [_parse(child) for child in children]}
+    if 'not' in node:
+        return {'not': _parse(node['not'])}
+    if 'column' in node:
+        operators = [op for op in OPERATORS if op in node]
+        if len(operators) != 1:
+            raise FilterError(f"Filter on {node['column']} needs exactly one of {', '.join(OPERATORS)}")
+        return _leaf(node['column'], operators[0], node[operators[0]])
+    raise FilterError(f"Invalid filter expression: {node!r}")
+
+
+def _check_value(column, column_type, operator, value):
+    if operator in ('in', 'not_in'):
+        if not isinstance(value, list) or not value:
+            raise FilterError(f"'{operator}' on {column} needs a non-empty list")
+        for item in value:
+            _check_scalar(column, column_type, item)
+    elif operator == 'between':
+        if not isinstance(value, list) or len(value) != 2:
+            raise FilterError(f"'between' on {column} needs [low, high]")
+        for item in value:
+            _check_scalar(column, column_type, item)
+    else:
+        _check_scalar(column, column_type, value)
+
+
+def _check_scalar(column, column_type, value):
+    if column_type == 'numeric':
+        if isinstance(value, bool) or not isinstance(value, (int, float)):
+            raise FilterError(f"{column} is numeric; got {value!r}")
+    elif column_type == 'date':
+        try:
+            date.fromisoformat(str(value))
+        except ValueError:
+            raise FilterError(f"{column} is a date; expected YYYY-MM-DD, got {value!r}")
+    elif not isinstance(value, str):
+        raise FilterError(f"{column} is text; got {value!r}")
+
+
+def validate(tree):
+    """Check every leaf's column exists and its operator/value fit the column type"""
+    if tree is None:
+        return
+    for logical in ('and', 'or'):
+        if logical in tree:
+            for child in tree[logical]:
+                validate(child)
+            return
+    if 'not' in tree:
+        validate(tree['not'])
+        return
+
+    column, operator = tree['column'], tree['op']
+    if column not in COLUMN_TYPES:
+        raise FilterError(f"Unknown filter column: {column}")
+    column_type = COLUMN_TYPES[column]
+    if operator not in ALLOWED_OPERATORS[column_type]:
+        raise FilterError(f"Operator '{operator}' is not valid for {column_type} column {column}")
+    _check_value(column, column_type, operator, tree['value'])
+
+
+def tree_columns(tree):
+    """All columns referenced by an expression tree"""
+    if tree is None:
+        return set()
+    for logical in ('and', 'or'):
+        if logical in tree:
+            return set().union(*(tree_columns(child) for child in tree[logical]))
+    if 'not' in tree:
+        return tree_columns(tree['not'])
+    return {tree['column']}
+
+
+def prune(tree, columns):
+    """Drop AND terms that use an absent column; returns None if nothing applies
+
+    A dropped term reads as True, which only ever widens the selection when
+    the term is a conjunct. Under ``or`` or ``not`` it could narrow it (e.g.
+    ``not (SEX = F and AETERM = Nausea)`` would become ``not SEX = F``), so
+    an or/not subexpression is kept only if every column it uses is present
+    and is otherwise dropped whole.
+    """
+    if tree is None:
+        return None
+    if 'and' in tree:
+        children = [c for c in (prune(child, columns) for child in tree['and']) if c is not None]
+        if not children:
+            return None
+        return children[0] if len(children) == 1 else {'and': children}
+    return tree if tree_columns(tree) <= columns else None
+
+
+def _compare_value(series, value):
+    """Filter value in a form comparable with series (dates as Timestamp or ISO text)"""
+    if pd.api.types.is_datetime64_any_dtype(series.dtype):
+        return pd.Timestamp(value)
+    return value
+
+
+def _leaf_mask(frame, leaf):
+    series = frame[leaf['column']]
+    operator, value = leaf['op'], leaf['value']
+    if operator == 'in':
+        return series.isin(value).to_numpy()
+    if operator == 'not_in':
+        return ~series.isin(value).to_numpy()
+    if operator == 'between':
+        low, high = (_compare_value(series, v) for v in value)
+        return ((series >= low) & (series <= high)).to_numpy(dtype=bool, na_value=False)
+
+    value = _compare_value(series, value)
+    if operator == 'ne':
+        # Negation of eq whatever the dtype (nullable dtypes give NA for missing values)
+        return ~(series == value).to_numpy(dtype=bool, na_value=False)
+    result = {
+        'eq': series.__eq__,
+        'lt': series.__lt__, 'le': series.__le__,
+        'gt': series.__gt__, 'ge': series.__ge__,
+    }[operator](value)
+    return result.to_numpy(dtype=bool, na_value=False)
+
+
+def evaluate(tree, frame):
+    """Boolean numpy mask for a (pruned) expression tree over frame"""
+    if 'and' in tree:
+        return np.logical_and.reduce([evaluate(child, frame) for child in tree['and']])
+    if 'or' in tree:
+        return np.logical_or.reduce([evaluate(child, frame) for child in tree['or']])
+    if 'not' in tree:
+        return ~evaluate(tree['not'], frame)
+    return _leaf_mask(frame, tree)
+
+
+class CompiledFilter:
+    """A validated filter expression, reusable across frames and backends"""
+
+    def __init__(self, tree):
+        self.tree = tree
+        self.columns = frozenset(tree_columns(tree))
+        self.key = json.dumps(tree, sort_keys=True, default=str)
+
+    def __bool__(self):
+        return self.tree is not None
+
+    def bind(self, columns):
+        """Expression restricted to the given columns (None if nothing applies)"""
+        return prune(self.tree, set(columns))
+
+    def split(self, columns):
+        """Split top-level AND terms into (terms using only columns, the rest)
+
+        Returns two CompiledFilters whose conjunction equals this filter.
+        """
+        if self.tree is None:
+            return CompiledFilter(None), self
+        terms = self.tree['and'] if 'and' in self.tree else [self.tree]
+        columns = set(columns)
+        inside = [term for term in terms if tree_columns(term) <= columns]
+        outside = [term for term in terms if not tree_columns(term) <= columns]
+
+        def conjoin(parts):
+            if not parts:
+                return None
+            return parts[0] if len(parts) == 1 else {'and': parts}
+
+        return CompiledFilter(conjoin(inside)), CompiledFilter(conjoin(outside))
+
+    def mask(self, frame):
+        tree = self.bind(frame.columns)
+        if tree is None:
+            return None
+        return evaluate(tree, frame)
+
+    def apply(self, frame):
+        """Rows of frame matching the filter, selected with one combined mask"""
+        mask = self.mask(frame)
+        if mask is None:
+            return frame
+        return frame[mask]
+
+
+@lru_cache(maxsize=256)
+def _compile_key(key):
+    tree = normalize(json.loads(key))
+    validate(tree)
+    return CompiledFilter(tree)
+
+
+def compile_filters(filters):
+    """Normalize, validate and compile an API filter dict (memoized)"""
+    if isinstance(filters, CompiledFilter):
+        return filters
+    try:
+        key = json.dumps(filters or {}, sort_keys=True)
+    except TypeError:
+        raise FilterError("Filters must be JSON-serializable")
+    return _compile_key(key)
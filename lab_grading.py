@@ -0,0 +1,218 @@
+"""
+Laboratory toxicity grading (CTCAE)
+
+Grading criteria come from a threshold table (``lab_grades.json``, or the
+file named by ``LAB_GRADES``). Each criterion is one CTCAE term for one lab
+test and unit, with a direction and its grade boundaries, given either as
+absolute values or as multiples of the upper/lower limit of normal:
+
+    {"term": "Alanine aminotransferase increased", "test": "ALT", "unit": "U/L",
+     "direction": "high", "uln": 40, "multiples": [1, 3, 5, 20]}
+
+A value's grade under a ``high`` criterion is the number of boundaries it
+exceeds, under a ``low`` criterion the number it falls below. All records of
+a criterion are graded by one ``np.searchsorted`` against its sorted
+boundaries; records with no criterion for their test/unit, or no value, are
+not graded. The worst grade per criterion and subject is then a single
+grouped maximum over integer (criterion, subject) cells, and subjects are
+counted per term, arm and worst grade with one ``np.bincount``.
+"""
+
+import json
+import os
+import threading
+
+import numpy as np
+import pandas as pd
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+GRADES_PATH = os.environ.get('LAB_GRADES', os.path.join(BASE_DIR, 'lab_grades.json'))
+DIRECTIONS = ('high', 'low')
+
+_GRADINGS = {}
+_GRADINGS_LOCK = threading.Lock()
+
+
+def _codes(values):
+    """(integer codes, levels) of a column; categoricals reuse their own codes"""
+    if isinstance(values.dtype, pd.CategoricalDtype):
+        return values.cat.codes.to_numpy(), list(values.cat.categories)
+    codes, levels = pd.factorize(values)
+    return codes, list(levels)
+
+
+class Criterion:
+    """One CTCAE term: the test/unit it grades, its direction and grade boundaries"""
+
+    def __init__(self, entry):
+        self.term = entry['term']
+        self.test = entry['test']
+        self.unit = entry.get('unit')
+        self.direction = entry.get('direction', 'high')
+        if self.direction not in DIRECTIONS:
+            raise ValueError(f"Criterion {self.term!r} has unknown direction {self.direction!r}")
+
+        if 'multiples' in entry:
+            limit = entry['uln' if self.direction == 'high' else 'lln']
+            edges = [multiple * limit for multiple in entry['multiples']]
+        else:
+            edges = entry['edges']
+        edges = np.asarray(edges, dtype=np.float64)
+        steps = np.diff(edges) if self.direction == 'high' else -np.diff(edges)
+        if not len(edges) or (steps <= 0).any():
+            raise ValueError(f"Criterion {self.term!r} needs boundaries that worsen strictly "
+                             f"({'ascending' if self.direction == 'high' else 'descending'})")
+        self.edges = np.sort(edges)
+        self.max_grade = len(edges)
+
+    def grade(self, values):
+        """Grade of every value (float64 array without NaN)"""
+        if self.direction == 'high':
+            # Boundaries strictly below the value (CTCAE: "> ULN")
+            return np.searchsorted(self.edges, values, side='left')
+        # Boundaries strictly above the value (CTCAE: "< LLN")
+        return self.max_grade - np.searchsorted(self.edges, values, side='right')
+
+
+class Grading:
+    """Criteria of a threshold table, in table order"""
+
+    def __init__(self, criteria, version=None, spellings=None):
+        self.criteria = list(criteria)
+        self.version = version
+        # test -> the spellings it matches in the graded data (pooled studies)
+        self.spellings = spellings
+        terms = [criterion.term for criterion in self.criteria]
+        if len(set(terms)) != len(terms):
+            raise ValueError("Grading criteria must have distinct terms")
+
+    @property
+    def max_grade(self):
+        return max((criterion.max_grade for criterion in self.criteria), default=0)
+
+    def respelled(self, spellings):
+        """Same criteria, matching each test under every spelling spellings(test) returns"""
+        return Grading(self.criteria, self.version, spellings)
+
+    def grade(self, tests, units, values):
+        """(rows, criteria, grades) integer arrays: one entry per graded (record, criterion)
+
+        A record can match several criteria (e.g. hyper- and hypoglycemia).
+        Without units, criteria match on the test alone.
+        """
+        test_codes, test_levels = _codes(tests)
+        if units is None:
+            unit_codes, unit_levels = np.zeros(len(test_codes), dtype=np.intp), []
+        else:
+            unit_codes, unit_levels = _codes(units)
+        test_lookup = {level: code for code, level in enumerate(test_levels)}
+        unit_lookup = {level: code for code, level in enumerate(unit_levels)}
+
+        # (test code, unit code) -> criterion key; code -1 lands on the spare last row/column
+        keys = {}
+        key_of = np.full((len(test_levels) + 1, max(len(unit_levels), 1) + 1), -1, dtype=np.int16)
+        for criterion in sorted(self.criteria, key=lambda c: c.unit is not None):
+            names = self.spellings(criterion.test) if self.spellings else [criterion.test]
+            codes = [test_lookup[name] for name in names if name in test_lookup]
+            key = keys.setdefault((criterion.test, criterion.unit), len(keys))
+            if units is None or criterion.unit is None:
+                # Unit-less criteria cover every unit without a criterion of its own
+                key_of[codes] = key
+            elif criterion.unit in unit_lookup:
+                key_of[codes, unit_lookup[criterion.unit]] = key
+        record_keys = key_of[test_codes, unit_codes]
+        values = np.asarray(values, dtype=np.float64)
+        record_keys[np.isnan(values)] = -1
+
+        rows, criteria, grades = [], [], []
+        matched = {}
+        for position, criterion in enumerate(self.criteria):
+            key = keys[(criterion.test, criterion.unit)]
+            if key not in matched:
+                matched[key] = np.flatnonzero(record_keys == key)
+            if not len(matched[key]):
+                continue
+            rows.append(matched[key])
+            criteria.append(np.full(len(matched[key]), position, dtype=np.int64))
+            grades.append(criterion.grade(values[matched[key]]))
+        if not rows:
+            empty = np.zeros(0, dtype=np.int64)
+            return empty, empty, empty
+        return np.concatenate(rows), np.concatenate(criteria), np.concatenate(grades)
+
+
+def worst_grade_counts(grading, subjects, arms, tests, units, values, by=None):
+    """Subjects per (term, arm[, by], worst grade), as a Series of positive counts
+
+    subjects, arms and the optional subject-level by column are aligned
+    record Series; the arm and by levels of a subject are taken from its
+    records. Integer subjects are used as codes as they are (negative codes
+    are not graded). Grade 0 counts graded subjects with no abnormal value.
+    """
+    if pd.api.types.is_integer_dtype(subjects.dtype):
+        subject_codes = subjects.to_numpy()
+    else:
+        subject_codes, _ = pd.factorize(subjects)
+    arm_codes, arm_levels = _codes(arms)
+    keys = [(arm_codes, arm_levels, arms.name)]
+    if by is not None:
+        by_codes, by_levels = _codes(by)
+        keys.append((by_codes, by_levels, by.name))
+
+    known = subject_codes >= 0
+    n_subjects = int(subject_codes.max(initial=0)) + 1
+
+    rows, criteria, grades = grading.grade(tests, units, values)
+    if not known.all():
+        keep = known[rows]
+        rows, criteria, grades = rows[keep], criteria[keep], grades[keep]
+
+    # One grouped max over (criterion, subject) cells; -1 marks ungraded cells
+    worst = np.full(len(grading.criteria) * n_subjects, -1, dtype=np.int8)
+    np.maximum.at(worst, criteria * n_subjects + subject_codes[rows], grades.astype(np.int8))
+    graded = np.flatnonzero(worst >= 0)
+    subject = graded % n_subjects
+
+    columns = [graded // n_subjects]
+    sizes = [len(grading.criteria)]
+    levels = [[criterion.term for criterion in grading.criteria]]
+    names = ['term']
+    keep = np.ones(len(graded), dtype=bool)
+    for codes, key_levels, name in keys:
+        per_subject = np.full(n_subjects, -1, dtype=np.int64)
+        per_subject[subject_codes[known]] = codes[known]
+        columns.append(per_subject[subject])
+        keep &= columns[-1] >= 0
+        sizes.append(len(key_levels))
+        levels.append(list(key_levels))
+        names.append(name)
+    columns.append(worst[graded].astype(np.int64))
+    sizes.append(grading.max_grade + 1)
+    levels.append(list(range(grading.max_grade + 1)))
+    names.append('grade')
+
+    flat = np.ravel_multi_index([column[keep] for column in columns], sizes)
+    counts = np.bincount(flat, minlength=int(np.prod(sizes)))
+    present = np.flatnonzero(counts)
+    index = pd.MultiIndex.from_product(levels, names=names)[present]
+    return pd.Series(counts[present], index=index, name='subjects')
+
+
+def load_grading(path):
+    """Grading from a threshold table file"""
+    with open(path) as f:
+        table = json.load(f)
+    return Grading([Criterion(entry) for entry in table['criteria']], table.get('version'))
+
+
+def get_grading(path=None):
+    """Grading for a threshold table (default GRADES_PATH), loaded once per process
+
+    Like the table specs, a changed threshold table takes effect on restart;
+    it is part of the result code version (result_store.CONFIG_FILES).
+    """
+    path = os.path.join(BASE_DIR, path) if path else GRADES_PATH
+    with _GRADINGS_LOCK:
+        if path not in _GRADINGS:
+            _GRADINGS[path] = load_grading(path)
+        return _GRADINGS[path]
@@ -0,0 +1,305 @@
+"""
+Live refresh of open tables over Server-Sent Events
+
+A browser showing a table subscribes to ``/api/live`` with the table type,
+study and filters it displays. Subscribers of the same table, study and
+filters share one view. A daemon thread polls the signature (mtime and size)
+of the dataset files each view reads: its domain and demographics. When
+they change, the view's table is regenerated once on the server, whatever
+the number of subscribers. Each subscriber then gets a ``table`` event
+holding only what changed:
+
+- ``updated``: changed cells of rows that exist in both versions,
+- ``added``: new rows with all their cells,
+- ``removed``: row keys that are gone,
+- ``order``: the full list of row keys, only when rows were added,
+  removed or re-sorted,
+- ``summary``/``total_subjects``/``title``/``subtitle``: only when they changed.
+
+A failed refresh sends ``refresh_error`` (once per dataset signature) and
+keeps the previous table; it is retried on every poll until it succeeds.
+
+Rows are identified by their label columns (the row label of incidence
+tables, the by-variables of descriptive tables, the characteristic of the
+baseline table, the term and grade of grades tables). A change of columns,
+or labels that are not unique, sends the whole table instead (``full``).
+Tables whose datasets did not change are neither recomputed nor sent.
+"""
+
+import json
+import os
+import queue
+import threading
+
+import analysis_cube
+import filter_language
+import study_registry
+import table_engine
+from table_generator import DATASETS, TableGenerator
+
+LIVE_INTERVAL = float(os.environ.get('LIVE_INTERVAL', '2'))
+# Seconds between keep-alive comments on an idle stream
+HEARTBEAT_INTERVAL = 15
+# Events buffered per subscriber before it is told to reload
+MAX_PENDING_EVENTS = 50
+
+_HUB = None
+_HUB_LOCK = threading.Lock()
+
+
+def table_datasets(plan):
+    """DATASETS keys a table reads: its domain, plus demographics for filters and totals"""
+    return sorted({plan.domain, 'demographics'})
+
+
+def row_key_columns(plan):
+    """Columns that identify a row of a table's output"""
+    spec = plan.spec
+    if plan.kind == 'incidence':
+        return [spec['rows']['label']]
+    if plan.kind == 'descriptive':
+        return [key['label'] for key in spec['by']]
+    if plan.kind == 'grades':
+        labels = spec.get('labels', {})
+        return [labels.get('term', 'Term'), labels.get('grade', 'Grade')]
+    return ['Characteristic']
+
+
+def _same(a, b):
+    """Cell equality that treats two missing values as equal"""
+    if a != a and b != b:
+        return True
+    return a == b
+
+
+def diff_table(old, new, key_columns):
+    """Changes from result old to result new, or None if nothing changed"""
+    changes = {}
+    for field in ('title', 'subtitle', 'summary', 'total_subjects'):
+        if old.get(field) != new.get(field):
+            changes[field] = new.get(field)
+
+    old_keys = [[row.get(c) for c in key_columns] for row in old['data']]
+    new_keys = [[row.get(c) for c in key_columns] for row in new['data']]
+    old_index = {json.dumps(k, default=str): i for i, k in enumerate(old_keys)}
+    new_index = {json.dumps(k, default=str): i for i, k in enumerate(new_keys)}
+    if (old['columns'] != new['columns'] or len(old_index) != len(old_keys)
+            or len(new_index) != len(new_keys)):
+        changes['full'] = {field: new[field] for field in ('columns', 'data', 'table_html')}
+        return changes
+
+    updated, added = [], []
+    for key, i in new_index.items():
+        record = new['data'][i]
+        if key not in old_index:
+            added.append({'key': new_keys[i], 'record': record})
+            continue
+        previous = old['data'][old_index[key]]
+        cells = {column: value for column, value in record.items()
+                 if not _same(previous.get(column), value)}
+        if cells:
+            updated.append({'key': new_keys[i], 'cells': cells})
+    removed = [old_keys[i] for key, i in old_index.items() if key not in new_index]
+
+    if updated:
+        changes['updated'] = updated
+    if added:
+        changes['added'] = added
+    if removed:
+        changes['removed'] = removed
+    if added or removed or list(old_index) != list(new_index):
+        changes['order'] = new_keys
+    return changes or None
+
+
+def _json_safe(value):
+    """Value with NaN replaced by null (JSON.parse rejects NaN)"""
+    if isinstance(value, dict):
+        return {k: _json_safe(v) for k, v in value.items()}
+    if isinstance(value, list):
+        return [_json_safe(v) for v in value]
+    if isinstance(value, float) and value != value:
+        return None
+    return value
+
+
+def format_event(event, payload):
+    """One Server-Sent Events message"""
+    return f"event: {event}\ndata: {json.dumps(_json_safe(payload), default=str)}\n\n"
+
+
+class Subscription:
+    """One connected client: a bounded queue of events for its view"""
+
+    def __init__(self, view_key):
+        self.view_key = view_key
+        self.events = queue.Queue(maxsize=MAX_PENDING_EVENTS)
+        self.overflowed = False
+
+    def push(self, event, payload):
+        try:
+            self.events.put_nowait(format_event(event, payload))
+        except queue.Full:
+            # A client this far behind reloads the table instead
+            self.overflowed = True
+
+
+class LiveHub:
+    """Views with their subscribers, and the thread that refreshes them"""
+
+    def __init__(self, interval=LIVE_INTERVAL):
+        self.interval = interval
+        self.views = {}
+        self.pushes = 0
+        self.refreshes = 0
+        self._lock = threading.Lock()
+        self._thread = None
+        self._stop = threading.Event()
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name='live-updates', daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.check_once()
+
+    def _signature(self, study, table_type):
+        data_path = study_registry.get_registry().data_path(study)
+        datasets = table_datasets(table_engine.PLANS[table_type])
+        return analysis_cube.data_signature(data_path, {name: DATASETS[name] for name in datasets})
+
+    def subscribe(self, study, table_type, filters):
+        """(Subscription, current result) for a table, creating its view if needed"""
+        compiled = filter_language.compile_filters(filters)
+        view_key = (study, table_type, compiled.key)
+        with self._lock:
+            view = self.views.get(view_key)
+        if view is None:
+            # Computed outside the lock; normally a result cache hit
+            signature = self._signature(study, table_type)
+            result = TableGenerator(study=study).generate_table(table_type, filters)
+            view = {'study': study, 'table_type': table_type, 'filters': filters,
+                    'signature': signature, 'failed': None, 'result': result,
+                    'subscribers': set()}
+        with self._lock:
+            view = self.views.setdefault(view_key, view)
+            subscription = Subscription(view_key)
+            view['subscribers'].add(subscription)
+        self.start()
+        return subscription, view['result']
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            view = self.views.get(subscription.view_key)
+            if view is not None:
+                view['subscribers'].discard(subscription)
+                if not view['subscribers']:
+                    del self.views[subscription.view_key]
+
+    def check_once(self):
+        """Refresh every view whose datasets changed and push the differences"""
+        with self._lock:
+            views = list(self.views.values())
+        for view in views:
+            signature = None
+            try:
+                signature = self._signature(view['study'], view['table_type'])
+                if signature == view['signature']:
+                    continue
+                self.refresh(view)
+                # Only a successful refresh moves the view on; a failed one is retried
+                view['signature'] = signature
+                view['failed'] = None
+            except Exception as e:
+                print(f"Live refresh of {view['study']}/{view['table_type']} failed: {e}")
+                if signature is None or signature != view['failed']:
+                    view['failed'] = signature
+                    self._broadcast(view, 'refresh_error', {'table_type': view['table_type'], 'error': str(e)})
+
+    def refresh(self, view):
+        """Regenerate one view's table and send its changes to every subscriber"""
+        plan = table_engine.PLANS[view['table_type']]
+        result = TableGenerator(study=view['study']).generate_table(view['table_type'], view['filters'])
+        self.refreshes += 1
+        changes = diff_table(view['result'], result, row_key_columns(plan))
+        view['result'] = result
+        if changes is None:
+            return
+        changes.update({'table_type': view['table_type'], 'study': view['study'],
+                        'key_columns': row_key_columns(plan),
+                        'key': result.get('manifest', {}).get('key')})
+        self._broadcast(view, 'table', changes)
+
+    def _broadcast(self, view, event, payload):
+        with self._lock:
+            subscribers = list(view['subscribers'])
+        for subscription in subscribers:
+            subscription.push(event, payload)
+            self.pushes += 1
+
+    def stream(self, study, table_type, filters, since=None):
+        """SSE text for one subscriber until it disconnects
+
+        The subscription is made when the stream starts, so a client that
+        goes away before its first event leaves no view behind. since is
+        the manifest key of the table the client already shows; if the view
+        has moved on, the first event is the whole table.
+        """
+        try:
+            subscription, current = self.subscribe(study, table_type, filters)
+        except Exception as e:
+            yield format_event('refresh_error', {'table_type': table_type, 'error': str(e)})
+            return
+        try:
+            key = current.get('manifest', {}).get('key')
+            yield format_event('hello', {'key': key, 'interval_seconds': self.interval})
+            if since and key and since != key:
+                yield format_event('table', {
+                    'table_type': table_type, 'study': study, 'key': key,
+                    'key_columns': row_key_columns(table_engine.PLANS[table_type]),
+                    'full': {field: current[field] for field in ('columns', 'data', 'table_html')},
+                    'summary': current.get('summary'), 'total_subjects': current.get('total_subjects'),
+                })
+            while not self._stop.is_set():
+                if subscription.overflowed:
+                    yield format_event('reload', {'reason': 'too many pending updates'})
+                    return
+                try:
+                    yield subscription.events.get(timeout=HEARTBEAT_INTERVAL)
+                except queue.Empty:
+                    yield ': keep-alive\n\n'
+        finally:
+            self.unsubscribe(subscription)
+
+    def report(self):
+        """Open views and their subscriber counts"""
+        with self._lock:
+            views = [{
+                'study': view['study'],
+                'table_type': view['table_type'],
+                'filters': view['filters'],
+                'subscribers': len(view['subscribers']),
+                'key': view['result'].get('manifest', {}).get('key'),
+            } for view in self.views.values()]
+        return {
+            'running': self._thread is not None and self._thread.is_alive(),
+            'interval_seconds': self.interval,
+            'views': views,
+            'subscribers': sum(view['subscribers'] for view in views),
+            'refreshes': self.refreshes,
+            'events_pushed': self.pushes,
+        }
+
+
+def get_hub():
+    """Process-wide live update hub (its thread starts with the first subscriber)"""
+    global _HUB
+    with _HUB_LOCK:
+        if _HUB is None:
+            _HUB = LiveHub()
+        return _HUB
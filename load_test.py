@@ -0,0 +1,259 @@
+#!/usr/bin/env python3
+
+"""
+Load-testing harness for the HTTP API
+
+Replays a realistic mix of /api/tables, /api/datasets and
+/api/generate_table requests (every table type the server lists under
+/api/tables, with a rotating set of filter combinations) from concurrent
+clients. It reports throughput,
+latency percentiles and error rates for each concurrency level.
+
+By default a local server is started on a free port (``flask run`` with
+threads, in its own process, so clients and server do not share a GIL) and
+stopped afterwards. Use ``--url`` to target a server that is already
+running instead.
+
+    python load_test.py --concurrency 1,4,16 --duration 20
+    python load_test.py --url http://localhost:8080 --requests 500 --json results.json
+"""
+
+import argparse
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import threading
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+# Filter combinations reviewers commonly apply
+FILTER_SETS = [
+    {},
+    {'treatment': ['Drug A 20mg']},
+    {'treatment': ['Placebo', 'Drug A 10mg']},
+    {'sex': ['F']},
+    {'sex': ['M'], 'age_min': 40, 'age_max': 65},
+    {'race': ['Asian', 'White']},
+    {'treatment': ['Drug A 20mg'], 'sex': ['F'], 'age_min': 18},
+    {'where': {'column': 'AESEV', 'in': ['Moderate', 'Severe']}},
+]
+
+# (weight, endpoint) of the request mix
+REQUEST_MIX = [
+    (10, 'tables'),
+    (5, 'datasets'),
+    (85, 'generate_table'),
+]
+
+PERCENTILES = (50, 90, 95, 99)
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def start_server(port, env=None):
+    """Start app.py under `flask run` (threaded, no reloader) in a subprocess"""
+    command = [sys.executable, '-m', 'flask', '--app', 'app', 'run',
+               '--port', str(port), '--with-threads', '--no-reload', '--no-debugger']
+    return subprocess.Popen(
+        command,
+        cwd=os.path.dirname(os.path.abspath(__file__)),
+        env=dict(os.environ, **(env or {})),
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+
+
+def wait_until_ready(base_url, timeout=60):
+    """Poll /api/ready until the server reports ready"""
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            with urllib.request.urlopen(f'{base_url}/api/ready', timeout=5) as response:
+                if response.status == 200:
+                    return True
+        except urllib.error.HTTPError as e:
+            if e.code == 404:
+                # Server without a readiness endpoint: it answers, so treat as ready
+                return True
+        except (urllib.error.URLError, ConnectionError, OSError):
+            pass
+        time.sleep(0.1)
+    return False
+
+
+def fetch_table_types(base_url, timeout=60):
+    """Table types the server offers (/api/tables), in its order"""
+    with urllib.request.urlopen(f'{base_url}/api/tables', timeout=timeout) as response:
+        return list(json.load(response))
+
+
+def build_request(rng, table_types):
+    """Pick one request from the mix: (label, path, JSON body or None)"""
+    endpoint = rng.choices([e for _, e in REQUEST_MIX], weights=[w for w, _ in REQUEST_MIX])[0]
+    if endpoint != 'generate_table':
+        return endpoint, f'/api/{endpoint}', None
+    table_type = rng.choice(table_types)
+    filters = rng.choice(FILTER_SETS)
+    return f'generate_table:{table_type}', '/api/generate_table', {
+        'table_type': table_type, 'filters': filters
+    }
+
+
+def send(base_url, path, body, timeout):
+    """One request; returns (status code or None, latency in seconds)"""
+    data = json.dumps(body).encode() if body is not None else None
+    request = urllib.request.Request(f'{base_url}{path}', data=data,
+                                     headers={'Content-Type': 'application/json'})
+    started = time.perf_counter()
+    try:
+        with urllib.request.urlopen(request, timeout=timeout) as response:
+            response.read()
+            status = response.status
+    except urllib.error.HTTPError as e:
+        status = e.code
+    except (urllib.error.URLError, ConnectionError, OSError):
+        status = None
+    return status, time.perf_counter() - started
+
+
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, int(round(pct / 100 * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def summarize(samples, elapsed):
+    """Throughput, error rate and latency percentiles (ms) of (status, latency) samples"""
+    latencies = sorted(latency for _, latency in samples)
+    errors = sum(1 for status, _ in samples if status is None or status >= 400)
+    summary = {
+        'requests': len(samples),
+        'errors': errors,
+        'error_rate': round(errors / len(samples), 4) if samples else 0.0,
+        'throughput_rps': round(len(samples) / elapsed, 2) if elapsed else 0.0,
+    }
+    for pct in PERCENTILES:
+        value = percentile(latencies, pct)
+        summary[f'p{pct}_ms'] = round(value * 1000, 1) if value is not None else None
+    summary['max_ms'] = round(latencies[-1] * 1000, 1) if latencies else None
+    return summary
+
+
+def run_level(base_url, table_types, concurrency, duration=None, total_requests=None, seed=0,
+              timeout=60):
+    """Drive the server with `concurrency` clients for a duration or request count"""
+    samples = []
+    lock = threading.Lock()
+    issued = [0]
+    deadline = time.perf_counter() + duration if duration else None
+
+    def client(client_id):
+        rng = random.Random(seed * 1000 + client_id)
+        while True:
+            with lock:
+                if total_requests is not None and issued[0] >= total_requests:
+                    return
+                issued[0] += 1
+            if deadline is not None and time.perf_counter() >= deadline:
+                return
+            label, path, body = build_request(rng, table_types)
+            status, latency = send(base_url, path, body, timeout)
+            with lock:
+                samples.append((label, status, latency))
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(client, range(concurrency)))
+    elapsed = time.perf_counter() - started
+
+    by_endpoint = {}
+    by_table = {}
+    for label, status, latency in samples:
+        endpoint, _, table_type = label.partition(':')
+        by_endpoint.setdefault(endpoint, []).append((status, latency))
+        if table_type:
+            by_table.setdefault(table_type, []).append((status, latency))
+    return {
+        'concurrency': concurrency,
+        'elapsed_s': round(elapsed, 2),
+        'overall': summarize([(s, l) for _, s, l in samples], elapsed),
+        'endpoints': {label: summarize(values, elapsed) for label, values in sorted(by_endpoint.items())},
+        'tables': {label: summarize(values, elapsed) for label, values in sorted(by_table.items())},
+    }
+
+
+def print_report(results):
+    columns = ['requests', 'throughput_rps', 'error_rate'] + [f'p{p}_ms' for p in PERCENTILES] + ['max_ms']
+    header = f"{'clients':>7}  {'endpoint':<16}" + ''.join(f'{c:>15}' for c in columns)
+    print(header)
+    print('-' * len(header))
+    for level in results:
+        rows = [('overall', level['overall'])] + list(level['endpoints'].items())
+        for label, summary in rows:
+            print(f"{level['concurrency']:>7}  {label:<16}" +
+                  ''.join(f"{str(summary[c]):>15}" for c in columns))
+        print()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Load test the Clinical Trials tables API")
+    parser.add_argument('--url', help="Target an already running server instead of starting one")
+    parser.add_argument('--concurrency', default='1,4,16',
+                        help="Comma-separated numbers of concurrent clients (default 1,4,16)")
+    parser.add_argument('--duration', type=float, default=10.0,
+                        help="Seconds per concurrency level (default 10)")
+    parser.add_argument('--requests', type=int,
+                        help="Requests per concurrency level (overrides --duration)")
+    parser.add_argument('--seed', type=int, default=0, help="Seed of the request mix")
+    parser.add_argument('--timeout', type=float, default=60.0, help="Per-request timeout in seconds")
+    parser.add_argument('--json', dest='json_path', help="Also write the results to this JSON file")
+    args = parser.parse_args(argv)
+
+    server = None
+    base_url = args.url
+    if base_url is None:
+        port = free_port()
+        base_url = f'http://127.0.0.1:{port}'
+        print(f"Starting local server on {base_url} ...")
+        server = start_server(port)
+
+    try:
+        if not wait_until_ready(base_url.rstrip('/')):
+            print("Server did not become ready")
+            return 1
+        base_url = base_url.rstrip('/')
+        table_types = fetch_table_types(base_url, args.timeout)
+        print(f"Table types: {', '.join(table_types)}")
+
+        results = []
+        for concurrency in [int(c) for c in args.concurrency.split(',')]:
+            duration = None if args.requests else args.duration
+            print(f"Running {concurrency} client(s) ...")
+            results.append(run_level(base_url, table_types, concurrency, duration, args.requests,
+                                     args.seed, args.timeout))
+
+        print()
+        print_report(results)
+        if args.json_path:
+            with open(args.json_path, 'w') as f:
+                json.dump({'url': base_url, 'results': results}, f, indent=2)
+            print(f"Results written to {args.json_path}")
+        return 0
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait(timeout=10)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
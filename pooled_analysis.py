@@ -0,0 +1,309 @@
+"""
+Integrated (pooled) analysis across studies
+
+Computes the standard tables over the union of several registered studies
+without concatenating their datasets. Each study computes its own partial
+aggregates on its own backend (pandas, cubes or SQL). PooledRelation then
+merges them:
+
+- record and subject counts are summed (subjects are scoped to their study),
+- count/mean/std/min/max are combined from per-study moments.
+
+Categorical levels that differ in spelling or case between studies (TRT,
+AETERM, LBTEST) are mapped into one shared dictionary. Result labels are
+translated to the shared spelling, and filter values are translated back
+to each study's own spellings.
+"""
+
+import json
+
+import numpy as np
+import pandas as pd
+
+import filter_language
+import result_store
+from table_engine import ARM_VAR, STATISTICS
+from table_generator import DATASETS, TableGenerator
+
+# Harmonized column -> datasets whose values seed the shared dictionary
+HARMONIZED_COLUMNS = {
+    'TRT': ['demographics'],
+    'AETERM': ['adverse_events'],
+    'LBTEST': ['laboratory'],
+}
+
+
+def normalize_label(value):
+    """Matching key for a categorical level: case-folded, whitespace collapsed"""
+    return ' '.join(str(value).split()).casefold()
+
+
+class SharedDictionary:
+    """Shared spelling of each harmonized level plus every study's raw spellings
+
+    The first spelling seen (in study order) becomes the shared label, unless
+    an explicit synonym maps a raw value to a chosen label.
+    """
+
+    def __init__(self, synonyms=None):
+        self.synonyms = {column: {normalize_label(raw): label for raw, label in mapping.items()}
+                         for column, mapping in (synonyms or {}).items()}
+        self.labels = {column: {} for column in HARMONIZED_COLUMNS}
+        self.raw = {}
+
+    def add(self, study, column, values):
+        labels = self.labels[column]
+        mapping = self.raw.setdefault(study, {}).setdefault(column, {})
+        for value in values:
+            key = normalize_label(value)
+            label = self.synonyms.get(column, {}).get(key)
+            if label is not None:
+                key = normalize_label(label)
+                labels.setdefault(key, label)
+            else:
+                labels.setdefault(key, value)
+            mapping[value] = labels[key]
+
+    def shared(self, study, column, value):
+        """Shared label for one study's raw value"""
+        if column not in self.labels or not isinstance(value, str):
+            return value
+        mapping = self.raw.get(study, {}).get(column, {})
+        if value in mapping:
+            return mapping[value]
+        return self.labels[column].get(normalize_label(value), value)
+
+    def spellings(self, study, column, value):
+        """A study's raw values that map to the shared label of value"""
+        if column not in self.labels or not isinstance(value, str):
+            return [value]
+        label = self.shared(study, column, value)
+        matches = [raw for raw, shared in self.raw.get(study, {}).get(column, {}).items()
+                   if shared == label]
+        return matches or [value]
+
+    def report(self):
+        """{column: {shared label: {study: [raw spellings]}}} for labels spelled differently"""
+        report = {}
+        for column in HARMONIZED_COLUMNS:
+            merged = {}
+            for study, columns in self.raw.items():
+                for raw, label in columns.get(column, {}).items():
+                    merged.setdefault(label, {}).setdefault(study, []).append(raw)
+            differing = {label: studies for label, studies in merged.items()
+                         if any(raw != label for spellings in studies.values() for raw in spellings)}
+            if differing:
+                report[column] = differing
+        return report
+
+
+def translate_tree(tree, dictionary, study):
+    """Filter tree with harmonized values replaced by one study's spellings"""
+    if tree is None:
+        return None
+    for logical in ('and', 'or'):
+        if logical in tree:
+            return {logical: [translate_tree(child, dictionary, study) for child in tree[logical]]}
+    if 'not' in tree:
+        return {'not': translate_tree(tree['not'], dictionary, study)}
+
+    column, operator, value = tree['column'], tree['op'], tree['value']
+    if column not in HARMONIZED_COLUMNS or operator not in ('eq', 'ne', 'in', 'not_in'):
+        return tree
+    values = value if operator in ('in', 'not_in') else [value]
+    spellings = [raw for v in values for raw in dictionary.spellings(study, column, v)]
+    if operator in ('eq', 'in'):
+        return {'column': column, 'op': 'in', 'value': spellings}
+    return {'column': column, 'op': 'not_in', 'value': spellings}
+
+
+class PooledRelation:
+    """Relation over several studies, merging per-study partial aggregates"""
+
+    def __init__(self, parts, dictionary):
+        self.parts = parts
+        self.dictionary = dictionary
+
+    def _map(self, result, study):
+        """Per-study aggregate with harmonized index labels replaced by shared ones"""
+        names = list(result.index.names)
+        if not any(name in HARMONIZED_COLUMNS for name in names):
+            return result
+        arrays = []
+        for name in names:
+            values = result.index.get_level_values(name)
+            if name in HARMONIZED_COLUMNS:
+                values = [self.dictionary.shared(study, name, v) for v in values]
+            arrays.append(values)
+        if len(names) == 1:
+            index = pd.Index(arrays[0], name=names[0])
+        else:
+            index = pd.MultiIndex.from_arrays(arrays, names=names)
+        return result.set_axis(index)
+
+    def __len__(self):
+        return sum(len(relation) for _, relation in self.parts)
+
+    def levels(self, variable, order='appearance'):
+        if isinstance(order, list):
+            return order
+        levels = []
+        seen = set()
+        for study, relation in self.parts:
+            for level in relation.levels(variable, 'appearance'):
+                level = self.dictionary.shared(study, variable, level)
+                if level not in seen:
+                    seen.add(level)
+                    levels.append(level)
+        if order == 'sorted':
+            return sorted(level for level in levels if not pd.isna(level))
+        return levels
+
+    def aggregate(self, keys, measure, value=None):
+        partials = [self._map(relation.aggregate(keys, measure, value), study)
+                    for study, relation in self.parts]
+        if len(partials) == 1:
+            return partials[0]
+        partials = [p for p in partials if len(p)] or partials[:1]
+        combined = pd.concat(partials)
+        by = list(range(combined.index.nlevels))
+
+        if measure in ('subjects', 'records'):
+            return combined.groupby(level=by, sort=False).sum()
+
+        if measure == 'statistics':
+            combined = combined[combined['count'] > 0]
+            n = combined['count']
+            combined = combined.assign(
+                _sum=n * combined['mean'],
+                _m2=(combined['std'] ** 2 * (n - 1)).fillna(0.0),
+            )
+            grouped = combined.groupby(level=by, sort=False)
+            total = grouped['count'].sum()
+            mean = grouped['_sum'].sum() / total
+            spread = combined['_m2'] + n * (combined['mean'] - mean.reindex(combined.index).to_numpy()) ** 2
+            m2 = spread.groupby(level=by, sort=False).sum()
+            result = pd.DataFrame({
+                'count': total.astype('int64'),
+                'mean': mean,
+                'std': np.sqrt(m2 / (total - 1)).where(total > 1),
+                'min': grouped['min'].min(),
+                'max': grouped['max'].max(),
+            })
+            return result[STATISTICS]
+
+        raise ValueError(f"Unknown measure: {measure}")
+
+    def grade_counts(self, grading, test, unit, value, by=None):
+        """Sum of per-study worst-grade counts (a subject belongs to one study)
+
+        Each study is graded under its own spellings of the criteria's tests.
+        """
+        partials = []
+        for study, relation in self.parts:
+            spelled = grading.respelled(lambda name, study=study: self.dictionary.spellings(study, test, name))
+            partials.append(self._map(relation.grade_counts(spelled, test, unit, value, by), study))
+        partials = [p for p in partials if len(p)] or partials[:1]
+        if len(partials) == 1:
+            return partials[0]
+        combined = pd.concat(partials)
+        return combined.groupby(level=list(range(combined.index.nlevels)), sort=False).sum()
+
+    def _each(self, operation):
+        return PooledRelation([(study, operation(study, relation)) for study, relation in self.parts],
+                              self.dictionary)
+
+    def where(self, variable, equals=None, not_in=None):
+        def where(study, relation):
+            if variable not in HARMONIZED_COLUMNS:
+                return relation.where(variable, equals, not_in)
+            excluded = [raw for v in (not_in or []) for raw in self.dictionary.spellings(study, variable, v)]
+            if equals is None:
+                return relation.where(variable, not_in=excluded)
+            spellings = self.dictionary.spellings(study, variable, equals)
+            # where() takes one value; further spellings go through not_in of the rest
+            others = [raw for raw in self.dictionary.raw.get(study, {}).get(variable, {})
+                      if raw not in spellings]
+            if len(spellings) == 1:
+                return relation.where(variable, equals=spellings[0], not_in=excluded)
+            return relation.where(variable, not_in=others + excluded)
+        return self._each(where)
+
+    def stack(self, id_vars, variables, var_name, value_name):
+        return self._each(lambda study, relation: relation.stack(id_vars, variables, var_name, value_name))
+
+    def dropna(self, column):
+        return self._each(lambda study, relation: relation.dropna(column))
+
+    def with_subgroup(self, name, source, bins=None, labels=None):
+        return self._each(lambda study, relation: relation.with_subgroup(name, source, bins, labels))
+
+
+class PooledTableGenerator(TableGenerator):
+    """TableGenerator whose tables cover several registered studies at once
+
+    Every generate_* method works unchanged. Each study is loaded through the
+    study registry (sharing its frames and memory budget) on the configured
+    backend.
+    """
+
+    def __init__(self, studies, backend=None, cubes=None, synonyms=None):
+        if not studies:
+            raise ValueError("Pooled analysis needs at least one study")
+        self.studies = list(dict.fromkeys(studies))
+        self.synonyms = synonyms or {}
+        self.generators = {study: TableGenerator(backend=backend, cubes=cubes, study=study)
+                           for study in self.studies}
+        self.dictionary = SharedDictionary(synonyms)
+        for study, generator in self.generators.items():
+            for column, domains in HARMONIZED_COLUMNS.items():
+                for domain in domains:
+                    self.dictionary.add(study, column, generator.distinct_values(domain, column))
+
+    def result_key(self, table_type, filters=None):
+        """Result cache key over every pooled study's own key and the synonyms"""
+        return (
+            'pooled', json.dumps(self.synonyms, sort_keys=True), table_type,
+            tuple(generator.result_key(table_type, filters) for generator in self.generators.values()),
+        )
+
+    def manifest(self, kind, name, filters=None, options=None):
+        """Manifest over every pooled study's inputs, with the synonyms as an option"""
+        first = next(iter(self.generators.values()))
+        return result_store.build_manifest(
+            kind, name, filter_language.compile_filters(filters).tree,
+            dict(options or {}, studies=self.studies, synonyms=self.synonyms),
+            {study: result_store.input_hashes(generator.data_path, DATASETS)
+             for study, generator in self.generators.items()},
+            {'engine': first.backend, 'cubes': first.cubes is not None},
+        )
+
+    def _study_filters(self, filters, study):
+        compiled = filter_language.compile_filters(filters)
+        return filter_language.CompiledFilter(translate_tree(compiled.tree, self.dictionary, study))
+
+    def relation(self, plan, filters, extra_columns=()):
+        parts = [(study, generator.relation(plan, self._study_filters(filters, study), extra_columns))
+                 for study, generator in self.generators.items()]
+        return PooledRelation(parts, self.dictionary)
+
+    def population_counts(self, filters, subgroup=None):
+        pooled = {}
+        for study, generator in self.generators.items():
+            counts = generator.population_counts(self._study_filters(filters, study), subgroup)
+            by_level = counts.items() if subgroup is not None else [(None, counts)]
+            for level, arms in by_level:
+                target = pooled.setdefault(level, {}) if subgroup is not None else pooled
+                for arm, n in arms.items():
+                    arm = self.dictionary.shared(study, ARM_VAR, arm)
+                    target[arm] = target.get(arm, 0) + int(n)
+        return pooled
+
+    def subject_set(self, query):
+        raise ValueError("Subject queries run against a single study")
+
+    def _result_to_dict(self, result):
+        result.subtitle = f"{result.subtitle} - Pooled: {', '.join(self.studies)}"
+        output = super()._result_to_dict(result)
+        output['studies'] = self.studies
+        return output
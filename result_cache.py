@@ -0,0 +1,129 @@
+"""
+Table result cache
+
+Rendered table payloads (the dicts returned by TableGenerator.generate_table)
+kept in memory, least recently used first out. Keys include the data
+signature (mtime and size of every dataset file), so results for changed
+data are never returned; stale entries simply age out.
+
+Misses are single-flight: when several requests ask for the same missing
+key at once (a room of reviewers opening the same table), one computes it
+and the others wait for and share that result, or its exception.
+"""
+
+import os
+import threading
+from collections import OrderedDict
+
+RESULT_CACHE_SIZE = int(os.environ.get('RESULT_CACHE_SIZE', '512'))
+
+_CACHE = None
+_CACHE_LOCK = threading.Lock()
+
+
+class _Flight:
+    """One in-progress computation that concurrent callers wait on"""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.value = None
+        self.error = None
+
+
+class ResultCache:
+    """Thread-safe LRU mapping of result keys to table payloads"""
+
+    def __init__(self, max_entries=RESULT_CACHE_SIZE):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._flights = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+
+    def get(self, key):
+        with self._lock:
+            value = self._entries.get(key)
+            if value is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def get_or_compute(self, key, compute):
+        """Cached value for key, else compute() run once for all concurrent callers"""
+        with self._lock:
+            value = self._entries.get(key)
+            if value is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return value
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = _Flight()
+                self.misses += 1
+            else:
+                self.coalesced += 1
+
+        if not leader:
+            flight.done.wait()
+            if isinstance(flight.error, Exception):
+                raise flight.error
+            if flight.error is not None:
+                # The leader was interrupted (KeyboardInterrupt, SystemExit):
+                # fail this request rather than interrupting its thread too
+                raise RuntimeError(f"Computation of {key!r} was interrupted") from flight.error
+            return flight.value
+
+        try:
+            flight.value = compute()
+            self.put(key, flight.value)
+            return flight.value
+        except BaseException as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._flights[key]
+            flight.done.set()
+
+    def in_flight(self):
+        with self._lock:
+            return len(self._flights)
+
+    def put(self, key, value):
+        if self.max_entries <= 0:
+            return
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def __contains__(self, key):
+        with self._lock:
+            return key in self._entries
+
+    def __len__(self):
+        return len(self._entries)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        return {'entries': len(self._entries), 'max_entries': self.max_entries,
+                'hits': self.hits, 'misses': self.misses, 'coalesced': self.coalesced,
+                'in_flight': self.in_flight()}
+
+
+def get_cache():
+    """Process-wide result cache (created on first use)"""
+    global _CACHE
+    with _CACHE_LOCK:
+        if _CACHE is None:
+            _CACHE = ResultCache()
+        return _CACHE
@@ -0,0 +1,201 @@
+"""
+Result manifests and the persistent result store
+
+Every generated table, subgroup matrix and figure carries a manifest:
+
+- SHA-256 of each input dataset file of every study involved,
+- the normalized filter expression and any options,
+- the code version (a hash of the modules, table specs and configuration
+  files such as the lab grading thresholds that shape the output) and the
+  Python/pandas/numpy versions,
+- the backend that computed it,
+- ``result_sha256``, a hash of the result content itself.
+
+The hash of everything except the result hash and the timestamp is the
+manifest ``key``. Results are stored on disk under that key
+(``RESULT_STORE``, default ``.results/``; set it empty to disable). An
+identical request, after a restart or from another worker process, is then
+read back instead of recomputed. Files are written to a temporary name and
+renamed into place, so concurrent workers never read a partial result.
+"""
+
+import glob
+import hashlib
+import json
+import os
+import platform
+import tempfile
+import threading
+from datetime import datetime, timezone
+
+import numpy as np
+import pandas as pd
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+RESULT_STORE_DIR = os.environ.get('RESULT_STORE', os.path.join(BASE_DIR, '.results'))
+
+# Bumped when the layout of stored results changes
+FORMAT_VERSION = 1
+
+# Sources whose content determines the output for a given input
+CODE_FILES = (
+    'table_engine.py', 'table_generator.py', 'filter_language.py', 'analysis_cube.py',
+    'sql_backend.py', 'subgroup_analysis.py', 'pooled_analysis.py', 'figure_data.py',
+    'dataset_schema.py', 'subject_sets.py', 'lab_grading.py',
+)
+SPEC_PATTERN = os.path.join('table_specs', '*.json')
+# Configuration files that shape results: environment variable -> default file
+CONFIG_FILES = {'LAB_GRADES': 'lab_grades.json'}
+
+_FILE_HASHES = {}
+_CODE_VERSION = None
+_STORE = None
+_STORE_LOCK = threading.Lock()
+
+
+def canonical_json(value):
+    return json.dumps(value, sort_keys=True, separators=(',', ':'), default=str)
+
+
+def content_hash(result):
+    """SHA-256 of a result payload, excluding its manifest"""
+    content = {k: v for k, v in result.items() if k != 'manifest'}
+    return hashlib.sha256(canonical_json(content).encode()).hexdigest()
+
+
+def file_sha256(path):
+    """SHA-256 of a file, memoized until its mtime or size changes"""
+    stat = os.stat(path)
+    memo_key = (os.path.abspath(path), stat.st_mtime, stat.st_size)
+    digest = _FILE_HASHES.get(memo_key)
+    if digest is None:
+        sha = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for block in iter(lambda: f.read(1 << 20), b''):
+                sha.update(block)
+        digest = sha.hexdigest()
+        _FILE_HASHES[memo_key] = digest
+    return digest
+
+
+def input_hashes(data_path, datasets):
+    """{dataset: {'file', 'bytes', 'sha256'}} for every dataset file present"""
+    inputs = {}
+    for name, filename in datasets.items():
+        path = os.path.join(data_path, filename)
+        if os.path.exists(path):
+            inputs[name] = {'file': filename, 'bytes': os.path.getsize(path), 'sha256': file_sha256(path)}
+    return inputs
+
+
+def code_version():
+    """Hash of the modules and table specs that shape results (computed once)"""
+    global _CODE_VERSION
+    if _CODE_VERSION is None:
+        sha = hashlib.sha256()
+        paths = [os.path.join(BASE_DIR, name) for name in CODE_FILES]
+        paths += sorted(glob.glob(os.path.join(BASE_DIR, SPEC_PATTERN)))
+        paths += [os.environ.get(variable, os.path.join(BASE_DIR, name))
+                  for variable, name in CONFIG_FILES.items()]
+        for path in paths:
+            if os.path.exists(path):
+                sha.update(os.path.relpath(path, BASE_DIR).encode())
+                with open(path, 'rb') as f:
+                    sha.update(f.read())
+        _CODE_VERSION = sha.hexdigest()[:16]
+    return _CODE_VERSION
+
+
+def build_manifest(kind, name, filters, options, inputs, backend):
+    """Manifest of one request; 'key' identifies its result across processes"""
+    manifest = {
+        'format_version': FORMAT_VERSION,
+        'kind': kind,
+        'name': name,
+        'filters': filters,
+        'options': options or {},
+        'inputs': inputs,
+        'backend': backend,
+        'code_version': code_version(),
+        'environment': {
+            'python': platform.python_version(),
+            'pandas': pd.__version__,
+            'numpy': np.__version__,
+        },
+    }
+    manifest['key'] = hashlib.sha256(canonical_json(manifest).encode()).hexdigest()
+    return manifest
+
+
+class ResultStore:
+    """Results on disk, one JSON file per manifest key"""
+
+    def __init__(self, directory=RESULT_STORE_DIR):
+        self.directory = directory
+        self.hits = 0
+        self.misses = 0
+        self.writes = 0
+
+    @property
+    def enabled(self):
+        return bool(self.directory)
+
+    def path(self, key):
+        return os.path.join(self.directory, key[:2], f'{key}.json')
+
+    def get(self, key):
+        """Stored result for key, or None (also when missing or corrupt)"""
+        if not self.enabled:
+            return None
+        path = self.path(key)
+        try:
+            with open(path) as f:
+                result = json.load(f)
+        except FileNotFoundError:
+            self.misses += 1
+            return None
+        except (OSError, ValueError) as e:
+            print(f"Ignoring unreadable stored result {path}: {e}")
+            self.misses += 1
+            return None
+        manifest = result.get('manifest', {})
+        if manifest.get('key') != key or manifest.get('result_sha256') != content_hash(result):
+            print(f"Ignoring stored result {path}: content does not match its manifest")
+            self.misses += 1
+            return None
+        self.hits += 1
+        return result
+
+    def put(self, key, result):
+        if not self.enabled:
+            return
+        path = self.path(key)
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+            with os.fdopen(fd, 'w') as f:
+                json.dump(result, f, sort_keys=True)
+            os.replace(temp_path, path)
+            self.writes += 1
+        except OSError as e:
+            print(f"Could not store result {key}: {e}")
+
+    def stats(self):
+        return {'directory': self.directory, 'enabled': self.enabled,
+                'hits': self.hits, 'misses': self.misses, 'writes': self.writes}
+
+
+def stamp(manifest, result):
+    """Complete a manifest with the result hash and generation time"""
+    manifest['result_sha256'] = content_hash(result)
+    manifest['generated_at'] = datetime.now(timezone.utc).isoformat(timespec='seconds')
+    return manifest
+
+
+def get_store():
+    """Process-wide result store (created on first use)"""
+    global _STORE
+    with _STORE_LOCK:
+        if _STORE is None:
+            _STORE = ResultStore()
+        return _STORE
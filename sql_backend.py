@@ -0,0 +1,434 @@
+"""
+Embedded SQL backend for table computation
+
+Registers the study CSVs in an embedded analytical database and pushes the
+filters and per-table aggregations of ``table_engine`` down as SQL, so only
+summary rows come back into Python. SQLite (standard library) is always
+available; DuckDB is used when installed and selected, giving multi-threaded
+columnar scans.
+
+Select with ``TABLE_BACKEND=sqlite`` / ``TABLE_BACKEND=duckdb`` or
+``TableGenerator(backend='sqlite')``.
+
+One store (and connection) is kept per data directory and engine
+(``get_store``), shared by the threads of a process under a lock. A domain
+is imported in a single transaction that re-checks staleness once it holds
+the database's write lock, so concurrent workers never import it twice.
+"""
+
+import math
+import os
+import sqlite3
+import threading
+
+import pandas as pd
+
+import analysis_cube
+import filter_language
+import lab_grading
+from table_engine import ARM_VAR, SUBJECT_VAR, STATISTICS
+
+try:
+    import duckdb
+except ImportError:  # optional dependency
+    duckdb = None
+
+SQL_BACKENDS = ('sqlite', 'duckdb')
+
+# Columns indexed when present in a domain (SQLite only; DuckDB uses zone maps)
+INDEX_COLUMNS = ('SUBJID', 'TRT', 'VISIT', 'LBTEST')
+
+# Rows per chunk when importing CSVs, so the import never holds a full domain
+IMPORT_CHUNKSIZE = 100_000
+
+STDDEV_FUNCTION = {'sqlite': 'stdev', 'duckdb': 'stddev_samp'}
+
+# Imported CSV versions (mtime and size) per domain
+SOURCES_COLUMNS = 'name TEXT PRIMARY KEY, mtime DOUBLE, size BIGINT'
+
+# Seconds a SQLite connection waits for another process's import to commit
+IMPORT_TIMEOUT = float(os.environ.get('SQL_IMPORT_TIMEOUT', '300'))
+
+# (data directory, engine) -> (data signature, SQLStore)
+_STORES = {}
+_STORES_LOCK = threading.Lock()
+
+
+class _SampleStdev:
+    """Welford sample standard deviation aggregate for SQLite"""
+
+    def __init__(self):
+        self.n = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+
+    def step(self, value):
+        if value is None:
+            return
+        self.n += 1
+        delta = value - self.mean
+        self.mean += delta / self.n
+        self.m2 += delta * (value - self.mean)
+
+    def finalize(self):
+        if self.n < 2:
+            return None
+        return math.sqrt(self.m2 / (self.n - 1))
+
+
+def _source_signature(path):
+    stat = os.stat(path)
+    return [stat.st_mtime, stat.st_size]
+
+
+def _quote(identifier):
+    return '"' + identifier.replace('"', '""') + '"'
+
+
+SQL_COMPARISONS = {'eq': '=', 'lt': '<', 'le': '<=', 'gt': '>', 'ge': '>='}
+
+
+def expression_to_sql(tree):
+    """Translate a pruned filter_language expression tree into (clause, params)
+
+    Missing values follow filter_language: SQL's unknown (NULL) comparisons
+    count as false, and ne, not_in and not match rows with missing values.
+    """
+    for logical in ('and', 'or'):
+        if logical in tree:
+            parts = [expression_to_sql(child) for child in tree[logical]]
+            clause = f" {logical.upper()} ".join(f"({part})" for part, _ in parts)
+            return clause, [param for _, part_params in parts for param in part_params]
+    if 'not' in tree:
+        clause, params = expression_to_sql(tree['not'])
+        return f"NOT COALESCE(({clause}), FALSE)", params
+
+    column, operator, value = _quote(tree['column']), tree['op'], tree['value']
+    if operator in ('in', 'not_in'):
+        placeholders = ', '.join('?' * len(value))
+        if operator == 'in':
+            return f"{column} IN ({placeholders})", list(value)
+        return f"({column} NOT IN ({placeholders}) OR {column} IS NULL)", list(value)
+    if operator == 'between':
+        return f"{column} BETWEEN ? AND ?", list(value)
+    if operator == 'ne':
+        return f"({column} <> ? OR {column} IS NULL)", [value]
+    return f"{column} {SQL_COMPARISONS[operator]} ?", [value]
+
+
+def filters_to_sql(filters, columns):
+    """WHERE clause for an API filter dict over a relation with the given columns
+
+    Leaves on absent columns are pruned, as in filter_language. Returns
+    (clause, params); clause is '' when nothing applies.
+    """
+    tree = filter_language.compile_filters(filters).bind(columns)
+    if tree is None:
+        return '', []
+    return expression_to_sql(tree)
+
+
+def band_case(source, bins, labels):
+    """CASE expression assigning left-closed interval labels (see table_engine.band_values)"""
+    whens = []
+    params = []
+    for low, high, label in zip(bins[:-1], bins[1:], labels):
+        conditions = []
+        if not math.isinf(low):
+            conditions.append(f"{_quote(source)} >= ?")
+            params.append(low)
+        if not math.isinf(high):
+            conditions.append(f"{_quote(source)} < ?")
+            params.append(high)
+        whens.append(f"WHEN {' AND '.join(conditions) or '1 = 1'} THEN ?")
+        params.append(label)
+    return f"CASE {' '.join(whens)} END", params
+
+
+class SQLRelation:
+    """Relation backed by a SQL subquery; each operation wraps the query"""
+
+    def __init__(self, store, sql, params, columns):
+        self.store = store
+        self.sql = sql
+        self.params = list(params)
+        self.columns = list(columns)
+
+    def _derive(self, sql, params, columns=None):
+        return SQLRelation(self.store, sql, params, columns or self.columns)
+
+    def __len__(self):
+        return self.store.fetchall(f"SELECT COUNT(*) FROM ({self.sql}) t", self.params)[0][0]
+
+    def levels(self, variable, order='appearance'):
+        if isinstance(order, list):
+            return order
+        rows = self.store.fetchall(
+            f"SELECT {_quote(variable)} FROM ({self.sql}) t "
+            f"GROUP BY {_quote(variable)} ORDER BY MIN(_row)",
+            self.params
+        )
+        levels = [row[0] for row in rows]
+        if order == 'sorted':
+            return sorted(level for level in levels if level is not None)
+        return levels
+
+    def aggregate(self, keys, measure, value=None):
+        key_list = ', '.join(_quote(k) for k in keys)
+        not_null = ' AND '.join(f"{_quote(k)} IS NOT NULL" for k in keys)
+
+        if measure == 'subjects':
+            select = f"COUNT(DISTINCT {_quote(SUBJECT_VAR)}) AS n"
+        elif measure == 'records':
+            select = "COUNT(*) AS n"
+        elif measure == 'statistics':
+            v = _quote(value)
+            stddev = STDDEV_FUNCTION[self.store.engine]
+            select = (f"COUNT({v}) AS count, AVG({v}) AS mean, {stddev}({v}) AS std, "
+                      f"MIN({v}) AS min, MAX({v}) AS max")
+        else:
+            raise ValueError(f"Unknown measure: {measure}")
+
+        result = self.store.query(
+            f"SELECT {key_list}, {select} FROM ({self.sql}) t "
+            f"WHERE {not_null} GROUP BY {key_list} ORDER BY MIN(_row)",
+            self.params
+        ).set_index(keys)
+
+        if measure == 'statistics':
+            return result[STATISTICS].astype({'count': 'int64', 'mean': 'float64', 'std': 'float64'})
+        return result['n'].astype('int64')
+
+    def where(self, variable, equals=None, not_in=None):
+        clauses = []
+        params = list(self.params)
+        if equals is not None:
+            clauses.append(f"{_quote(variable)} = ?")
+            params.append(equals)
+        if not_in:
+            clauses.append(f"{_quote(variable)} NOT IN ({', '.join('?' * len(not_in))})")
+            params.extend(not_in)
+        if not clauses:
+            return self
+        return self._derive(f"SELECT * FROM ({self.sql}) t WHERE {' AND '.join(clauses)}", params)
+
+    def stack(self, id_vars, variables, var_name, value_name):
+        id_list = ', '.join(['_row'] + [_quote(c) for c in id_vars])
+        branches = [
+            f"SELECT {id_list}, ? AS {_quote(var_name)}, {_quote(v)} AS {_quote(value_name)} "
+            f"FROM ({self.sql}) t"
+            for v in variables
+        ]
+        params = []
+        for v in variables:
+            params += [v] + self.params
+        return self._derive(' UNION ALL '.join(branches), params,
+                            ['_row'] + list(id_vars) + [var_name, value_name])
+
+    def dropna(self, column):
+        return self._derive(
+            f"SELECT * FROM ({self.sql}) t WHERE {_quote(column)} IS NOT NULL", self.params
+        )
+
+    def with_subgroup(self, name, source, bins=None, labels=None):
+        if bins is None:
+            expression, expression_params = _quote(source), []
+        else:
+            expression, expression_params = band_case(source, bins, labels)
+        return self._derive(f"SELECT t.*, {expression} AS {_quote(name)} FROM ({self.sql}) t",
+                            expression_params + self.params, self.columns + [name])
+
+    def grade_counts(self, grading, test, unit, value, by=None):
+        """Worst-grade counts; the graded columns are fetched once and graded in numpy"""
+        columns = [c for c in (SUBJECT_VAR, ARM_VAR, test, unit, value, by) if c]
+        records = self.store.query(
+            f"SELECT {', '.join(_quote(c) for c in columns)} FROM ({self.sql}) t", self.params
+        )
+        return lab_grading.worst_grade_counts(
+            grading, records[SUBJECT_VAR], records[ARM_VAR], records[test],
+            records[unit] if unit else None, records[value], records[by] if by else None,
+        )
+
+
+class SQLStore:
+    """Study datasets registered in an embedded SQLite or DuckDB database"""
+
+    def __init__(self, data_path, datasets, engine='sqlite', database=None):
+        if engine not in SQL_BACKENDS:
+            raise ValueError(f"Unknown SQL backend: {engine}")
+        if engine == 'duckdb' and duckdb is None:
+            raise ImportError("The duckdb backend requires the 'duckdb' package")
+
+        self.data_path = data_path
+        self.datasets = datasets
+        self.engine = engine
+        self.database = database or os.path.join(data_path, f'study.{engine}')
+
+        if engine == 'duckdb':
+            self.conn = duckdb.connect(self.database)
+        else:
+            # Shared by the threads of a process; self.lock serializes its use
+            self.conn = sqlite3.connect(self.database, timeout=IMPORT_TIMEOUT,
+                                        check_same_thread=False)
+            self.conn.create_aggregate('stdev', 1, _SampleStdev)
+        self.lock = threading.Lock()
+
+        self.columns = {}
+        self.refresh()
+
+    def fetchall(self, sql, params=()):
+        with self.lock:
+            return self.conn.execute(sql, list(params)).fetchall()
+
+    def query(self, sql, params=()):
+        with self.lock:
+            cursor = self.conn.execute(sql, list(params))
+            columns = [d[0] for d in cursor.description]
+            rows = cursor.fetchall()
+        return pd.DataFrame(rows, columns=columns)
+
+    def _table_columns(self, name):
+        cursor = self.conn.execute(f"SELECT * FROM {_quote(name)} LIMIT 0")
+        return [d[0] for d in cursor.description]
+
+    def _is_stale(self, name, csv_path):
+        """True if the table is missing or was imported from another version of its CSV
+
+        Any change of mtime or size counts, so a CSV restored with an older
+        mtime (cp -p, git checkout) is imported again.
+        """
+        row = self.conn.execute("SELECT mtime, size FROM _sources WHERE name = ?", [name]).fetchall()
+        return not row or list(row[0]) != _source_signature(csv_path)
+
+    def _import(self, name, csv_path):
+        """Replace a domain's table with its CSV, in the open transaction"""
+        table = _quote(name)
+        self.conn.execute(f"DROP TABLE IF EXISTS {table}")
+
+        if self.engine == 'duckdb':
+            self.conn.execute(f"CREATE TABLE {table} AS SELECT * FROM read_csv_auto(?)", [csv_path])
+        else:
+            # Rows are inserted here rather than with DataFrame.to_sql, which
+            # commits after every chunk and would end the transaction
+            insert = None
+            for chunk in pd.read_csv(csv_path, chunksize=IMPORT_CHUNKSIZE):
+                if insert is None:
+                    self.conn.execute(pd.io.sql.get_schema(chunk, name))
+                    insert = (f"INSERT INTO {table} VALUES "
+                              f"({', '.join('?' * len(chunk.columns))})")
+                rows = chunk.astype(object).where(chunk.notna(), None)
+                self.conn.executemany(insert, rows.itertuples(index=False, name=None))
+            for column in INDEX_COLUMNS:
+                if column in self._table_columns(name):
+                    self.conn.execute(
+                        f"CREATE INDEX IF NOT EXISTS {_quote(f'ix_{name}_{column}')} "
+                        f"ON {table} ({_quote(column)})"
+                    )
+
+        self.conn.execute("DELETE FROM _sources WHERE name = ?", [name])
+        self.conn.execute("INSERT INTO _sources VALUES (?, ?, ?)", [name] + _source_signature(csv_path))
+
+    def refresh(self):
+        """(Re)import any domain whose CSV changed since it was registered
+
+        Runs as one write transaction (SQLite: BEGIN IMMEDIATE, which waits
+        for another process's import to commit), so readers never see a
+        half-imported table and a domain imported meanwhile is not redone.
+        """
+        with self.lock:
+            self.conn.execute("BEGIN IMMEDIATE" if self.engine == 'sqlite' else "BEGIN TRANSACTION")
+            try:
+                self.conn.execute(f"CREATE TABLE IF NOT EXISTS _sources ({SOURCES_COLUMNS})")
+                if 'size' not in self._table_columns('_sources'):
+                    # Recorded before sizes were: import every domain again
+                    self.conn.execute("DROP TABLE _sources")
+                    self.conn.execute(f"CREATE TABLE _sources ({SOURCES_COLUMNS})")
+                for name, filename in self.datasets.items():
+                    csv_path = os.path.join(self.data_path, filename)
+                    if not os.path.exists(csv_path):
+                        print(f"Dataset file not found: {csv_path}")
+                        continue
+                    if self._is_stale(name, csv_path):
+                        self._import(name, csv_path)
+                    self.columns[name] = self._table_columns(name)
+            except BaseException:
+                self.conn.rollback()
+                raise
+            self.conn.commit()
+
+    def distinct_values(self, domain, column):
+        """Non-null distinct values of a column, in first-appearance order"""
+        if column not in self.columns.get(domain, []):
+            return []
+        rows = self.fetchall(
+            f"SELECT {_quote(column)} FROM {_quote(domain)} WHERE {_quote(column)} IS NOT NULL "
+            f"GROUP BY {_quote(column)} ORDER BY MIN(rowid)"
+        )
+        return [row[0] for row in rows]
+
+    def relation(self, plan, filters, extra_columns=()):
+        """Filtered, projected relation for a query plan"""
+        domain_columns = self.columns[plan.domain]
+        wanted = plan.wanted_columns(filter_language.compile_filters(filters), extra_columns)
+        selected = [c for c in wanted if c in domain_columns]
+        select = ['d.rowid AS _row'] + [f"d.{_quote(c)}" for c in selected]
+        source = f"{_quote(plan.domain)} d"
+
+        demo_columns = [c for c in wanted
+                        if c not in domain_columns and c in self.columns['demographics']]
+        if demo_columns and plan.domain != 'demographics':
+            select += [f"dm.{_quote(c)}" for c in demo_columns]
+            source += (f" LEFT JOIN demographics dm "
+                       f"ON dm.{_quote(SUBJECT_VAR)} = d.{_quote(SUBJECT_VAR)}")
+
+        columns = selected + demo_columns
+        sql = f"SELECT {', '.join(select)} FROM {source}"
+        where, params = filters_to_sql(filters, columns)
+        if where:
+            sql = f"SELECT * FROM ({sql}) t WHERE {where}"
+        return SQLRelation(self, sql, params, ['_row'] + columns)
+
+    def population_counts(self, filters, subgroup=None):
+        """Subjects per treatment arm in the filtered demographics
+
+        With a subgroup definition returns {subgroup level: {arm: n}}.
+        """
+        where, params = filters_to_sql(filters, self.columns['demographics'])
+        where = f" WHERE {where}" if where else ''
+        arm = _quote(ARM_VAR)
+
+        if subgroup is None:
+            sql = f"SELECT {arm}, COUNT(*) FROM demographics{where} GROUP BY {arm} ORDER BY {arm}"
+            return {arm: n for arm, n in self.fetchall(sql, params)}
+
+        if 'bins' in subgroup:
+            level, level_params = band_case(subgroup['variable'], subgroup['bins'], subgroup['labels'])
+        else:
+            level, level_params = _quote(subgroup['variable']), []
+        sql = (f"SELECT _level, {arm}, COUNT(*) FROM "
+               f"(SELECT {level} AS _level, {arm} FROM demographics{where}) t "
+               f"WHERE _level IS NOT NULL GROUP BY _level, {arm} ORDER BY _level, {arm}")
+        counts = {}
+        for level_value, arm_value, n in self.fetchall(sql, level_params + params):
+            counts.setdefault(level_value, {})[arm_value] = n
+        return counts
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
+
+
+def get_store(data_path, datasets, engine='sqlite'):
+    """Shared SQLStore for a data directory, refreshed only when the data changes"""
+    key = (os.path.abspath(data_path), engine)
+    signature = analysis_cube.data_signature(data_path, datasets)
+    with _STORES_LOCK:
+        cached = _STORES.get(key)
+        if cached is None:
+            cached = (signature, SQLStore(data_path, datasets, engine=engine))
+        elif cached[0] != signature:
+            cached[1].refresh()
+            cached = (signature, cached[1])
+        _STORES[key] = cached
+        return cached[1]
+
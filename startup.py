@@ -0,0 +1,108 @@
+"""
+Startup, background warm-up and readiness
+
+The web app imports only Flask at module load. Everything heavy (pandas,
+table specs, the default study's datasets, cubes or the SQL store) is
+loaded by a background warm-up thread once the server is starting, so the
+socket opens right away. ``/api/ready`` reports 503 until warm-up
+finishes, then 200 with timings: module import, each warm-up phase and the
+time to the first served request.
+
+Once ready, the warm-up scheduler takes over and keeps the default table
+set precomputed whenever the data changes.
+
+Set ``WARMUP=0`` to skip the background warm-up; the first request then
+loads what it needs.
+"""
+
+import os
+import threading
+import time
+
+# Reference point for startup timings (this module is imported first by app.py)
+STARTED_AT = time.perf_counter()
+
+WARMUP_ENABLED = os.environ.get('WARMUP', '1') not in ('', '0')
+
+
+class Readiness:
+    """Warm-up state machine: cold -> warming -> ready (or failed)"""
+
+    def __init__(self):
+        self.state = 'cold'
+        self.error = None
+        self.timings = {}
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def _mark(self, name, since):
+        now = time.perf_counter()
+        self.timings[name] = round(now - since, 4)
+        return now
+
+    def start(self):
+        """Start the warm-up thread (once); returns immediately"""
+        with self._lock:
+            if self._thread is not None or self.state == 'ready':
+                return
+            if not WARMUP_ENABLED:
+                self.state = 'ready'
+                return
+            self.state = 'warming'
+            self._thread = threading.Thread(target=self._warm, name='warmup', daemon=True)
+            self._thread.start()
+
+    def wait(self, timeout=None):
+        if self._thread is not None:
+            self._thread.join(timeout)
+        return self.state == 'ready'
+
+    def _warm(self):
+        try:
+            phase = time.perf_counter()
+            import table_engine
+            from table_generator import DATASETS, TableGenerator
+            phase = self._mark('imports', phase)
+
+            generator = TableGenerator()
+            missing = [f for f in DATASETS.values()
+                       if not os.path.exists(os.path.join(generator.data_path, f))]
+            if missing:
+                raise FileNotFoundError(
+                    f"Missing datasets {missing} in {generator.data_path}; "
+                    "run `python data_generator.py` to create sample data"
+                )
+            phase = self._mark('datasets', phase)
+
+            # One cheap table exercises the filter compiler and executors
+            generator.generate_table(next(iter(table_engine.PLANS)), {})
+            self._mark('first_table', phase)
+
+            self.timings['ready'] = round(time.perf_counter() - STARTED_AT, 4)
+            self.state = 'ready'
+
+            # Keep the default table set warm from here on (see warmup_scheduler)
+            import warmup_scheduler
+            warmup_scheduler.get_scheduler().start()
+        except Exception as e:
+            self.error = str(e)
+            self.state = 'failed'
+            print(f"Warm-up failed: {e}")
+
+    def record_import(self):
+        """Remember how long importing the web app took"""
+        self.timings['app_import'] = round(time.perf_counter() - STARTED_AT, 4)
+
+    def record_request(self):
+        """Remember when the first request was served"""
+        if 'first_request' not in self.timings:
+            self.timings['first_request'] = round(time.perf_counter() - STARTED_AT, 4)
+
+    def report(self):
+        report = {'status': self.state, 'timings': dict(self.timings)}
+        if self.error:
+            report['error'] = self.error
+        return report
+
+
+readiness = Readiness()
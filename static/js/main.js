@@ -6,7 +6,8 @@ document.addEventListener('DOMContentLoaded', function() {
 });
 
 async function initializeApp() {
-    // Load available table types
+    // Load available studies and table types
+    await loadStudies();
     await loadTableTypes();
     
     // Set up event listeners
@@ -36,6 +37,25 @@ async function loadTableTypes() {
     }
 }
 
+async function loadStudies() {
+    try {
+        const response = await fetch('/api/studies');
+        const registry = await response.json();
+        
+        const studySelect = document.getElementById('studySelect');
+        studySelect.innerHTML = '';
+        
+        for (const study of registry.studies) {
+            const option = document.createElement('option');
+            option.value = study.study;
+            option.textContent = study.study;
+            studySelect.appendChild(option);
+        }
+    } catch (error) {
+        console.error('Error loading studies:', error);
+    }
+}
+
 function setupEventListeners() {
     // Generate table button
     document.getElementById('generateTable').addEventListener('click', generateTable);
@@ -83,6 +103,7 @@ async function generateTable() {
             },
             body: JSON.stringify({
                 table_type: tableType,
+                study: document.getElementById('studySelect').value,
                 filters: filters
             })
         });
@@ -103,6 +124,9 @@ async function generateTable() {
         // Show export options
         document.getElementById('exportOptions').style.display = 'flex';
         
+        // Keep the table current while it stays open
+        startLiveUpdates(tableType, document.getElementById('studySelect').value, filters, result);
+        
     } catch (error) {
         console.error('Error generating table:', error);
         showError(`Failed to generate table: ${error.message}`);
@@ -128,6 +152,20 @@ function collectFilters() {
         filters.sex = selectedGenders;
     }
     
+    // Race filter
+    const raceFilter = document.getElementById('raceFilter');
+    const selectedRaces = Array.from(raceFilter.selectedOptions).map(option => option.value);
+    if (selectedRaces.length > 0) {
+        filters.race = selectedRaces;
+    }
+    
+    // Country filter
+    const countryFilter = document.getElementById('countryFilter');
+    const selectedCountries = Array.from(countryFilter.selectedOptions).map(option => option.value);
+    if (selectedCountries.length > 0) {
+        filters.country = selectedCountries;
+    }
+    
     // Age range filter
     const ageMin = document.getElementById('ageMinFilter').value;
     const ageMax = document.getElementById('ageMaxFilter').value;
@@ -146,6 +184,8 @@ function collectFilters() {
 function clearFilters() {
     document.getElementById('treatmentFilter').selectedIndex = -1;
     document.getElementById('genderFilter').selectedIndex = -1;
+    document.getElementById('raceFilter').selectedIndex = -1;
+    document.getElementById('countryFilter').selectedIndex = -1;
     document.getElementById('ageMinFilter').value = '';
     document.getElementById('ageMaxFilter').value = '';
     
@@ -206,7 +246,123 @@ function displayTable(result) {
     window.currentTableData = result;
 }
 
+// Live refresh: the server pushes changed rows and cells when the data changes
+let liveSource = null;
+
+function startLiveUpdates(tableType, study, filters, result) {
+    stopLiveUpdates();
+    if (!window.EventSource) {
+        return;
+    }
+    
+    const params = new URLSearchParams({
+        table_type: tableType,
+        study: study,
+        filters: JSON.stringify(filters),
+        since: result.manifest ? result.manifest.key : ''
+    });
+    liveSource = new EventSource(`/api/live?${params}`);
+    liveSource.addEventListener('table', event => applyTableUpdate(JSON.parse(event.data)));
+    liveSource.addEventListener('refresh_error', event => {
+        console.error('Live refresh failed:', JSON.parse(event.data).error);
+    });
+    liveSource.addEventListener('reload', () => {
+        stopLiveUpdates();
+        generateTable();
+    });
+}
+
+function stopLiveUpdates() {
+    if (liveSource) {
+        liveSource.close();
+        liveSource = null;
+    }
+}
+
+function applyTableUpdate(update) {
+    const current = window.currentTableData;
+    if (!current) {
+        return;
+    }
+    
+    if (update.full) {
+        Object.assign(current, update.full);
+        for (const field of ['summary', 'total_subjects', 'title', 'subtitle']) {
+            if (field in update) {
+                current[field] = update[field];
+            }
+        }
+        displayTable(current);
+        showMessage('Table refreshed with new data', 'info');
+        return;
+    }
+    
+    const keyOf = key => JSON.stringify(key);
+    const records = new Map(current.data.map(record => [
+        keyOf(update.key_columns.map(column => record[column])), record
+    ]));
+    (update.removed || []).forEach(key => records.delete(keyOf(key)));
+    (update.added || []).forEach(change => records.set(keyOf(change.key), change.record));
+    
+    const container = document.querySelector('#tableContainer .table-container');
+    const tbody = container.querySelector('tbody');
+    const changedCells = [];
+    
+    if (update.order) {
+        // Rows added, removed or re-sorted: rebuild the body from the records
+        (update.updated || []).forEach(change => Object.assign(records.get(keyOf(change.key)), change.cells));
+        current.data = update.order.map(key => records.get(keyOf(key)));
+        tbody.innerHTML = current.data.map(record =>
+            '<tr>' + current.columns.map(column => `<td>${record[column] ?? ''}</td>`).join('') + '</tr>'
+        ).join('');
+    } else {
+        // Same rows in the same order: patch only the changed cells
+        (update.updated || []).forEach(change => {
+            const record = records.get(keyOf(change.key));
+            Object.assign(record, change.cells);
+            const row = tbody.rows[current.data.indexOf(record)];
+            for (const [column, value] of Object.entries(change.cells)) {
+                const index = current.columns.indexOf(column);
+                if (row && index >= 0) {
+                    row.cells[index].textContent = value ?? '';
+                    changedCells.push(row.cells[index]);
+                }
+            }
+        });
+    }
+    
+    if ('title' in update) {
+        container.querySelector('.table-title').textContent = update.title;
+    }
+    if ('subtitle' in update) {
+        container.querySelector('.table-subtitle').textContent = update.subtitle;
+    }
+    current.table_html = container.outerHTML;
+    
+    if ('summary' in update) {
+        current.summary = update.summary;
+        const summary = document.querySelector('#tableContainer .summary-info span');
+        if (summary) {
+            summary.textContent = update.summary;
+        }
+    }
+    if ('total_subjects' in update) {
+        current.total_subjects = update.total_subjects;
+        const population = document.querySelector('#tableContainer .metadata ul');
+        if (population) {
+            population.innerHTML = Object.entries(update.total_subjects || {}).map(([treatment, count]) =>
+                `<li><strong>${treatment}:</strong> ${count} subjects</li>`
+            ).join('');
+        }
+    }
+    
+    changedCells.forEach(cell => cell.classList.add('live-changed'));
+    setTimeout(() => changedCells.forEach(cell => cell.classList.remove('live-changed')), 3000);
+    showMessage('Table updated with new data', 'info');
+}
+
 function showLoading() {
+    stopLiveUpdates();
     document.getElementById('loadingSpinner').style.display = 'flex';
     document.getElementById('errorMessage').style.display = 'none';
     document.getElementById('tableContainer').innerHTML = '';
@@ -434,5 +590,10 @@ style.textContent = `
     .metadata li strong {
         color: #4a5568;
     }
+    
+    .clinical-table td.live-changed {
+        background: #fefcbf;
+        transition: background 0.5s ease;
+    }
 `;
 document.head.appendChild(style);
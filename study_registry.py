@@ -0,0 +1,411 @@
+"""
+Study registry
+
+Maps study IDs to data directories and owns the in-memory datasets of every
+study. Datasets load the first time a study is used.
+
+Typed frames are kept in a shared column store in ``<data dir>/.columns/``:
+one .npy file per column, with categoricals stored as their codes plus a
+category list. The first process to load a dataset parses its CSV and writes
+the store. Every process, including that first one, then memory-maps the
+columns read-only (``STUDY_MMAP``, on by default). N server workers
+therefore share one copy of the data through the page cache, and a worker
+starting against an existing store maps it instead of parsing CSVs. Each
+dataset version lives in its own directory. A new version is written under
+a temporary name and renamed into place, so readers never see a partial
+store.
+
+A global memory budget (``STUDY_MEMORY_MB``) evicts least-recently-used
+studies. Each study loads under its own lock; the registry lock only guards
+bookkeeping, so a cold study never blocks requests for studies already
+loaded. Only memory private to the process counts against it; mapped
+columns do not. With the store disabled, frames are spilled to it on
+eviction instead and read back when the study is used again. Loaded frames
+and stored versions are both invalidated when their CSV or schema changes.
+
+Studies are the ``default`` study (``STUDY_DATA``, default ``data``) plus
+every subdirectory of ``STUDY_ROOT`` (default ``studies/``) that contains a
+demographics.csv.
+"""
+
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+import analysis_cube
+import dataset_schema
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+DEFAULT_STUDY = 'default'
+DEFAULT_DATA_PATH = os.environ.get('STUDY_DATA', 'data')
+STUDY_ROOT = os.environ.get('STUDY_ROOT', os.path.join(BASE_DIR, 'studies'))
+MEMORY_BUDGET_MB = float(os.environ.get('STUDY_MEMORY_MB', '1024'))
+SHARED_COLUMNS = os.environ.get('STUDY_MMAP', '1') not in ('', '0')
+
+SPILL_DIR = '.columns'
+# Bumped when the layout of stored columns changes
+STORE_FORMAT = 2
+# numpy dtype kinds stored as raw arrays; everything else is dictionary-coded
+RAW_KINDS = 'biufcmM'
+
+_REGISTRY = None
+_REGISTRY_LOCK = threading.Lock()
+
+
+def _source_signature(path):
+    stat = os.stat(path)
+    return [stat.st_mtime, stat.st_size]
+
+
+def frame_nbytes(frame):
+    return int(frame.memory_usage(index=True, deep=True).sum())
+
+
+def _is_mapped(array):
+    while isinstance(array, np.ndarray):
+        if isinstance(array, np.memmap):
+            return True
+        array = array.base
+    return False
+
+
+def mapped_nbytes(frame):
+    """Bytes of frame's columns that live in a memory-mapped column store"""
+    total = 0
+    for name in frame.columns:
+        values = frame[name].array
+        if isinstance(values, pd.Categorical):
+            values = values.codes
+        else:
+            values = np.asarray(values)
+        if _is_mapped(values):
+            total += values.nbytes
+    return total
+
+
+def store_version(name, signature):
+    """Directory name of one dataset version: its CSV signature and schema"""
+    content = json.dumps([STORE_FORMAT, signature, dataset_schema.SCHEMAS.get(name)], sort_keys=True)
+    return hashlib.sha256(content.encode()).hexdigest()[:16]
+
+
+def spill_frame(frame, directory, signature):
+    """Write frame as one .npy file per column plus a meta.json
+
+    The files are written to a temporary directory that is renamed to
+    directory. If another process stored the same version first, its copy
+    is kept.
+    """
+    parent = os.path.dirname(directory)
+    os.makedirs(parent, exist_ok=True)
+    staging = tempfile.mkdtemp(dir=parent, prefix='.tmp-')
+    try:
+        columns = []
+        for position, name in enumerate(frame.columns):
+            series = frame[name]
+            filename = f'{position}.npy'
+            column = {'name': name, 'dtype': str(series.dtype), 'file': filename}
+            if isinstance(series.dtype, pd.CategoricalDtype):
+                np.save(os.path.join(staging, filename), series.cat.codes.to_numpy())
+                column['categories'] = [str(c) for c in series.cat.categories]
+                column['ordered'] = bool(series.cat.ordered)
+                column['codes'] = True
+            elif series.dtype.kind in RAW_KINDS:
+                np.save(os.path.join(staging, filename), series.to_numpy())
+            else:
+                codes, categories = pd.factorize(series, use_na_sentinel=True)
+                np.save(os.path.join(staging, filename), codes.astype(np.int32))
+                column['categories'] = [str(c) for c in categories]
+            columns.append(column)
+
+        meta = {'signature': signature, 'rows': len(frame), 'columns': columns}
+        with open(os.path.join(staging, 'meta.json'), 'w') as f:
+            json.dump(meta, f)
+        os.rename(staging, directory)
+    except OSError:
+        shutil.rmtree(staging, ignore_errors=True)
+        if not os.path.exists(os.path.join(directory, 'meta.json')):
+            raise
+
+
+def remove_other_versions(directory):
+    """Delete the stored versions next to directory (processes that still
+    map them keep their open files)"""
+    parent = os.path.dirname(directory)
+    for entry in os.listdir(parent):
+        path = os.path.join(parent, entry)
+        if path != directory and not entry.startswith('.tmp-') and os.path.isdir(path):
+            shutil.rmtree(path, ignore_errors=True)
+
+
+def read_spilled(directory, signature, mmap=False):
+    """Frame from the column store, or None if missing or stale
+
+    With mmap the columns are memory-mapped read-only instead of read.
+    """
+    meta_path = os.path.join(directory, 'meta.json')
+    try:
+        with open(meta_path) as f:
+            meta = json.load(f)
+        if meta['signature'] != signature:
+            return None
+        data = {}
+        for column in meta['columns']:
+            values = np.load(os.path.join(directory, column['file']), mmap_mode='r' if mmap else None,
+                             allow_pickle=False)
+            if column.get('codes'):
+                values = pd.Categorical.from_codes(values, categories=column['categories'],
+                                                   ordered=column['ordered'], validate=False)
+            elif 'categories' in column:
+                values = pd.Categorical.from_codes(values, categories=column['categories'])
+                values = pd.Series(values).astype(column['dtype'])
+            data[column['name']] = pd.Series(values, copy=False)
+        return pd.DataFrame(data, copy=False)
+    except FileNotFoundError:
+        return None
+    except (OSError, ValueError, KeyError) as e:
+        print(f"Ignoring unreadable column store {directory}: {e}")
+        return None
+
+
+class Study:
+    """One study's data directory and (when loaded) its frames"""
+
+    def __init__(self, study_id, data_path):
+        self.study_id = study_id
+        self.data_path = data_path
+        self.frames = None
+        self.signatures = {}
+        self.nbytes = 0
+        self.memory = None
+        # Held while the frames are loaded, reloaded or evicted
+        self.lock = threading.Lock()
+
+    def spill_path(self, name, signature):
+        return os.path.join(self.data_path, SPILL_DIR, name, store_version(name, signature))
+
+    def load(self, datasets):
+        """Map (or read) every dataset from the column store when fresh, else parse its CSV
+
+        Parsed frames are typed and validated against dataset_schema; any
+        problem raises SchemaError before the study becomes visible. Stored
+        frames were typed and validated before they were stored.
+        """
+        frames = {}
+        signatures = {}
+        parsed_bytes = {}
+        problems = []
+        for name, filename in datasets.items():
+            path = os.path.join(self.data_path, filename)
+            signature = _source_signature(path)
+            frame = read_spilled(self.spill_path(name, signature), signature, mmap=SHARED_COLUMNS)
+            if frame is None:
+                frame = pd.read_csv(path)
+                parsed_bytes[name] = frame_nbytes(frame)
+                frame, frame_problems = dataset_schema.apply_schema(name, frame)
+                problems.extend(frame_problems)
+            frames[name] = frame
+            signatures[name] = signature
+        problems.extend(dataset_schema.check_references(frames))
+        if problems:
+            raise dataset_schema.SchemaError(self.study_id, problems)
+        # Before storing, so stored columns already carry the shared codes
+        frames = dataset_schema.share_dictionaries(frames)
+
+        if SHARED_COLUMNS:
+            for name in parsed_bytes:
+                frames[name] = self.share(name, frames[name], signatures[name])
+
+        self.frames = frames
+        self.signatures = signatures
+        self.memory = dataset_schema.memory_summary(frames, parsed_bytes)
+        self.memory['mapped_bytes'] = sum(mapped_nbytes(frame) for frame in frames.values())
+        self.nbytes = self.memory['bytes'] - self.memory['mapped_bytes']
+        if parsed_bytes:
+            print(f"Loaded study {self.study_id}: {self.memory['bytes'] / 1024 / 1024:.2f} MB typed "
+                  f"({sum(parsed_bytes.values()) / 1024 / 1024:.2f} MB as parsed)")
+        elif self.memory['mapped_bytes']:
+            print(f"Loaded study {self.study_id}: {self.memory['mapped_bytes'] / 1024 / 1024:.2f} MB "
+                  f"mapped from the column store")
+
+    def share(self, name, frame, signature):
+        """Store a parsed frame in the column store and return it memory-mapped"""
+        directory = self.spill_path(name, signature)
+        try:
+            spill_frame(frame, directory, signature)
+            remove_other_versions(directory)
+        except OSError as e:
+            print(f"Could not write column store for {self.study_id}/{name}: {e}")
+            return frame
+        mapped = read_spilled(directory, signature, mmap=True)
+        return frame if mapped is None else mapped
+
+    def is_stale(self, datasets):
+        """True if any dataset file changed since the frames were loaded"""
+        for name, filename in datasets.items():
+            path = os.path.join(self.data_path, filename)
+            if not os.path.exists(path) or _source_signature(path) != self.signatures.get(name):
+                return True
+        return False
+
+    def spill(self, datasets):
+        """Write frames whose column store version is missing"""
+        for name, frame in self.frames.items():
+            path = os.path.join(self.data_path, datasets[name])
+            if not os.path.exists(path):
+                continue
+            signature = _source_signature(path)
+            if signature != self.signatures.get(name):
+                continue
+            directory = self.spill_path(name, signature)
+            if not os.path.exists(os.path.join(directory, 'meta.json')):
+                spill_frame(frame, directory, signature)
+                remove_other_versions(directory)
+
+    def unload(self):
+        self.frames = None
+        self.signatures = {}
+        self.nbytes = 0
+        self.memory = None
+
+
+class StudyRegistry:
+    """Registered studies with LRU eviction of loaded frames under a memory budget"""
+
+    def __init__(self, root=STUDY_ROOT, memory_budget_mb=MEMORY_BUDGET_MB,
+                 default_data_path=DEFAULT_DATA_PATH):
+        self.root = root
+        self.memory_budget = int(memory_budget_mb * 1024 * 1024)
+        self.studies = {}
+        self._loaded = OrderedDict()
+        self._datasets = {}
+        self._lock = threading.RLock()
+        self.register(DEFAULT_STUDY, default_data_path)
+        self.discover()
+
+    def register(self, study_id, data_path):
+        with self._lock:
+            current = self.studies.get(study_id)
+        if current is not None and current.data_path != data_path:
+            self.evict(study_id)
+        with self._lock:
+            current = self.studies.get(study_id)
+            if current is None or current.data_path != data_path:
+                self.studies[study_id] = Study(study_id, data_path)
+            return self.studies[study_id]
+
+    def discover(self):
+        """Register every study directory under root"""
+        if not os.path.isdir(self.root):
+            return
+        for entry in sorted(os.listdir(self.root)):
+            path = os.path.join(self.root, entry)
+            if os.path.isfile(os.path.join(path, 'demographics.csv')):
+                self.register(entry, path)
+
+    def get(self, study_id):
+        study = self.studies.get(study_id or DEFAULT_STUDY)
+        if study is None:
+            raise ValueError(f"Unknown study: {study_id}")
+        return study
+
+    def data_path(self, study_id):
+        return self.get(study_id).data_path
+
+    def datasets(self, study_id, datasets):
+        """Frames of a study, loading it on demand; marks the study most recently used
+
+        Loading holds only the study's lock (locks are always taken study
+        first, then registry). Over the memory budget, other studies are
+        evicted once the study's lock is released.
+        """
+        with self._lock:
+            study = self.get(study_id)
+        with study.lock:
+            if study.frames is not None and study.is_stale(datasets):
+                with self._lock:
+                    self._loaded.pop(study.study_id, None)
+                study.unload()
+            if study.frames is None:
+                study.load(datasets)
+            frames = study.frames
+            with self._lock:
+                self._datasets[study.study_id] = datasets
+                self._loaded[study.study_id] = study
+                self._loaded.move_to_end(study.study_id)
+        self._enforce_budget(keep=study.study_id)
+        return frames
+
+    def evict(self, study_id):
+        """Spill a loaded study to its columnar cache and drop its frames"""
+        study = self.studies.get(study_id)
+        if study is None:
+            return
+        with study.lock:
+            with self._lock:
+                if self._loaded.pop(study_id, None) is None:
+                    return
+                datasets = self._datasets[study_id]
+            try:
+                study.spill(datasets)
+            except OSError as e:
+                print(f"Could not spill study {study_id}: {e}")
+            study.unload()
+            analysis_cube.drop_cubes(study.data_path)
+
+    def _enforce_budget(self, keep):
+        while True:
+            with self._lock:
+                if self.memory_used() <= self.memory_budget:
+                    return
+                victims = [study_id for study_id in self._loaded if study_id != keep]
+            if not victims:
+                return
+            self.evict(victims[0])
+
+    def memory_used(self):
+        return sum(study.nbytes for study in self._loaded.values())
+
+    def report(self, detail=False):
+        """Registered studies with their load state, for the studies endpoint
+
+        With detail, loaded studies also list rows, bytes and dtypes per dataset.
+        """
+        with self._lock:
+            return {
+                'memory_budget_mb': round(self.memory_budget / 1024 / 1024, 1),
+                'memory_used_mb': round(self.memory_used() / 1024 / 1024, 2),
+                'studies': [self._study_report(study, detail) for study in self.studies.values()],
+            }
+
+    def _study_report(self, study, detail):
+        report = {
+            'study': study.study_id,
+            'data_path': study.data_path,
+            'loaded': study.frames is not None,
+            'memory_mb': round(study.nbytes / 1024 / 1024, 2),
+        }
+        if study.memory and 'parsed_bytes' in study.memory:
+            report['parsed_memory_mb'] = round(study.memory['parsed_bytes'] / 1024 / 1024, 2)
+        if study.memory:
+            report['mapped_memory_mb'] = round(study.memory['mapped_bytes'] / 1024 / 1024, 2)
+        if detail and study.memory:
+            report['datasets'] = study.memory['datasets']
+        return report
+
+
+def get_registry():
+    """Process-wide study registry (created on first use)"""
+    global _REGISTRY
+    with _REGISTRY_LOCK:
+        if _REGISTRY is None:
+            _REGISTRY = StudyRegistry()
+        return _REGISTRY
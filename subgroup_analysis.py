@@ -0,0 +1,207 @@
+"""
+Subgroup analysis matrix
+
+Computes a table for every level of one or more subgrouping variables in a
+single grouped pass per variable: the subgroup is appended to the group keys
+of each aggregate, and every level's table is sliced out of that one result
+instead of re-running the table once per filtered level.
+
+Also derives forest-plot-ready data: risk differences vs the reference arm
+for incidence tables, and means with 95% CIs for descriptive tables.
+"""
+
+import math
+
+import pandas as pd
+
+import table_engine
+from table_engine import ARM_VAR
+
+# Subgroup name -> demographic source variable, with optional left-closed bands
+SUBGROUPS = {
+    'SEX': {'variable': 'SEX'},
+    'RACE': {'variable': 'RACE'},
+    'COUNTRY': {'variable': 'COUNTRY'},
+    'AGEGR': {
+        'variable': 'AGE',
+        'bins': [-math.inf, 40, 65, math.inf],
+        'labels': ['<40', '40-64', '>=65'],
+    },
+    'BMIGR': {
+        'variable': 'BMI',
+        'bins': [-math.inf, 18.5, 25, 30, math.inf],
+        'labels': ['<18.5', '18.5-<25', '25-<30', '>=30'],
+    },
+}
+
+# Derived column holding the subgroup level, distinct from any table key
+SUBGROUP_COLUMN = '_SUBGROUP'
+
+REFERENCE_ARM = 'Placebo'
+Z_95 = 1.959964
+
+
+class SubgroupPartition:
+    """A relation partitioned by a subgroup column
+
+    Each aggregate is computed once with the subgroup appended to the keys and
+    memoized, so every SubgroupSlice shares the same grouped pass.
+    """
+
+    def __init__(self, relation, column):
+        self.relation = relation
+        self.column = column
+        self._aggregates = {}
+        self._derived = {}
+
+    def grouped(self, keys, measure, value=None):
+        cache_key = (tuple(keys), measure, value)
+        if cache_key not in self._aggregates:
+            self._aggregates[cache_key] = self.relation.aggregate(
+                list(keys) + [self.column], measure, value
+            )
+        return self._aggregates[cache_key]
+
+    def grouped_grades(self, grading, test, unit, value):
+        cache_key = ('grades', id(grading), test, unit, value)
+        if cache_key not in self._aggregates:
+            self._aggregates[cache_key] = self.relation.grade_counts(
+                grading, test, unit, value, by=self.column
+            )
+        return self._aggregates[cache_key]
+
+    def derive(self, operation, *args):
+        """Partition of a derived relation (where/stack/dropna), shared by all slices"""
+        cache_key = (operation, repr(args))
+        if cache_key not in self._derived:
+            derived = getattr(self.relation, operation)(*args)
+            self._derived[cache_key] = SubgroupPartition(derived, self.column)
+        return self._derived[cache_key]
+
+    def slice(self, level):
+        return SubgroupSlice(self, level)
+
+
+class SubgroupSlice:
+    """Relation view of one subgroup level, answered from the partition's aggregates"""
+
+    def __init__(self, partition, level):
+        self.partition = partition
+        self.level = level
+
+    def _select(self, result):
+        column = self.partition.column
+        if self.level in result.index.get_level_values(column):
+            return result.xs(self.level, level=column)
+        return result.iloc[:0].droplevel(column)
+
+    def __len__(self):
+        counts = self.partition.grouped([], 'records')
+        return int(counts.get(self.level, 0))
+
+    def levels(self, variable, order='appearance'):
+        if isinstance(order, list):
+            return order
+        levels = list(self._select(self.partition.grouped([variable], 'records')).index)
+        return sorted(levels) if order == 'sorted' else levels
+
+    def aggregate(self, keys, measure, value=None):
+        return self._select(self.partition.grouped(keys, measure, value))
+
+    def grade_counts(self, grading, test, unit, value, by=None):
+        return self._select(self.partition.grouped_grades(grading, test, unit, value))
+
+    def where(self, variable, equals=None, not_in=None):
+        return SubgroupSlice(self.partition.derive('where', variable, equals, not_in), self.level)
+
+    def stack(self, id_vars, variables, var_name, value_name):
+        id_vars = list(id_vars) + [self.partition.column]
+        return SubgroupSlice(
+            self.partition.derive('stack', id_vars, variables, var_name, value_name), self.level
+        )
+
+    def dropna(self, column):
+        return SubgroupSlice(self.partition.derive('dropna', column), self.level)
+
+
+def _ordered_levels(definition, present):
+    if 'labels' in definition:
+        return [label for label in definition['labels'] if label in present]
+    return sorted(present)
+
+
+def run_subgroup(plan, generator, filters, subgroup):
+    """Compute plan's table for every level of one subgroup variable
+
+    Returns an ordered list of (level, TableResult).
+    """
+    if subgroup not in SUBGROUPS:
+        raise ValueError(f"Unknown subgroup: {subgroup}")
+    definition = SUBGROUPS[subgroup]
+    source = definition['variable']
+
+    relation = generator.relation(plan, filters, extra_columns=[source])
+    relation = relation.with_subgroup(SUBGROUP_COLUMN, source,
+                                      definition.get('bins'), definition.get('labels'))
+
+    population = generator.population_counts(filters, subgroup=definition)
+    partition = SubgroupPartition(relation, SUBGROUP_COLUMN)
+
+    executor = table_engine.EXECUTORS[plan.kind]
+    results = []
+    for level in _ordered_levels(definition, set(population)):
+        totals = population.get(level, {}) if plan.needs_population else None
+        results.append((level, executor(plan, partition.slice(level), totals)))
+    return results
+
+
+def risk_difference(n1, total1, n0, total0):
+    """Risk difference (percentage points) with a Wald 95% CI"""
+    p1 = n1 / total1
+    p0 = n0 / total0
+    se = math.sqrt(p1 * (1 - p1) / total1 + p0 * (1 - p0) / total0)
+    diff = p1 - p0
+    return round(diff * 100, 2), round((diff - Z_95 * se) * 100, 2), round((diff + Z_95 * se) * 100, 2)
+
+
+def forest_data(plan, subgroup, level, result):
+    """Forest-plot records for one subgroup level's TableResult"""
+    stats = result.stats
+    if stats is None or stats.empty:
+        return []
+
+    records = []
+    if plan.kind == 'incidence':
+        for (variable, row_level), group in stats.groupby(['variable', 'level'], sort=False):
+            by_arm = group.set_index(ARM_VAR)
+            reference = by_arm.loc[REFERENCE_ARM] if REFERENCE_ARM in by_arm.index else None
+            for arm, cell in by_arm.iterrows():
+                n, total = int(cell['n']), int(cell['N'])
+                record = {
+                    'subgroup': subgroup, 'level': level, 'row': row_level, 'arm': arm,
+                    'n': n, 'N': total,
+                    'percent': round(n / total * 100, 1) if total else None,
+                }
+                if reference is not None and arm != REFERENCE_ARM and total and reference['N']:
+                    diff, lower, upper = risk_difference(n, total, int(reference['n']), int(reference['N']))
+                    record.update({'reference': REFERENCE_ARM, 'risk_difference': diff,
+                                   'ci_lower': lower, 'ci_upper': upper})
+                records.append(record)
+
+    elif plan.kind == 'descriptive':
+        keys = [key['variable'] for key in plan.spec['by']]
+        labels = [key['label'] for key in plan.spec['by']]
+        for row in stats.to_dict('records'):
+            n, mean, sd = int(row['count']), row['mean'], row['std']
+            half_width = Z_95 * sd / math.sqrt(n) if n > 1 and not pd.isna(sd) else None
+            record = {'subgroup': subgroup, 'level': level}
+            record.update({label: row[key] for key, label in zip(keys, labels)})
+            record.update({
+                'n': n,
+                'mean': round(mean, 3),
+                'ci_lower': round(mean - half_width, 3) if half_width is not None else None,
+                'ci_upper': round(mean + half_width, 3) if half_width is not None else None,
+            })
+            records.append(record)
+
+    return records
@@ -0,0 +1,200 @@
+"""
+Subject sets over integer subject indexes
+
+Every study numbers its subjects by position in demographics. A SubjectSet is
+a compressed bitmap over those positions. It uses a roaring bitmap when the
+optional ``pyroaring`` package is installed, and otherwise a packed numpy
+bitmap. Population filters, "subjects with AE term X" and "subjects on
+conmed Y" become bitmaps, and combining them is a bitwise AND/OR instead of
+a merge on string IDs.
+"""
+
+import numpy as np
+import pandas as pd
+
+try:
+    from pyroaring import BitMap
+except ImportError:  # optional dependency
+    BitMap = None
+
+# Number of set bits in each byte value
+POPCOUNT = np.array([bin(i).count('1') for i in range(256)], dtype=np.uint8)
+
+
+def _pack(indexes, universe):
+    """Packed (big-endian, np.packbits-compatible) bitmap of subject indexes"""
+    bits = np.zeros((universe + 7) // 8, dtype=np.uint8)
+    indexes = np.asarray(indexes, dtype=np.int64)
+    indexes = indexes[(indexes >= 0) & (indexes < universe)]
+    np.bitwise_or.at(bits, indexes >> 3, np.left_shift(1, 7 - (indexes & 7)).astype(np.uint8))
+    return bits
+
+
+class SubjectSet:
+    """Immutable set of subject indexes in [0, universe)"""
+
+    __slots__ = ('universe', '_bits')
+
+    def __init__(self, universe, bits):
+        self.universe = universe
+        self._bits = bits
+
+    @classmethod
+    def from_indexes(cls, indexes, universe):
+        indexes = np.asarray(indexes, dtype=np.int64)
+        if BitMap is not None:
+            indexes = indexes[(indexes >= 0) & (indexes < universe)]
+            return cls(universe, BitMap(indexes.astype(np.uint32)))
+        return cls(universe, _pack(indexes, universe))
+
+    @classmethod
+    def from_mask(cls, mask):
+        """Set of positions where a boolean array over all subjects is True"""
+        mask = np.asarray(mask, dtype=bool)
+        if BitMap is not None:
+            return cls(len(mask), BitMap(np.flatnonzero(mask).astype(np.uint32)))
+        return cls(len(mask), np.packbits(mask))
+
+    @classmethod
+    def full(cls, universe):
+        return cls.from_mask(np.ones(universe, dtype=bool))
+
+    def _combine(self, other, operation):
+        if self.universe != other.universe:
+            raise ValueError("Subject sets belong to different studies")
+        return SubjectSet(self.universe, operation(self._bits, other._bits))
+
+    def __and__(self, other):
+        return self._combine(other, lambda a, b: a & b)
+
+    def __or__(self, other):
+        return self._combine(other, lambda a, b: a | b)
+
+    def __sub__(self, other):
+        if BitMap is not None:
+            return self._combine(other, lambda a, b: a - b)
+        return self._combine(other, lambda a, b: a & ~b)
+
+    def __invert__(self):
+        return SubjectSet.full(self.universe) - self
+
+    def __len__(self):
+        if BitMap is not None:
+            return len(self._bits)
+        return int(POPCOUNT[self._bits].sum())
+
+    def __eq__(self, other):
+        return isinstance(other, SubjectSet) and self.universe == other.universe and \
+            np.array_equal(self.indexes(), other.indexes())
+
+    def __repr__(self):
+        return f"SubjectSet({len(self)} of {self.universe})"
+
+    def dense(self):
+        """Boolean membership array over all subjects"""
+        if BitMap is not None:
+            mask = np.zeros(self.universe, dtype=bool)
+            mask[self.indexes()] = True
+            return mask
+        return np.unpackbits(self._bits, count=self.universe).astype(bool)
+
+    def indexes(self):
+        if BitMap is not None:
+            return np.fromiter(self._bits, dtype=np.int64, count=len(self._bits))
+        return np.flatnonzero(self.dense())
+
+    def contains(self, indexes):
+        """Vectorized membership test; negative (unknown subject) indexes are False"""
+        indexes = np.asarray(indexes, dtype=np.int64)
+        dense = self.dense()
+        result = np.zeros(len(indexes), dtype=bool)
+        known = indexes >= 0
+        result[known] = dense[indexes[known]]
+        return result
+
+    @staticmethod
+    def union_all(sets, universe):
+        sets = list(sets)
+        if not sets:
+            return SubjectSet.from_indexes([], universe)
+        if BitMap is not None:
+            return SubjectSet(universe, BitMap.union(*[s._bits for s in sets]))
+        return SubjectSet(universe, np.bitwise_or.reduce([s._bits for s in sets]))
+
+
+class SubjectSetColumn:
+    """One subject set per cell (e.g. per cube cell) with grouped union counts"""
+
+    def __init__(self, cell_ids, subject_ids, n_cells, universe):
+        self.universe = universe
+        cell_ids = np.asarray(cell_ids, dtype=np.int64)
+        subject_ids = np.asarray(subject_ids, dtype=np.int64)
+        valid = (subject_ids >= 0) & (cell_ids >= 0)
+        cell_ids, subject_ids = cell_ids[valid], subject_ids[valid]
+
+        if BitMap is not None:
+            order = np.argsort(cell_ids, kind='stable')
+            bounds = np.searchsorted(cell_ids[order], np.arange(n_cells + 1))
+            sorted_subjects = subject_ids[order].astype(np.uint32)
+            self._sets = [BitMap(sorted_subjects[bounds[i]:bounds[i + 1]]) for i in range(n_cells)]
+        else:
+            bits = np.zeros((n_cells, (universe + 7) // 8), dtype=np.uint8)
+            np.bitwise_or.at(bits, (cell_ids, subject_ids >> 3),
+                             np.left_shift(1, 7 - (subject_ids & 7)).astype(np.uint8))
+            self._bits = bits
+
+    def __getitem__(self, cell_id):
+        if BitMap is not None:
+            return SubjectSet(self.universe, self._sets[cell_id])
+        return SubjectSet(self.universe, self._bits[cell_id])
+
+    def union_counts(self, cell_ids, group_codes, n_groups):
+        """Distinct subjects per group, where cell_ids[i] belongs to group_codes[i]"""
+        counts = np.zeros(n_groups, dtype=np.int64)
+        if not len(cell_ids):
+            return counts
+        order = np.argsort(group_codes, kind='stable')
+        cell_ids = np.asarray(cell_ids)[order]
+        group_codes = np.asarray(group_codes)[order]
+        starts = np.flatnonzero(np.r_[True, group_codes[1:] != group_codes[:-1]])
+
+        if BitMap is not None:
+            ends = np.r_[starts[1:], len(cell_ids)]
+            for start, end in zip(starts, ends):
+                counts[group_codes[start]] = len(BitMap.union(*[self._sets[c] for c in cell_ids[start:end]]))
+            return counts
+
+        merged = np.bitwise_or.reduceat(self._bits[cell_ids], starts, axis=0)
+        counts[group_codes[starts]] = POPCOUNT[merged].sum(axis=1, dtype=np.int64)
+        return counts
+
+
+class SubjectIndex:
+    """SUBJID <-> integer subject index for one study (demographics order)"""
+
+    def __init__(self, subject_ids):
+        self.ids = pd.Index(subject_ids)
+        self.universe = len(self.ids)
+        self._dtype = None
+        if isinstance(subject_ids.dtype, pd.CategoricalDtype):
+            # Subject index per dictionary code; the spare last entry maps code -1
+            self._dtype = subject_ids.dtype
+            self._by_code = np.full(len(subject_ids.cat.categories) + 1, -1, dtype=np.int64)
+            codes = np.asarray(subject_ids.cat.codes)
+            self._by_code[codes[codes >= 0]] = np.flatnonzero(codes >= 0)
+
+    def codes(self, subject_ids):
+        """Integer index per SUBJID value; -1 for subjects not in demographics
+
+        Columns coded with the demographics dictionary (see
+        dataset_schema.share_dictionaries) are translated code by code.
+        """
+        if self._dtype is not None and subject_ids.dtype == self._dtype:
+            return self._by_code[np.asarray(subject_ids.cat.codes)]
+        return self.ids.get_indexer(subject_ids)
+
+    def to_ids(self, subject_set):
+        return self.ids[subject_set.indexes()].tolist()
+
+    def from_codes(self, codes):
+        return SubjectSet.from_indexes(codes, self.universe)
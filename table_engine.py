@@ -0,0 +1,620 @@
+"""
+Declarative table specification engine
+
+Every table type is described by a JSON spec in ``table_specs/``. Specs are
+compiled once into a ``QueryPlan`` (which columns to read, which demographic
+columns the filters need, which keys to group on) and executed by a single
+shared aggregation core, so any optimization made here applies to every table.
+
+Supported spec kinds:
+- ``incidence``: subject/record counts by row variable and treatment arm, n (%)
+- ``descriptive``: N, mean, SD, min, max by visit/parameter/treatment
+- ``baseline``: per-arm sections of continuous and categorical characteristics
+- ``grades``: subjects by worst toxicity grade per term and arm (see lab_grading)
+"""
+
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+import filter_language
+import lab_grading
+
+SPEC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'table_specs')
+
+SUBJECT_VAR = 'SUBJID'
+# Integer subject index (subject_sets.SubjectIndex) attached to prepared frames
+SUBJECT_CODE = '_SUBJN'
+ARM_VAR = 'TRT'
+
+SPEC_KINDS = ('incidence', 'descriptive', 'baseline', 'grades')
+REQUIRED_KEYS = ('name', 'label', 'domain', 'kind', 'title', 'subtitle', 'summary')
+
+
+class QueryPlan:
+    """Compiled, execution-ready form of a table spec"""
+
+    def __init__(self, spec):
+        self.spec = spec
+        self.name = spec['name']
+        self.kind = spec['kind']
+        self.domain = spec['domain']
+        self.keys, self.values = _plan_columns(spec)
+        # Domain columns read (projection pushed down before merge/filter)
+        self.columns = [SUBJECT_VAR, ARM_VAR] + self.keys + self.values
+        self.needs_population = self.kind == 'incidence'
+
+    def wanted_columns(self, compiled_filter, extra_columns=()):
+        """Columns the plan reads plus any referenced by filters or extras"""
+        wanted = list(self.columns)
+        for column in list(extra_columns) + sorted(compiled_filter.columns):
+            if column not in wanted:
+                wanted.append(column)
+        return wanted
+
+    def __repr__(self):
+        return f"QueryPlan({self.name!r}, kind={self.kind!r}, domain={self.domain!r})"
+
+
+class TableResult:
+    """Output of a plan execution, before HTML rendering"""
+
+    def __init__(self, frame, display_columns, title, subtitle, summary,
+                 total_subjects=None, stats=None):
+        self.frame = frame
+        self.display_columns = display_columns
+        self.title = title
+        self.subtitle = subtitle
+        self.summary = summary
+        self.total_subjects = total_subjects
+        # Unformatted long-form numbers behind the table (for plots/forest data)
+        self.stats = stats
+
+
+def validate_spec(spec):
+    """Raise ValueError if a spec is missing required keys or has an unknown kind"""
+    missing = [key for key in REQUIRED_KEYS if key not in spec]
+    if missing:
+        raise ValueError(f"Table spec {spec.get('name', '?')!r} is missing keys: {missing}")
+    if spec['kind'] not in SPEC_KINDS:
+        raise ValueError(f"Table spec {spec['name']!r} has unknown kind {spec['kind']!r}")
+    if spec['kind'] == 'incidence' and 'rows' not in spec:
+        raise ValueError(f"Incidence spec {spec['name']!r} needs a 'rows' section")
+    if spec['kind'] == 'descriptive' and ('by' not in spec or 'analysis' not in spec):
+        raise ValueError(f"Descriptive spec {spec['name']!r} needs 'by' and 'analysis' sections")
+    if spec['kind'] == 'baseline' and 'sections' not in spec:
+        raise ValueError(f"Baseline spec {spec['name']!r} needs a 'sections' list")
+    if spec['kind'] == 'grades' and 'grading' not in spec:
+        raise ValueError(f"Grades spec {spec['name']!r} needs a 'grading' section")
+
+
+def load_specs(spec_dir=SPEC_DIR):
+    """Load and validate every ``*.json`` spec in spec_dir, ordered by 'order'"""
+    specs = []
+    for filename in sorted(os.listdir(spec_dir)):
+        if not filename.endswith('.json'):
+            continue
+        with open(os.path.join(spec_dir, filename)) as f:
+            spec = json.load(f)
+        validate_spec(spec)
+        specs.append(spec)
+
+    specs.sort(key=lambda s: s.get('order', len(specs)))
+    return {spec['name']: spec for spec in specs}
+
+
+def compile_specs(specs):
+    """Compile a dict of specs into query plans"""
+    return {name: QueryPlan(spec) for name, spec in specs.items()}
+
+
+def available_tables():
+    """Table type -> display label, in menu order"""
+    return {name: plan.spec['label'] for name, plan in PLANS.items()}
+
+
+def _plan_columns(spec):
+    """Grouping keys and analysis value columns a spec reads from its domain"""
+    keys = []
+    values = []
+
+    def add(target, column):
+        if column and column not in target:
+            target.append(column)
+
+    if spec['kind'] == 'incidence':
+        add(keys, spec['rows']['variable'])
+        add(keys, spec.get('nested', {}).get('variable'))
+    elif spec['kind'] == 'descriptive':
+        for key in spec['by']:
+            if key['variable'] not in (spec['analysis'].get('stack_as'), ARM_VAR):
+                add(keys, key['variable'])
+        for column in spec['analysis'].get('variables', [spec['analysis'].get('variable')]):
+            add(values, column)
+    elif spec['kind'] == 'grades':
+        add(keys, spec['grading']['test'])
+        add(keys, spec['grading'].get('unit'))
+        add(values, spec['grading']['value'])
+    else:
+        for section in spec['sections']:
+            add(values if section['type'] == 'continuous' else keys, section['variable'])
+    return keys, values
+
+
+# ---------------------------------------------------------------------------
+# Shared aggregation core
+# ---------------------------------------------------------------------------
+
+STATISTICS = ['count', 'mean', 'std', 'min', 'max']
+
+# Largest cells x subjects presence matrix for distinct-subject counts
+MAX_PRESENCE_CELLS = 1 << 26
+
+
+def key_codes(values):
+    """(integer codes, levels) of a grouping key; -1 marks missing values
+
+    Categorical keys reuse their dictionary codes as stored; other keys
+    (subgroup bands, stacked parameter names) are factorized once.
+    """
+    if isinstance(values.dtype, pd.CategoricalDtype):
+        return values.cat.codes.to_numpy(), pd.CategoricalIndex(values.cat.categories, dtype=values.dtype)
+    codes, uniques = pd.factorize(values)
+    if uniques.dtype == object:
+        # Infer the label dtype (e.g. str) as groupby does
+        uniques = pd.Index(uniques.tolist())
+    return codes, uniques
+
+
+def count_cells(frame, keys, measure):
+    """Record or distinct-subject counts per key combination, on integer codes
+
+    Every key is reduced to its dictionary codes and the combination to one
+    cell number, so the count is an np.bincount (records) or a cells x
+    subjects presence matrix (subjects) over small integers. Labels are
+    attached only to the non-empty cells. Matches
+    groupby(keys, sort=False, observed=True): cells appear in order of their
+    first row and rows with a missing key are dropped.
+    """
+    codes, levels = zip(*(key_codes(frame[key]) for key in keys))
+    keep = np.logical_and.reduce([c >= 0 for c in codes])
+    subjects = None
+    if measure == 'subjects':
+        subjects = frame[SUBJECT_CODE].to_numpy()
+        keep &= subjects >= 0
+    if not keep.all():
+        codes = [c[keep] for c in codes]
+        subjects = subjects[keep] if subjects is not None else None
+
+    shape = tuple(max(len(level), 1) for level in levels)
+    n_cells = int(np.prod(shape))
+    cells = np.ravel_multi_index([c.astype(np.int64) for c in codes], shape)
+
+    if measure == 'records':
+        counts = np.bincount(cells, minlength=n_cells)
+    else:
+        n_subjects = int(subjects.max()) + 1 if len(subjects) else 1
+        pairs = cells * n_subjects + subjects
+        if n_cells * n_subjects <= MAX_PRESENCE_CELLS:
+            present = np.zeros(n_cells * n_subjects, dtype=bool)
+            present[pairs] = True
+            counts = present.reshape(n_cells, n_subjects).sum(axis=1)
+        else:
+            counts = np.bincount(np.unique(pairs) // n_subjects, minlength=n_cells)
+
+    first = np.full(n_cells, len(cells), dtype=np.int64)
+    np.minimum.at(first, cells, np.arange(len(cells), dtype=np.int64))
+    occupied = np.flatnonzero(first < len(cells))
+    occupied = occupied[np.argsort(first[occupied], kind='stable')]
+
+    name = SUBJECT_CODE if measure == 'subjects' else None
+    values = counts[occupied].astype(np.int64)
+    if len(keys) == 1:
+        index = levels[0].take(occupied).rename(keys[0])
+    else:
+        # Levels hold observed labels in order of appearance, as groupby builds
+        # them, so a later unstack orders rows and columns the same way
+        index_levels, index_codes = [], []
+        for level, cell_codes in zip(levels, np.unravel_index(occupied, shape)):
+            codes_in_order, used = pd.factorize(cell_codes)
+            index_levels.append(level.take(used))
+            index_codes.append(codes_in_order)
+        index = pd.MultiIndex(levels=index_levels, codes=index_codes, names=list(keys),
+                              verify_integrity=False)
+    return pd.Series(values, index=index, name=name)
+
+
+def aggregate(frame, keys, measure, value=None):
+    """Group frame by keys and compute one measure in a single vectorized pass
+
+    measure is 'subjects' (distinct SUBJID), 'records' (row count) or
+    'statistics' (count/mean/std/min/max of value). Counts run on integer
+    key codes (see count_cells); statistics use pandas groupby.
+    """
+    if measure == 'records' or (measure == 'subjects' and SUBJECT_CODE in frame.columns):
+        return count_cells(frame, keys, measure)
+    grouped = frame.groupby(keys, sort=False, observed=True)
+    if measure == 'subjects':
+        return grouped[SUBJECT_VAR].nunique()
+    if measure == 'statistics':
+        values = frame[value]
+        if values.dtype == np.float32:
+            # Measurements are stored as float32; accumulate in float64
+            grouped = values.astype(np.float64).groupby([frame[k] for k in keys], sort=False, observed=True)
+            return grouped.agg(STATISTICS)
+        return grouped[value].agg(STATISTICS)
+    raise ValueError(f"Unknown measure: {measure}")
+
+
+def band_values(values, bins, labels):
+    """Left-closed interval labels for a numeric column, e.g. age or BMI bands"""
+    return pd.cut(values, bins=bins, labels=labels, right=False).astype(object)
+
+
+def level_order(values, order):
+    """Ordered category levels for a key: first appearance, sorted, or explicit list"""
+    if isinstance(order, list):
+        return order
+    levels = pd.unique(values)
+    if order == 'sorted':
+        return sorted(levels)
+    return list(levels)
+
+
+class FrameRelation:
+    """Relation over an in-memory DataFrame (the default pandas backend)
+
+    Executors only talk to relations through this small interface, so other
+    backends (see sql_backend.SQLRelation) can push the same work down.
+    """
+
+    def __init__(self, frame):
+        self.frame = frame
+
+    def __len__(self):
+        return len(self.frame)
+
+    def levels(self, variable, order='appearance'):
+        return level_order(self.frame[variable], order)
+
+    def aggregate(self, keys, measure, value=None):
+        return aggregate(self.frame, keys, measure, value)
+
+    def where(self, variable, equals=None, not_in=None):
+        mask = pd.Series(True, index=self.frame.index)
+        if equals is not None:
+            mask &= self.frame[variable] == equals
+        if not_in:
+            mask &= ~self.frame[variable].isin(not_in)
+        return FrameRelation(self.frame[mask])
+
+    def stack(self, id_vars, variables, var_name, value_name):
+        return FrameRelation(self.frame.melt(id_vars=id_vars, value_vars=variables,
+                                             var_name=var_name, value_name=value_name))
+
+    def dropna(self, column):
+        return FrameRelation(self.frame.dropna(subset=[column]))
+
+    def with_subgroup(self, name, source, bins=None, labels=None):
+        values = self.frame[source]
+        if bins is not None:
+            values = band_values(values, bins, labels)
+        return FrameRelation(self.frame.assign(**{name: values}))
+
+    def grade_counts(self, grading, test, unit, value, by=None):
+        frame = self.frame
+        subjects = frame[SUBJECT_CODE] if SUBJECT_CODE in frame.columns else frame[SUBJECT_VAR]
+        return lab_grading.worst_grade_counts(
+            grading, subjects, frame[ARM_VAR], frame[test], frame[unit] if unit else None,
+            frame[value], frame[by] if by else None,
+        )
+
+
+def split_subject_filter(generator, domain, compiled):
+    """Split a filter into a population SubjectSet and a row-level filter
+
+    Top-level AND terms that only use demographic columns the domain lacks
+    are evaluated once against demographics (generator.population_set) and
+    tested per row by integer subject code, instead of merging demographics
+    into the domain. Returns (SubjectSet or None, CompiledFilter).
+    """
+    if domain == 'demographics':
+        return None, compiled
+    frame = generator.get_domain(domain)
+    subject_only = [c for c in generator.demographics.columns if c not in frame.columns]
+    subject_filter, row_filter = compiled.split(subject_only)
+    if not subject_filter:
+        return None, row_filter
+    return generator.population_set(subject_filter), row_filter
+
+
+def prepare_frame(plan, generator, filters, extra_columns=()):
+    """Project the domain, attach demographic columns and apply filters
+
+    Columns the row-level filters or extra_columns (e.g. a subgroup variable)
+    need are read from the domain when present, otherwise merged in from
+    demographics. Subject-level filter terms become one membership test on
+    the population subject set; both parts combine into one mask.
+    """
+    compiled = filter_language.compile_filters(filters)
+    population, row_filter = split_subject_filter(generator, plan.domain, compiled)
+    frame = generator.get_domain(plan.domain)
+    wanted = plan.wanted_columns(row_filter, extra_columns)
+    frame = frame[[c for c in wanted if c in frame.columns]]
+    frame = frame.assign(**{SUBJECT_CODE: generator.subject_codes(plan.domain)})
+
+    demographics = generator.demographics
+    demo_columns = [c for c in wanted if c not in frame.columns and c in demographics.columns]
+    if demo_columns and plan.domain != 'demographics':
+        frame = frame.merge(
+            demographics[[SUBJECT_VAR] + demo_columns],
+            on=SUBJECT_VAR,
+            how='left'
+        )
+
+    mask = row_filter.mask(frame)
+    if population is not None:
+        members = population.contains(frame[SUBJECT_CODE].to_numpy())
+        mask = members if mask is None else mask & members
+    return frame if mask is None else frame[mask]
+
+
+def domain_subjects(generator, domain, filters=None):
+    """SubjectSet of subjects with at least one domain record matching filters"""
+    compiled = filter_language.compile_filters(filters)
+    population, row_filter = split_subject_filter(generator, domain, compiled)
+    frame = generator.get_domain(domain)
+    codes = generator.subject_codes(domain)
+
+    demo_columns = [c for c in row_filter.columns
+                    if c not in frame.columns and c in generator.demographics.columns]
+    frame = frame[[c for c in row_filter.columns if c in frame.columns] + [SUBJECT_VAR]]
+    if demo_columns and domain != 'demographics':
+        frame = frame.merge(generator.demographics[[SUBJECT_VAR] + demo_columns],
+                            on=SUBJECT_VAR, how='left')
+    mask = row_filter.mask(frame)
+    subjects = generator.subjects.from_codes(codes if mask is None else codes[mask])
+    return subjects if population is None else subjects & population
+
+
+def population_counts(generator, filters, subgroup=None):
+    """Denominators: number of subjects per treatment arm after filtering
+
+    With a subgroup definition (see subgroup_analysis.SUBGROUPS) returns
+    {subgroup level: {arm: n}} from one grouped count.
+    """
+    demographics = generator.demographics
+    population = demographics[generator.population_set(filters).dense()]
+    if subgroup is None:
+        return population.groupby(ARM_VAR).size().to_dict()
+
+    values = population[subgroup['variable']]
+    if 'bins' in subgroup:
+        values = band_values(values, subgroup['bins'], subgroup['labels'])
+    counts = population.groupby([values.rename('_level'), population[ARM_VAR]]).size()
+    return {level: counts.xs(level).to_dict() for level in counts.index.unique(level=0)}
+
+
+def execute(plan, generator, filters=None):
+    """Run a compiled plan against a TableGenerator's configured backend"""
+    if filters is None:
+        filters = {}
+    relation = generator.relation(plan, filters)
+    totals = generator.population_counts(filters) if plan.needs_population else None
+    return EXECUTORS[plan.kind](plan, relation, totals)
+
+
+# ---------------------------------------------------------------------------
+# Kind-specific formatting on top of the aggregation core
+# ---------------------------------------------------------------------------
+
+def _format_n_pct(n, total):
+    return f"{n} ({(n / total) * 100:.1f}%)"
+
+
+def _incidence_block(relation, row_var, arms, measure, totals, cells, label, prefix=''):
+    """One block of n (%) rows: one row per level of row_var, one cell group per arm
+
+    Returns the formatted block and its long-form counts (variable, level,
+    arm, n, N).
+    """
+    levels = relation.levels(row_var, 'appearance')
+    if not levels:
+        return pd.DataFrame(columns=[label]), None
+
+    counts = relation.aggregate([row_var, ARM_VAR], measure).unstack(ARM_VAR)
+    counts = counts.reindex(index=levels, columns=arms).fillna(0).astype(int)
+
+    long_counts = counts.rename_axis(index='level', columns=ARM_VAR).stack().rename('n').reset_index()
+    long_counts.insert(0, 'variable', row_var)
+    long_counts['N'] = long_counts[ARM_VAR].map(lambda arm: totals.get(arm, 0))
+
+    block = {label: [f'{prefix}{level}' for level in levels]}
+    for arm in arms:
+        total_n = totals.get(arm, 0)
+        n_values = counts[arm].tolist()
+        if total_n > 0:
+            if 'n' in cells:
+                block[cells['n'].format(arm=arm)] = n_values
+            if 'total' in cells:
+                block[cells['total'].format(arm=arm)] = [total_n] * len(levels)
+            block[cells['text'].format(arm=arm)] = [_format_n_pct(n, total_n) for n in n_values]
+        else:
+            block[cells['text'].format(arm=arm)] = ["0 (0.0%)"] * len(levels)
+    return pd.DataFrame(block), long_counts
+
+
+def run_incidence(plan, relation, totals):
+    spec = plan.spec
+    rows = spec['rows']
+    cells = spec.get('cells', {'text': '{arm}'})
+    measure = spec.get('count', 'subjects')
+
+    arms = relation.levels(ARM_VAR, 'sorted')
+
+    table, stats = _incidence_block(relation, rows['variable'], arms, measure, totals,
+                                    cells, rows['label'])
+
+    nested = spec.get('nested')
+    if nested:
+        sub = relation.where(rows['variable'], equals=nested['parent'])
+        sub = sub.where(nested['variable'], not_in=nested.get('exclude', []))
+        if len(sub):
+            sub_table, sub_stats = _incidence_block(sub, nested['variable'], arms, measure, totals,
+                                                    cells, rows['label'], nested.get('indent', '  '))
+            table = pd.concat([table, sub_table], ignore_index=True)
+            stats = pd.concat([stats, sub_stats], ignore_index=True)
+
+    if spec.get('sort') == 'frequency' and not table.empty:
+        n_columns = [cells['text'].format(arm=arm) for arm in arms]
+        table['total_count'] = sum(
+            table[col].str.split(' ').str[0].astype(int) for col in n_columns
+        )
+        table = table.sort_values('total_count', ascending=False)
+        table = table.drop('total_count', axis=1)
+
+    summary = spec['summary'].format(rows=len(table), subjects=sum(totals.values()))
+    return TableResult(table, list(table.columns), spec['title'], spec['subtitle'],
+                       summary, total_subjects=totals, stats=stats)
+
+
+def run_descriptive(plan, relation, totals):
+    spec = plan.spec
+    analysis = spec['analysis']
+    keys = [key['variable'] for key in spec['by']]
+
+    stack_as = analysis.get('stack_as')
+    if stack_as:
+        id_vars = [k for k in keys if k != stack_as]
+        relation = relation.stack(id_vars, analysis['variables'], stack_as, 'AVAL')
+        value = 'AVAL'
+    else:
+        value = analysis['variable']
+
+    relation = relation.dropna(value)
+    output_columns = [key['label'] for key in spec['by']] + list(spec['statistics']) + ['Summary']
+    stats = None
+    if not len(relation):
+        table = pd.DataFrame(columns=output_columns)
+    else:
+        stats = relation.aggregate(keys, 'statistics', value).reset_index()
+
+        # Nested ordering: each key ordered independently, then lexicographic
+        sort_codes = []
+        for key in spec['by']:
+            order = key.get('order', 'appearance')
+            if order == 'spec':
+                order = analysis['variables']
+            levels = relation.levels(key['variable'], order)
+            code_col = f"_{key['variable']}_order"
+            stats[code_col] = pd.Index(levels).get_indexer(stats[key['variable']])
+            sort_codes.append(code_col)
+        stats = stats.sort_values(sort_codes, kind='stable')
+
+        decimals = spec.get('decimals', 1)
+        table = pd.DataFrame({key['label']: stats[key['variable']].tolist() for key in spec['by']})
+        for column, statistic in spec['statistics'].items():
+            values = stats[statistic]
+            table[column] = values.astype(int).tolist() if statistic == 'count' else values.round(decimals).tolist()
+        table['Summary'] = [
+            spec['summary_cell'].format(n=int(n), mean=mean, sd=sd)
+            for n, mean, sd in zip(stats['count'], stats['mean'], stats['std'])
+        ]
+
+        stats = stats.drop(columns=sort_codes).reset_index(drop=True)
+
+    summary = spec['summary'].format(rows=len(table))
+    return TableResult(table, spec['display'], spec['title'], spec['subtitle'], summary,
+                       stats=stats)
+
+
+def run_baseline(plan, relation, totals):
+    spec = plan.spec
+    rows = []
+
+    for section in spec['sections']:
+        variable = section['variable']
+        label = section['label']
+
+        if section['type'] == 'continuous':
+            stats = relation.aggregate([ARM_VAR], 'statistics', variable).round(section.get('decimals', 1))
+            for arm in relation.levels(ARM_VAR, section.get('arm_order', 'sorted')):
+                rows.append({
+                    'Characteristic': f'{label} - {arm}',
+                    'Statistic': section['format'].format(**stats.loc[arm].to_dict())
+                })
+        else:
+            counts = relation.aggregate([ARM_VAR, variable], 'records').unstack(variable, fill_value=0)
+            for arm in relation.levels(ARM_VAR, section.get('arm_order', 'appearance')):
+                arm_counts = counts.loc[arm]
+                total = int(arm_counts.sum())
+                parts = []
+                for level, level_label in section['levels'].items():
+                    n = int(arm_counts.get(level, 0))
+                    parts.append(f"{level_label}: {_format_n_pct(n, total)}")
+                rows.append({'Characteristic': f'{label} - {arm}', 'Statistic': ', '.join(parts)})
+
+    table = pd.DataFrame(rows, columns=['Characteristic', 'Statistic'])
+    summary = spec['summary'].format(rows=len(table), records=len(relation))
+    return TableResult(table, list(table.columns), spec['title'], spec['subtitle'], summary)
+
+
+def run_grades(plan, relation, totals):
+    """Worst-grade table: per term, the graded subjects and n (%) at each grade by arm
+
+    Percentages are of the subjects graded for the term in each arm.
+    """
+    spec = plan.spec
+    source = spec['grading']
+    labels = spec.get('labels', {})
+    term_label = labels.get('term', 'Term')
+    grade_label = labels.get('grade', 'Grade')
+    cells = spec.get('cells', {'text': '{arm}'})
+
+    grading = lab_grading.get_grading(source.get('criteria'))
+    counts = relation.grade_counts(grading, source['test'], source.get('unit'), source['value'])
+    arms = relation.levels(ARM_VAR, 'sorted')
+    graded_terms = set(counts.index.get_level_values('term'))
+
+    rows, stats = [], []
+    for criterion in grading.criteria:
+        if criterion.term not in graded_terms:
+            continue
+        by_grade = counts.xs(criterion.term, level='term').unstack(ARM_VAR)
+        by_grade = by_grade.reindex(index=range(criterion.max_grade + 1), columns=arms).fillna(0).astype(int)
+        graded = by_grade.sum()
+
+        block = [('Subjects graded', None)]
+        block += [(f'Grade {grade}', by_grade.loc[grade]) for grade in by_grade.index]
+        block += [(combined['label'], by_grade.loc[combined['from']:].sum())
+                  for combined in spec.get('combined', []) if combined['from'] <= criterion.max_grade]
+        for grade, n in block:
+            row = {term_label: criterion.term, grade_label: grade}
+            for arm in arms:
+                total = int(graded[arm])
+                if n is None:
+                    row[cells['text'].format(arm=arm)] = str(total)
+                    continue
+                row[cells['text'].format(arm=arm)] = _format_n_pct(int(n[arm]), total) if total else "0 (0.0%)"
+                stats.append({'variable': criterion.term, 'level': grade, ARM_VAR: arm,
+                              'n': int(n[arm]), 'N': total})
+            rows.append(row)
+
+    columns = [term_label, grade_label] + [cells['text'].format(arm=arm) for arm in arms]
+    table = pd.DataFrame(rows, columns=columns)
+    summary = spec['summary'].format(rows=len(table), terms=len(graded_terms))
+    return TableResult(table, columns, spec['title'], spec['subtitle'], summary,
+                       stats=pd.DataFrame(stats, columns=['variable', 'level', ARM_VAR, 'n', 'N']))
+
+
+EXECUTORS = {
+    'incidence': run_incidence,
+    'descriptive': run_descriptive,
+    'baseline': run_baseline,
+    'grades': run_grades,
+}
+
+TABLE_SPECS = load_specs()
+PLANS = compile_specs(TABLE_SPECS)
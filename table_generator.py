@@ -1,403 +1,302 @@
 import pandas as pd
 import numpy as np
 from datetime import datetime
+import json
 import os
 
+import analysis_cube
+import figure_data
+import filter_language
+import result_cache
+import result_store
+import table_engine
+import sql_backend
+import study_registry
+import subgroup_analysis
+from subject_sets import SubjectIndex, SubjectSet
+
+# Dataset attribute name -> CSV file in the data directory
+DATASETS = {
+    'demographics': 'demographics.csv',
+    'adverse_events': 'adverse_events.csv',
+    'vital_signs': 'vital_signs.csv',
+    'laboratory': 'laboratory.csv',
+    'conmed': 'concomitant_medications.csv',
+    'disposition': 'disposition.csv',
+}
+
+def result_manifest(study, kind, name, filters=None, options=None, backend='pandas', cubes=False):
+    """Manifest of a result without loading any data (see result_store)"""
+    data_path = study_registry.get_registry().data_path(study)
+    return result_store.build_manifest(
+        kind, name, filter_language.compile_filters(filters).tree, options,
+        {study: result_store.input_hashes(data_path, DATASETS)},
+        {'engine': backend, 'cubes': cubes},
+    )
+
 class TableGenerator:
     """Generate clinical trial safety and efficacy tables"""
     
-    def __init__(self):
-        self.data_path = 'data'
-        self.load_datasets()
-    
+    def __init__(self, backend=None, cubes=None, study=None):
+        self.study = study or study_registry.DEFAULT_STUDY
+        self.data_path = study_registry.get_registry().data_path(self.study)
+        self.backend = backend or os.environ.get('TABLE_BACKEND', 'pandas')
+        if cubes is None:
+            cubes = os.environ.get('TABLE_CUBES', '') not in ('', '0')
+        self.store = None
+        self.cubes = None
+        self.subjects = None
+        self._subject_codes = {}
+        self._population_sets = {}
+
+        if self.backend in sql_backend.SQL_BACKENDS:
+            self.store = sql_backend.get_store(self.data_path, DATASETS, engine=self.backend)
+        elif self.backend == 'pandas':
+            self.load_datasets()
+            if cubes:
+                self.cubes = analysis_cube.get_cubes(self, table_engine.PLANS, DATASETS)
+        else:
+            raise ValueError(f"Unknown table backend: {self.backend}")
+
     def load_datasets(self):
-        """Load all available datasets"""
+        """Load all available datasets (shared per study through the registry)"""
         try:
-            self.demographics = pd.read_csv(f'{self.data_path}/demographics.csv')
-            self.adverse_events = pd.read_csv(f'{self.data_path}/adverse_events.csv')
-            self.vital_signs = pd.read_csv(f'{self.data_path}/vital_signs.csv')
-            self.laboratory = pd.read_csv(f'{self.data_path}/laboratory.csv')
-            self.conmed = pd.read_csv(f'{self.data_path}/concomitant_medications.csv')
-            self.disposition = pd.read_csv(f'{self.data_path}/disposition.csv')
+            frames = study_registry.get_registry().datasets(self.study, DATASETS)
+            for name, frame in frames.items():
+                setattr(self, name, frame)
         except FileNotFoundError as e:
             print(f"Dataset file not found: {e}")
-    
+        if hasattr(self, 'demographics'):
+            self.subjects = SubjectIndex(self.demographics[table_engine.SUBJECT_VAR])
+
+    def get_domain(self, name):
+        """Return a loaded dataset by its DATASETS key"""
+        if name not in DATASETS:
+            raise ValueError(f"Unknown domain: {name}")
+        return getattr(self, name)
+
+    def distinct_values(self, name, column):
+        """Non-null distinct values of a dataset column, in first-appearance order"""
+        if self.store is not None:
+            return self.store.distinct_values(name, column)
+        frame = self.get_domain(name)
+        if column not in frame.columns:
+            return []
+        return list(frame[column].dropna().unique())
+
+    def subject_codes(self, name):
+        """Integer subject index of every row of a loaded dataset (cached)"""
+        if name not in self._subject_codes:
+            self._subject_codes[name] = self.subjects.codes(
+                self.get_domain(name)[table_engine.SUBJECT_VAR]
+            )
+        return self._subject_codes[name]
+
+    def population_set(self, filters):
+        """SubjectSet of demographics subjects matching filters (memoized per filter)"""
+        compiled = filter_language.compile_filters(filters)
+        if compiled.key not in self._population_sets:
+            mask = compiled.mask(self.demographics)
+            if mask is None:
+                subjects = SubjectSet.full(self.subjects.universe)
+            else:
+                subjects = SubjectSet.from_mask(mask)
+            self._population_sets[compiled.key] = subjects
+        return self._population_sets[compiled.key]
+
+    def subject_set(self, query):
+        """Evaluate a subject-set query to a SubjectSet
+
+        A query is either a leaf {"domain": <dataset>, "filters": {...}} -
+        subjects with at least one matching record (domain defaults to
+        demographics) - or {"all": [...]}, {"any": [...]} or {"not": query}.
+        """
+        if self.subjects is None:
+            raise ValueError("Subject queries require the pandas backend")
+        if not isinstance(query, dict):
+            raise ValueError("Subject query must be an object")
+        if 'all' in query or 'any' in query:
+            parts = [self.subject_set(part) for part in query.get('all', query.get('any'))]
+            if not parts:
+                raise ValueError("Subject query 'all'/'any' needs at least one term")
+            result = parts[0]
+            for part in parts[1:]:
+                result = result & part if 'all' in query else result | part
+            return result
+        if 'not' in query:
+            return ~self.subject_set(query['not'])
+        domain = query.get('domain', 'demographics')
+        if domain == 'demographics':
+            return self.population_set(query.get('filters'))
+        return table_engine.domain_subjects(self, domain, query.get('filters'))
+
+    def relation(self, plan, filters, extra_columns=()):
+        """Filtered relation for a query plan on the configured backend"""
+        if self.store is not None:
+            return self.store.relation(plan, filters, extra_columns)
+        if self.cubes is not None:
+            relation = self.cubes.relation(plan, filters, extra_columns)
+            if relation is not None:
+                return relation
+        return table_engine.FrameRelation(
+            table_engine.prepare_frame(plan, self, filters, extra_columns)
+        )
+
+    def population_counts(self, filters, subgroup=None):
+        """Number of subjects per treatment arm after filtering"""
+        if self.store is not None:
+            return self.store.population_counts(filters, subgroup)
+        if self.cubes is not None:
+            counts = self.cubes.population_counts(filters, subgroup)
+            if counts is not None:
+                return counts
+        return table_engine.population_counts(self, filters, subgroup)
+
     def apply_filters(self, df, filters):
-        """Apply filters to dataframe"""
-        filtered_df = df.copy()
-        
-        if 'treatment' in filters and filters['treatment']:
-            filtered_df = filtered_df[filtered_df['TRT'].isin(filters['treatment'])]
-        
-        if 'sex' in filters and filters['sex']:
-            if 'SEX' in filtered_df.columns:
-                filtered_df = filtered_df[filtered_df['SEX'].isin(filters['sex'])]
-        
-        if 'age_min' in filters and filters['age_min']:
-            if 'AGE' in filtered_df.columns:
-                filtered_df = filtered_df[filtered_df['AGE'] >= filters['age_min']]
-        
-        if 'age_max' in filters and filters['age_max']:
-            if 'AGE' in filtered_df.columns:
-                filtered_df = filtered_df[filtered_df['AGE'] <= filters['age_max']]
-                
-        return filtered_df
+        """Apply filters to dataframe (see filter_language for the syntax)"""
+        return filter_language.compile_filters(filters).apply(df)
     
-    def generate_adverse_events_table(self, filters=None):
-        """Generate adverse events summary table"""
-        if filters is None:
-            filters = {}
-        
-        # Merge with demographics for filtering
-        ae_with_demo = self.adverse_events.merge(
-            self.demographics[['SUBJID', 'SEX', 'AGE']], 
-            on='SUBJID', 
-            how='left'
+    def generate_table(self, table_type, filters=None):
+        """Generate any table described by a spec in table_specs/
+
+        Results carry a manifest and are cached in memory (result_cache) and
+        on disk under the manifest key (result_store).
+        """
+        plan = self._plan(table_type)
+        return self._cached(
+            self.result_key(table_type, filters),
+            lambda: self.manifest('table', table_type, filters),
+            lambda: self._result_to_dict(table_engine.execute(plan, self, filters)),
         )
-        
-        filtered_df = self.apply_filters(ae_with_demo, filters)
-        
-        # Count total subjects per treatment
-        total_subjects = self.demographics.groupby('TRT').size().to_dict()
-        if filters:
-            demo_filtered = self.apply_filters(self.demographics, filters)
-            total_subjects = demo_filtered.groupby('TRT').size().to_dict()
-        
-        # Generate summary by AE term and treatment
-        ae_summary = []
-        
-        for ae_term in filtered_df['AETERM'].unique():
-            ae_data = filtered_df[filtered_df['AETERM'] == ae_term]
-            
-            row = {'AE_Term': ae_term}
-            
-            for trt in sorted(filtered_df['TRT'].unique()):
-                trt_data = ae_data[ae_data['TRT'] == trt]
-                n_subjects_with_ae = len(trt_data['SUBJID'].unique())
-                total_n = total_subjects.get(trt, 0)
-                
-                if total_n > 0:
-                    percentage = (n_subjects_with_ae / total_n) * 100
-                    row[f'{trt}_n'] = n_subjects_with_ae
-                    row[f'{trt}_total'] = total_n
-                    row[f'{trt}_percent'] = f"{n_subjects_with_ae} ({percentage:.1f}%)"
-                else:
-                    row[f'{trt}_percent'] = "0 (0.0%)"
-        
-            ae_summary.append(row)
-        
-        # Sort by most common AE
-        ae_summary_df = pd.DataFrame(ae_summary)
-        
-        # Calculate total subjects with AEs for sorting
-        total_ae_counts = []
-        for _, row in ae_summary_df.iterrows():
-            total_count = sum([int(row[col].split(' ')[0]) for col in row.index if col.endswith('_percent')])
-            total_ae_counts.append(total_count)
-        
-        ae_summary_df['total_count'] = total_ae_counts
-        ae_summary_df = ae_summary_df.sort_values('total_count', ascending=False)
-        ae_summary_df = ae_summary_df.drop('total_count', axis=1)
-        
-        # Convert to HTML table
-        html_table = self._dataframe_to_html_table(
-            ae_summary_df, 
-            title="Adverse Events Summary Table",
-            subtitle=f"Number of Subjects (%) with Adverse Events"
+
+    def result_key(self, table_type, filters=None):
+        """Result cache key; changes whenever a dataset file changes"""
+        return (
+            self.study, self.backend, self.cubes is not None, table_type,
+            filter_language.compile_filters(filters).key,
+            analysis_cube.data_signature(self.data_path, DATASETS),
         )
-        
-        return {
-            'table_html': html_table,
-            'data': ae_summary_df.to_dict('records'),
-            'total_subjects': total_subjects,
-            'summary': f"Generated adverse events table with {len(ae_summary_df)} unique AE terms"
-        }
-    
-    def generate_demographics_table(self, filters=None):
-        """Generate demographics summary table"""
+
+    def manifest(self, kind, name, filters=None, options=None):
+        """Inputs, normalized filters, options and code version of one result"""
+        return result_manifest(self.study, kind, name, filters, options,
+                               self.backend, self.cubes is not None)
+
+    def _cached(self, key, manifest, compute):
+        """Result from memory, else from the result store, else computed and stored
+
+        Concurrent identical requests share one load/computation (see
+        result_cache.ResultCache.get_or_compute).
+        """
+        def load():
+            stamped = manifest()
+            store = result_store.get_store()
+            result = store.get(stamped['key'])
+            if result is None:
+                result = compute()
+                result['manifest'] = result_store.stamp(stamped, result)
+                store.put(stamped['key'], result)
+            return result
+
+        return dict(result_cache.get_cache().get_or_compute(key, load))
+
+    def generate_subgroup_tables(self, table_type, subgroups, filters=None):
+        """Generate a table for every level of each subgroup variable
+
+        Each subgroup variable costs one grouped pass over the data. Returns
+        the per-level tables, a combined HTML rendering and forest-plot data.
+        """
         if filters is None:
             filters = {}
-            
-        filtered_df = self.apply_filters(self.demographics, filters)
-        
-        demo_summary = []
-        
-        # Age statistics
-        age_stats = filtered_df.groupby('TRT')['AGE'].agg(['count', 'mean', 'std', 'min', 'max']).round(1)
-        
-        for trt in age_stats.index:
-            stats = age_stats.loc[trt]
-            demo_summary.append({
-                'Characteristic': f'Age - {trt}',
-                'Statistic': f"N={int(stats['count'])}, Mean±SD={stats['mean']}±{stats['std']}, Range={int(stats['min'])}-{int(stats['max'])}"
-            })
-        
-        # Sex distribution
-        sex_crosstab = pd.crosstab(filtered_df['TRT'], filtered_df['SEX'], margins=True)
-        
-        for trt in filtered_df['TRT'].unique():
-            trt_data = filtered_df[filtered_df['TRT'] == trt]
-            total = len(trt_data)
-            male_count = len(trt_data[trt_data['SEX'] == 'M'])
-            female_count = len(trt_data[trt_data['SEX'] == 'F'])
-            
-            demo_summary.append({
-                'Characteristic': f'Sex - {trt}',
-                'Statistic': f"Male: {male_count} ({male_count/total*100:.1f}%), Female: {female_count} ({female_count/total*100:.1f}%)"
-            })
-        
-        # BMI statistics
-        bmi_stats = filtered_df.groupby('TRT')['BMI'].agg(['mean', 'std']).round(1)
-        
-        for trt in bmi_stats.index:
-            stats = bmi_stats.loc[trt]
-            demo_summary.append({
-                'Characteristic': f'BMI - {trt}',
-                'Statistic': f"Mean±SD={stats['mean']}±{stats['std']}"
-            })
-        
-        demo_df = pd.DataFrame(demo_summary)
-        
-        html_table = self._dataframe_to_html_table(
-            demo_df,
-            title="Demographics Summary Table",
-            subtitle="Baseline Characteristics by Treatment Group"
+        plan = self._plan(table_type)
+        subgroups = list(subgroups)
+        return self._cached(
+            self.result_key(f"subgroups:{table_type}:{','.join(subgroups)}", filters),
+            lambda: self.manifest('subgroups', table_type, filters, {'subgroups': subgroups}),
+            lambda: self._subgroup_tables(plan, subgroups, filters),
         )
-        
+
+    def _subgroup_tables(self, plan, subgroups, filters):
+        tables = {}
+        forest = []
+        combined_html = ''
+        for subgroup in subgroups:
+            tables[subgroup] = []
+            for level, result in subgroup_analysis.run_subgroup(plan, self, filters, subgroup):
+                result.title = f"{result.title} - {subgroup}: {level}"
+                output = self._result_to_dict(result)
+                output['level'] = level
+                tables[subgroup].append(output)
+                combined_html += output['table_html']
+                forest.extend(subgroup_analysis.forest_data(plan, subgroup, level, result))
+
+        n_tables = sum(len(levels) for levels in tables.values())
         return {
-            'table_html': html_table,
-            'data': demo_df.to_dict('records'),
-            'summary': f"Generated demographics table for {len(filtered_df)} subjects"
+            'table_html': combined_html,
+            'subgroups': tables,
+            'forest': forest,
+            'summary': f"Generated {n_tables} subgroup tables across {len(subgroups)} subgroup variables"
         }
-    
-    def generate_vital_signs_table(self, filters=None):
-        """Generate vital signs summary table"""
-        if filters is None:
-            filters = {}
-            
-        vs_with_demo = self.vital_signs.merge(
-            self.demographics[['SUBJID', 'SEX', 'AGE']],
-            on='SUBJID',
-            how='left'
+
+    def generate_figure(self, figure, filters=None, options=None):
+        """Plot data for one figure (see figure_data), cached like tables"""
+        options = options or {}
+        return self._cached(
+            self.result_key(f"figure:{figure}:{json.dumps(options, sort_keys=True, default=str)}", filters),
+            lambda: self.manifest('figure', figure, filters, options),
+            lambda: dict(figure_data.build_figure(self, figure, filters, options), figure=figure),
         )
-        
-        filtered_df = self.apply_filters(vs_with_demo, filters)
-        
-        vs_summary = []
-        
-        for visit in filtered_df['VISIT'].unique():
-            visit_data = filtered_df[filtered_df['VISIT'] == visit]
-            
-            for vital in ['SBP', 'DBP', 'PULSE', 'TEMP']:
-                for trt in sorted(visit_data['TRT'].unique()):
-                    trt_data = visit_data[visit_data['TRT'] == trt][vital].dropna()
-                    
-                    if len(trt_data) > 0:
-                        vs_summary.append({
-                            'Visit': visit,
-                            'Vital_Sign': vital,
-                            'Treatment': trt,
-                            'N': len(trt_data),
-                            'Mean': round(trt_data.mean(), 1),
-                            'SD': round(trt_data.std(), 1),
-                            'Min': round(trt_data.min(), 1),
-                            'Max': round(trt_data.max(), 1),
-                            'Summary': f"N={len(trt_data)}, {trt_data.mean():.1f}±{trt_data.std():.1f}"
-                        })
-        
-        vs_df = pd.DataFrame(vs_summary)
-        
+
+    def _plan(self, table_type):
+        plan = table_engine.PLANS.get(table_type)
+        if plan is None:
+            raise ValueError(f"Invalid table type: {table_type}")
+        return plan
+
+    def _result_to_dict(self, result):
+        """Render a TableResult into the JSON payload returned by the API"""
         html_table = self._dataframe_to_html_table(
-            vs_df[['Visit', 'Vital_Sign', 'Treatment', 'Summary']],
-            title="Vital Signs Summary Table",
-            subtitle="Descriptive Statistics by Visit and Treatment"
+            result.frame[result.display_columns],
+            title=result.title,
+            subtitle=result.subtitle
         )
-        
-        return {
+
+        output = {
             'table_html': html_table,
-            'data': vs_df.to_dict('records'),
-            'summary': f"Generated vital signs table with {len(vs_df)} measurements"
+            'title': result.title,
+            'subtitle': result.subtitle,
+            'columns': list(result.display_columns),
+            'data': result.frame.to_dict('records'),
         }
-    
+        if result.total_subjects is not None:
+            output['total_subjects'] = result.total_subjects
+        output['summary'] = result.summary
+        return output
+
+    def generate_adverse_events_table(self, filters=None):
+        """Generate adverse events summary table"""
+        return self.generate_table('adverse_events', filters)
+
+    def generate_demographics_table(self, filters=None):
+        """Generate demographics summary table"""
+        return self.generate_table('demographics', filters)
+
+    def generate_vital_signs_table(self, filters=None):
+        """Generate vital signs summary table"""
+        return self.generate_table('vital_signs', filters)
+
     def generate_laboratory_table(self, filters=None):
         """Generate laboratory values summary table"""
-        if filters is None:
-            filters = {}
-            
-        lab_with_demo = self.laboratory.merge(
-            self.demographics[['SUBJID', 'SEX', 'AGE']],
-            on='SUBJID',
-            how='left'
-        )
-        
-        filtered_df = self.apply_filters(lab_with_demo, filters)
-        
-        lab_summary = []
-        
-        for visit in filtered_df['VISIT'].unique():
-            visit_data = filtered_df[filtered_df['VISIT'] == visit]
-            
-            for test in visit_data['LBTEST'].unique():
-                test_data = visit_data[visit_data['LBTEST'] == test]
-                
-                for trt in sorted(test_data['TRT'].unique()):
-                    trt_data = test_data[test_data['TRT'] == trt]['LBVAL'].dropna()
-                    
-                    if len(trt_data) > 0:
-                        lab_summary.append({
-                            'Visit': visit,
-                            'Lab_Test': test,
-                            'Treatment': trt,
-                            'N': len(trt_data),
-                            'Mean': round(trt_data.mean(), 2),
-                            'SD': round(trt_data.std(), 2),
-                            'Summary': f"N={len(trt_data)}, {trt_data.mean():.2f}±{trt_data.std():.2f}"
-                        })
-        
-        lab_df = pd.DataFrame(lab_summary)
-        
-        html_table = self._dataframe_to_html_table(
-            lab_df[['Visit', 'Lab_Test', 'Treatment', 'Summary']],
-            title="Laboratory Values Summary Table",
-            subtitle="Descriptive Statistics by Visit and Treatment"
-        )
-        
-        return {
-            'table_html': html_table,
-            'data': lab_df.to_dict('records'),
-            'summary': f"Generated laboratory table with {len(lab_df)} test results"
-        }
-    
+        return self.generate_table('laboratory', filters)
+
     def generate_conmed_table(self, filters=None):
         """Generate concomitant medications table"""
-        if filters is None:
-            filters = {}
-            
-        conmed_with_demo = self.conmed.merge(
-            self.demographics[['SUBJID', 'SEX', 'AGE']],
-            on='SUBJID',
-            how='left'
-        )
-        
-        filtered_df = self.apply_filters(conmed_with_demo, filters)
-        
-        # Count total subjects per treatment
-        total_subjects = self.demographics.groupby('TRT').size().to_dict()
-        if filters:
-            demo_filtered = self.apply_filters(self.demographics, filters)
-            total_subjects = demo_filtered.groupby('TRT').size().to_dict()
-        
-        conmed_summary = []
-        
-        for medication in filtered_df['CMTRT'].unique():
-            med_data = filtered_df[filtered_df['CMTRT'] == medication]
-            
-            row = {'Medication': medication}
-            
-            for trt in sorted(filtered_df['TRT'].unique()):
-                trt_data = med_data[med_data['TRT'] == trt]
-                n_subjects_with_med = len(trt_data['SUBJID'].unique())
-                total_n = total_subjects.get(trt, 0)
-                
-                if total_n > 0:
-                    percentage = (n_subjects_with_med / total_n) * 100
-                    row[f'{trt}'] = f"{n_subjects_with_med} ({percentage:.1f}%)"
-                else:
-                    row[f'{trt}'] = "0 (0.0%)"
-            
-            conmed_summary.append(row)
-        
-        conmed_df = pd.DataFrame(conmed_summary)
-        
-        html_table = self._dataframe_to_html_table(
-            conmed_df,
-            title="Concomitant Medications Table",
-            subtitle="Number of Subjects (%) Taking Concomitant Medications"
-        )
-        
-        return {
-            'table_html': html_table,
-            'data': conmed_df.to_dict('records'),
-            'total_subjects': total_subjects,
-            'summary': f"Generated concomitant medications table with {len(conmed_df)} medications"
-        }
-    
+        return self.generate_table('concomitant_meds', filters)
+
     def generate_disposition_table(self, filters=None):
         """Generate subject disposition table"""
-        if filters is None:
-            filters = {}
-            
-        disp_with_demo = self.disposition.merge(
-            self.demographics[['SUBJID', 'SEX', 'AGE']],
-            on='SUBJID',
-            how='left'
-        )
-        
-        filtered_df = self.apply_filters(disp_with_demo, filters)
-        
-        # Count total subjects per treatment
-        total_subjects = self.demographics.groupby('TRT').size().to_dict()
-        if filters:
-            demo_filtered = self.apply_filters(self.demographics, filters)
-            total_subjects = demo_filtered.groupby('TRT').size().to_dict()
-        
-        disp_summary = []
-        
-        for disposition in filtered_df['DSDECOD'].unique():
-            disp_data = filtered_df[filtered_df['DSDECOD'] == disposition]
-            
-            row = {'Disposition': disposition}
-            
-            for trt in sorted(filtered_df['TRT'].unique()):
-                trt_data = disp_data[disp_data['TRT'] == trt]
-                n_subjects = len(trt_data)
-                total_n = total_subjects.get(trt, 0)
-                
-                if total_n > 0:
-                    percentage = (n_subjects / total_n) * 100
-                    row[f'{trt}'] = f"{n_subjects} ({percentage:.1f}%)"
-                else:
-                    row[f'{trt}'] = "0 (0.0%)"
-            
-            disp_summary.append(row)
-        
-        # Add reasons for discontinuation
-        discontinued_data = filtered_df[filtered_df['DSDECOD'] == 'Discontinued']
-        if not discontinued_data.empty:
-            for reason in discontinued_data['DSTERM'].unique():
-                if reason != 'Study Completion':
-                    reason_data = discontinued_data[discontinued_data['DSTERM'] == reason]
-                    
-                    row = {'Disposition': f'  {reason}'}
-                    
-                    for trt in sorted(filtered_df['TRT'].unique()):
-                        trt_data = reason_data[reason_data['TRT'] == trt]
-                        n_subjects = len(trt_data)
-                        total_n = total_subjects.get(trt, 0)
-                        
-                        if total_n > 0:
-                            percentage = (n_subjects / total_n) * 100
-                            row[f'{trt}'] = f"{n_subjects} ({percentage:.1f}%)"
-                        else:
-                            row[f'{trt}'] = "0 (0.0%)"
-                    
-                    disp_summary.append(row)
-        
-        disp_df = pd.DataFrame(disp_summary)
-        
-        html_table = self._dataframe_to_html_table(
-            disp_df,
-            title="Subject Disposition Table",
-            subtitle="Number of Subjects (%) by Disposition Status"
-        )
-        
-        return {
-            'table_html': html_table,
-            'data': disp_df.to_dict('records'),
-            'total_subjects': total_subjects,
-            'summary': f"Generated disposition table for {sum(total_subjects.values())} subjects"
-        }
-    
+        return self.generate_table('disposition', filters)
+
     def _dataframe_to_html_table(self, df, title="", subtitle=""):
         """Convert pandas DataFrame to formatted HTML table"""
         
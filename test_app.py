@@ -107,15 +107,8 @@ def full_app():
 @app.route('/api/tables')
 def get_available_tables():
     """Get list of available table types"""
-    tables = {
-        'adverse_events': 'Adverse Events Summary',
-        'demographics': 'Demographics Table', 
-        'vital_signs': 'Vital Signs Summary',
-        'laboratory': 'Laboratory Values Summary',
-        'concomitant_meds': 'Concomitant Medications',
-        'disposition': 'Subject Disposition'
-    }
-    return jsonify(tables)
+    import table_engine
+    return jsonify(table_engine.available_tables())
 
 @app.route('/api/datasets')
 def get_datasets():
@@ -143,6 +136,9 @@ def get_datasets():
 @app.route('/api/generate_table', methods=['POST'])
 def generate_table():
     """Generate the requested table"""
+    import filter_language
+    import table_engine
+
     try:
         from table_generator import TableGenerator
         
@@ -152,23 +148,16 @@ def generate_table():
         
         generator = TableGenerator()
         
-        if table_type == 'adverse_events':
-            result = generator.generate_adverse_events_table(filters)
-        elif table_type == 'demographics':
-            result = generator.generate_demographics_table(filters)
-        elif table_type == 'vital_signs':
-            result = generator.generate_vital_signs_table(filters)
-        elif table_type == 'laboratory':
-            result = generator.generate_laboratory_table(filters)
-        elif table_type == 'concomitant_meds':
-            result = generator.generate_conmed_table(filters)
-        elif table_type == 'disposition':
-            result = generator.generate_disposition_table(filters)
-        else:
+        if table_type not in table_engine.PLANS:
             return jsonify({'error': 'Invalid table type'}), 400
+
+        result = generator.generate_table(table_type, filters)
             
         return jsonify(result)
         
+    except filter_language.FilterError as e:
+        return jsonify({'error': str(e)}), 400
+
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -0,0 +1,22 @@
+import atexit
+import os
+import shutil
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Results and column stores stay off disk; set before the modules read them
+os.environ.setdefault('RESULT_STORE', '')
+os.environ.setdefault('STUDY_MMAP', '0')
+
+# The default study reads a copy of data/, so SQL databases and column
+# stores built by the tests are never written into the repository
+_DATA_COPY = tempfile.mkdtemp(prefix='study-data-')
+for _name in os.listdir(os.path.join(ROOT, 'data')):
+    if _name.endswith('.csv'):
+        shutil.copy(os.path.join(ROOT, 'data', _name), _DATA_COPY)
+os.environ['STUDY_DATA'] = _DATA_COPY
+atexit.register(shutil.rmtree, _DATA_COPY, ignore_errors=True)
+
+sys.path.insert(0, ROOT)
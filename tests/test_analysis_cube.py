@@ -0,0 +1,49 @@
+import threading
+import time
+
+import analysis_cube
+import table_engine
+from table_generator import DATASETS, TableGenerator
+
+
+def test_concurrent_first_requests_build_cubes_once(tmp_path, monkeypatch):
+    builds = []
+
+    class SlowCubeSet:
+        def __init__(self, generator, plans):
+            builds.append(threading.get_ident())
+            time.sleep(0.2)
+
+    monkeypatch.setattr(analysis_cube, 'CubeSet', SlowCubeSet)
+    generator = TableGenerator(cubes=False)
+    generator.data_path = str(tmp_path)
+    results = []
+
+    def request():
+        results.append(analysis_cube.get_cubes(generator, table_engine.PLANS, DATASETS))
+
+    threads = [threading.Thread(target=request) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(timeout=10)
+    assert len(builds) == 1
+    assert len(results) == 4 and all(cubes is results[0] for cubes in results)
+
+    # Forgetting the directory (e.g. study eviction) builds again on next use
+    analysis_cube.drop_cubes(str(tmp_path))
+    assert analysis_cube.get_cubes(generator, table_engine.PLANS, DATASETS) is not results[0]
+    assert len(builds) == 2
+
+
+def test_cubes_are_rebuilt_when_the_data_changes(tmp_path, monkeypatch):
+    monkeypatch.setattr(analysis_cube, 'CubeSet', lambda generator, plans: object())
+    generator = TableGenerator(cubes=False)
+    generator.data_path = str(tmp_path)
+    datasets = {'demographics': 'demographics.csv'}
+    (tmp_path / 'demographics.csv').write_text('SUBJID\nS1\n')
+
+    first = analysis_cube.get_cubes(generator, table_engine.PLANS, datasets)
+    assert analysis_cube.get_cubes(generator, table_engine.PLANS, datasets) is first
+    (tmp_path / 'demographics.csv').write_text('SUBJID\nS1\nS2\n')
+    assert analysis_cube.get_cubes(generator, table_engine.PLANS, datasets) is not first
@@ -0,0 +1,107 @@
+import json
+import os
+
+import pytest
+
+import batch_runner
+import table_engine
+
+TABLES = ['demographics', 'disposition']
+POPULATIONS = {'all': {}, 'women': {'sex': ['F']}}
+
+
+def write_batch(tmp_path, **batch):
+    path = tmp_path / 'batch.json'
+    path.write_text(json.dumps(batch))
+    return str(path)
+
+
+def run(tmp_path, batch, *args):
+    return batch_runner.main([batch, '--output', str(tmp_path / 'out'), '--workers', '1', *args])
+
+
+def test_load_batch_applies_defaults(tmp_path):
+    batch = batch_runner.load_batch(write_batch(tmp_path))
+    assert batch['tables'] == list(table_engine.PLANS)
+    assert batch['formats'] == list(batch_runner.FORMATS)
+    assert batch['populations'] == {'all': {}}
+    assert batch['studies'] == ['default']
+
+
+@pytest.mark.parametrize('batch, message', [
+    ({'tables': ['nope']}, 'Unknown tables'),
+    ({'formats': ['pdf']}, 'Unknown formats'),
+    ({'populations': {'a/b': {}}}, 'Names must be'),
+    ({'populations': {'bad': {'where': {'column': 'AGE', 'eq': 'x'}}}}, "Population 'bad'"),
+    ({'populations': {'bad': {'where': {'column': 'NOPE', 'eq': 'x'}}}}, "Population 'bad'"),
+])
+def test_load_batch_rejects_invalid_batches(tmp_path, batch, message):
+    with pytest.raises(ValueError, match=message):
+        batch_runner.load_batch(write_batch(tmp_path, **batch))
+
+
+def test_bad_population_fails_the_run_before_any_table(tmp_path, capsys):
+    batch = write_batch(tmp_path, tables=TABLES,
+                        populations={'all': {}, 'bad': {'where': {'column': 'AGE', 'eq': 'x'}}})
+    assert run(tmp_path, batch) == 2
+    assert "Population 'bad'" in capsys.readouterr().out
+    assert not (tmp_path / 'out').exists()
+
+
+def test_unchanged_tables_are_skipped(tmp_path, capsys):
+    batch = write_batch(tmp_path, tables=TABLES, populations=POPULATIONS)
+    assert run(tmp_path, batch) == 0
+    assert '4 tables: 4 to generate, 0 unchanged' in capsys.readouterr().out
+    index = json.loads((tmp_path / 'out' / batch_runner.BATCH_INDEX).read_text())
+    assert sorted(index) == [f'default/{p}/{t}' for p in sorted(POPULATIONS) for t in TABLES]
+
+    assert run(tmp_path, batch) == 0
+    assert '4 tables: 0 to generate, 4 unchanged' in capsys.readouterr().out
+
+    # A missing output file, or --force, regenerates
+    os.remove(tmp_path / 'out' / 'default' / 'women' / 'demographics.rtf')
+    assert run(tmp_path, batch) == 0
+    assert '4 tables: 1 to generate, 3 unchanged' in capsys.readouterr().out
+    assert run(tmp_path, batch, '--force') == 0
+    assert '4 tables: 4 to generate, 0 unchanged' in capsys.readouterr().out
+
+
+RESULT = {
+    'title': 'Demographics & Baseline', 'subtitle': 'Safety {Population}',
+    'columns': ['Characteristic', 'Drug_A'],
+    'data': [{'Characteristic': 'Age (years) ≥ 65', 'Drug_A': '12 (24.0%)'},
+             {'Characteristic': 'Missing', 'Drug_A': None}],
+    'table_html': '<table class="clinical-table"></table>',
+}
+MANIFEST = {'generated_at': '2026-01-01T00:00:00+00:00', 'key': 'abc123'}
+
+
+def test_write_csv(tmp_path):
+    path = tmp_path / 'table.csv'
+    batch_runner.write_csv(RESULT, path)
+    assert path.read_text().splitlines() == [
+        'Characteristic,Drug_A', 'Age (years) ≥ 65,12 (24.0%)', 'Missing,']
+
+    batch_runner.write_csv(dict(RESULT, data=[]), path)
+    assert path.read_text().splitlines() == ['Characteristic,Drug_A']
+
+
+def test_write_html(tmp_path):
+    path = tmp_path / 'table.html'
+    batch_runner.write_html(RESULT, path, 'women <65', MANIFEST)
+    document = path.read_text(encoding='utf-8')
+    assert '<title>Demographics &amp; Baseline</title>' in document
+    assert 'women &lt;65' in document
+    assert 'Result key: abc123' in document
+    assert RESULT['table_html'] in document
+
+
+def test_write_rtf(tmp_path):
+    path = tmp_path / 'table.rtf'
+    batch_runner.write_rtf(RESULT, path, 'all', MANIFEST)
+    document = path.read_text(encoding='ascii')
+    assert document.startswith('{\\rtf1') and document.endswith('}')
+    assert 'Safety \\{Population\\}' in document
+    assert '\\b Characteristic\\b0' in document and '\\b Drug A\\b0' in document
+    assert 'Age (years) \\u8805? 65' in document
+    assert document.count('\\row') == 1 + len(RESULT['data'])
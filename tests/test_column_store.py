@@ -0,0 +1,158 @@
+import os
+import shutil
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import dataset_schema
+import study_registry
+from table_generator import DATASETS
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'data')
+
+SIGNATURE = [1_700_000_000.0, 1234]
+
+
+def sample_frame():
+    return pd.DataFrame({
+        'SUBJID': pd.Categorical(['S2', 'S1', None, 'S2'], categories=['S1', 'S2', 'S3']),
+        'SEV': pd.Categorical(['Mild', 'Severe', 'Mild', None], categories=['Mild', 'Severe'], ordered=True),
+        'AGE': np.array([30, 41, 52, 63], dtype=np.int8),
+        'SBP': np.array([120.5, np.nan, 118.0, 131.25], dtype=np.float32),
+        'DATE': pd.to_datetime(['2024-01-02', None, '2024-03-04', '2024-05-06']),
+        'NOTE': ['a', None, 'c', 'a'],
+    })
+
+
+def in_memory(frame):
+    """frame with mapped columns copied (assert_frame_equal rejects np.memmap)"""
+    columns = {}
+    for name in frame.columns:
+        values = frame[name].array
+        if isinstance(values, pd.Categorical):
+            values = pd.Categorical.from_codes(np.array(values.codes), dtype=values.dtype)
+        else:
+            values = np.array(values)
+        columns[name] = pd.Series(values)
+    return pd.DataFrame(columns)
+
+
+def versions(directory):
+    return sorted(os.listdir(directory))
+
+
+def test_round_trip_keeps_values_and_types(tmp_path):
+    frame = sample_frame()
+    directory = str(tmp_path / 'ae' / 'v1')
+    study_registry.spill_frame(frame, directory, SIGNATURE)
+
+    read = study_registry.read_spilled(directory, SIGNATURE)
+    pd.testing.assert_frame_equal(read, frame)
+    assert study_registry.mapped_nbytes(read) == 0
+
+    mapped = study_registry.read_spilled(directory, SIGNATURE, mmap=True)
+    pd.testing.assert_frame_equal(in_memory(mapped), frame)
+    assert study_registry._is_mapped(mapped['SUBJID'].array.codes)
+    assert study_registry._is_mapped(np.asarray(mapped['AGE'].array))
+    assert study_registry.mapped_nbytes(mapped) > 0
+
+
+def test_missing_stale_or_unreadable_store_reads_as_none(tmp_path):
+    directory = str(tmp_path / 'ae' / 'v1')
+    assert study_registry.read_spilled(directory, SIGNATURE) is None
+
+    study_registry.spill_frame(sample_frame(), directory, SIGNATURE)
+    assert study_registry.read_spilled(directory, [SIGNATURE[0], SIGNATURE[1] + 1]) is None
+
+    with open(os.path.join(directory, 'meta.json'), 'w') as f:
+        f.write('{not json')
+    assert study_registry.read_spilled(directory, SIGNATURE) is None
+
+
+def test_version_depends_on_signature_and_schema(monkeypatch):
+    version = study_registry.store_version('laboratory', SIGNATURE)
+    assert study_registry.store_version('laboratory', SIGNATURE) == version
+    assert study_registry.store_version('laboratory', [SIGNATURE[0] + 1, SIGNATURE[1]]) != version
+
+    schema = dict(dataset_schema.SCHEMAS['laboratory'], LBVAL='float32')
+    monkeypatch.setitem(dataset_schema.SCHEMAS, 'laboratory', schema)
+    assert study_registry.store_version('laboratory', SIGNATURE) != version
+
+
+def test_versions_are_renamed_into_place(tmp_path):
+    parent = tmp_path / 'ae'
+    directory = str(parent / 'v1')
+    study_registry.spill_frame(sample_frame(), directory, SIGNATURE)
+    assert versions(parent) == ['v1']
+
+    # Another process stored the same version first: its copy is kept
+    meta = os.path.join(directory, 'meta.json')
+    before = os.stat(meta).st_mtime_ns
+    study_registry.spill_frame(sample_frame().head(1), directory, SIGNATURE)
+    assert os.stat(meta).st_mtime_ns == before
+    assert len(study_registry.read_spilled(directory, SIGNATURE)) == 4
+    assert versions(parent) == ['v1']
+
+
+def test_failed_write_leaves_no_partial_version(tmp_path, monkeypatch):
+    parent = tmp_path / 'ae'
+    directory = str(parent / 'v1')
+
+    def full_disk(*args, **kwargs):
+        raise OSError("No space left on device")
+
+    monkeypatch.setattr(study_registry.np, 'save', full_disk)
+    with pytest.raises(OSError):
+        study_registry.spill_frame(sample_frame(), directory, SIGNATURE)
+    assert versions(parent) == []
+
+
+def test_remove_other_versions_spares_staging_directories(tmp_path):
+    for entry in ('old', 'current', '.tmp-writer'):
+        (tmp_path / entry).mkdir()
+    study_registry.remove_other_versions(str(tmp_path / 'current'))
+    assert versions(tmp_path) == ['.tmp-writer', 'current']
+
+
+@pytest.fixture
+def shared_study(tmp_path, monkeypatch):
+    monkeypatch.setattr(study_registry, 'SHARED_COLUMNS', True)
+    data_path = tmp_path / 'study'
+    data_path.mkdir()
+    for filename in DATASETS.values():
+        shutil.copy(os.path.join(DATA_DIR, filename), data_path / filename)
+    return data_path
+
+
+def registry_for(data_path):
+    return study_registry.StudyRegistry(root=str(data_path.parent / 'none'), default_data_path=str(data_path))
+
+
+def test_store_is_mapped_and_rebuilt_when_the_csv_changes(shared_study, monkeypatch):
+    store = shared_study / study_registry.SPILL_DIR / 'disposition'
+    registry = registry_for(shared_study)
+    frames = registry.datasets(study_registry.DEFAULT_STUDY, DATASETS)
+    assert all(study_registry.mapped_nbytes(frame) > 0 for frame in frames.values())
+    first = versions(store)
+    assert len(first) == 1
+
+    # A second worker maps the store without parsing any CSV
+    def no_parsing(*args, **kwargs):
+        raise AssertionError("CSV parsed although the column store is fresh")
+
+    with monkeypatch.context() as patch:
+        patch.setattr(study_registry.pd, 'read_csv', no_parsing)
+        other = registry_for(shared_study).datasets(study_registry.DEFAULT_STUDY, DATASETS)
+    pd.testing.assert_frame_equal(in_memory(other['disposition']), in_memory(frames['disposition']))
+
+    path = shared_study / DATASETS['disposition']
+    pd.read_csv(path).head(5).to_csv(path, index=False)
+    os.utime(path, (os.path.getmtime(path) + 10,) * 2)
+    reloaded = registry.datasets(study_registry.DEFAULT_STUDY, DATASETS)['disposition']
+    assert len(reloaded) == 5
+    assert study_registry.mapped_nbytes(reloaded) > 0
+    # The new version replaced the old one; no staging directory is left
+    assert len(versions(store)) == 1 and versions(store) != first
+    # Unchanged datasets keep their version
+    assert len(versions(shared_study / study_registry.SPILL_DIR / 'adverse_events')) == 1
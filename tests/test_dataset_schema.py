@@ -0,0 +1,154 @@
+import os
+import shutil
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import dataset_schema
+import study_registry
+from subject_sets import SubjectIndex
+from table_generator import DATASETS
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'data')
+
+
+def typed(name, frame):
+    frame, problems = dataset_schema.apply_schema(name, frame)
+    assert problems == []
+    return frame
+
+
+def demographics(subjects=('S1', 'S2', 'S3')):
+    return typed('demographics', pd.DataFrame({
+        'SUBJID': list(subjects), 'TRT': ['Placebo', 'Drug', 'Drug'][:len(subjects)],
+        'AGE': [30, 40, 50][:len(subjects)], 'SEX': ['F', 'M', 'F'][:len(subjects)],
+        'RACE': ['White'] * len(subjects), 'WEIGHT': [60.0] * len(subjects),
+        'HEIGHT': [170.0] * len(subjects), 'COUNTRY': ['US'] * len(subjects),
+        'BMI': [21.0] * len(subjects),
+    }))
+
+
+def disposition(subjects):
+    return typed('disposition', pd.DataFrame({
+        'SUBJID': list(subjects), 'TRT': ['Drug'] * len(subjects),
+        'DSDECOD': ['Completed'] * len(subjects), 'DSTERM': ['Completed'] * len(subjects),
+    }))
+
+
+def test_shared_keys_are_the_cross_domain_categoricals():
+    assert dataset_schema.SHARED_KEYS == ('SUBJID', 'TRT', 'VISIT')
+
+
+def test_share_dictionaries_gives_every_domain_the_same_codes():
+    frames = {'demographics': demographics(), 'disposition': disposition(['S3', 'S1'])}
+    shared = dataset_schema.share_dictionaries(frames)
+
+    for column in ('SUBJID', 'TRT'):
+        assert shared['demographics'][column].dtype == shared['disposition'][column].dtype
+    # Values are unchanged; only their codes now agree across domains
+    assert shared['disposition']['SUBJID'].tolist() == ['S3', 'S1']
+    assert shared['disposition']['SUBJID'].cat.codes.tolist() == [2, 0]
+    # Frames already on the shared dictionary are not copied
+    assert shared['demographics'] is frames['demographics']
+
+
+def test_references_are_checked_on_present_values_only():
+    frames = dataset_schema.share_dictionaries(
+        {'demographics': demographics(), 'disposition': disposition(['S1'])})
+    # S2 and S3 are in disposition's dictionary but not in its rows
+    frames['demographics'] = demographics(['S1'])
+    assert dataset_schema.check_references(frames) == []
+
+    frames['disposition'] = disposition(['S1', 'S9'])
+    problems = dataset_schema.check_references(frames)
+    assert len(problems) == 1 and "1 rows for 1 subjects not in demographics" in problems[0]
+
+
+def test_subject_index_translates_shared_codes():
+    frames = dataset_schema.share_dictionaries({
+        'demographics': demographics(['S2', 'S3', 'S1']),
+        'disposition': disposition(['S1', 'S1', 'S3']),
+    })
+    index = SubjectIndex(frames['demographics']['SUBJID'])
+    codes = index.codes(frames['disposition']['SUBJID'])
+    assert codes.tolist() == [2, 2, 1]
+    assert np.array_equal(codes, index.codes(frames['disposition']['SUBJID'].astype(str)))
+    assert index.codes(pd.Series(['S9', 'S2'])).tolist() == [-1, 0]
+
+
+def test_apply_schema_types_every_column():
+    frame, problems = dataset_schema.apply_schema('adverse_events', pd.DataFrame({
+        'SUBJID': ['S1', 'S2'], 'TRT': ['Drug', 'Drug'], 'AETERM': ['Rash', 'Nausea'],
+        'AESEV': ['Mild', 'Severe'], 'AEREL': ['Yes', 'No'], 'AESTDT': ['2024-01-02', None],
+        'AEENDT': ['2024-01-05', '2024-02-01'], 'AEOUT': ['Recovered', None], 'NOTE': ['a', 'b'],
+    }))
+    assert problems == []
+    assert isinstance(frame['AETERM'].dtype, pd.CategoricalDtype)
+    assert frame['AESTDT'].dtype.kind == 'M'
+    assert frame['AESTDT'].isna().tolist() == [False, True]
+    # Unlisted columns are kept as read
+    assert frame['NOTE'].tolist() == ['a', 'b']
+
+    frame = demographics()
+    assert frame['AGE'].dtype == np.int8
+    assert frame['WEIGHT'].dtype == np.float32
+
+    raw = pd.DataFrame({'X': ['1']})
+    assert dataset_schema.apply_schema('unknown', raw) == (raw, [])
+
+
+def test_integer_column_with_missing_values_becomes_float():
+    series, problem = dataset_schema.coerce_column(pd.Series([30, None, 41]), 'integer')
+    assert problem is None
+    assert series.dtype == np.float32 and series.isna().tolist() == [False, True, False]
+
+
+def test_apply_schema_reports_every_problem():
+    _, problems = dataset_schema.apply_schema('demographics', pd.DataFrame({
+        'SUBJID': ['S1', 'S2', 'S3'], 'TRT': ['Drug'] * 3, 'AGE': [30, 40.5, 50],
+        'SEX': ['F', 'M', 'F'], 'WEIGHT': ['60', 'heavy', '?'],
+        'HEIGHT': [170.0] * 3, 'COUNTRY': ['US'] * 3, 'BMI': [21.0] * 3,
+    }))
+    assert problems == [
+        "demographics: missing column RACE",
+        "demographics.AGE: 1 values are not integers (e.g. 40.5)",
+        "demographics.WEIGHT: 2 values are not numeric (e.g. 'heavy', '?')",
+    ]
+
+    _, problems = dataset_schema.apply_schema('conmed', pd.DataFrame({
+        'SUBJID': ['S1', 'S2'], 'TRT': ['Drug'] * 2, 'CMTRT': ['Aspirin'] * 2, 'CMDOSE': ['1'] * 2,
+        'CMFREQ': ['QD'] * 2, 'CMSTDT': ['2024-01-02', '02/01/2024'],
+    }))
+    assert problems == ["conmed.CMSTDT: 1 values are not %Y-%m-%d dates (e.g. '02/01/2024')"]
+
+
+def test_check_references_reports_demographics_problems():
+    frames = {'demographics': demographics(['S1', 'S2', 'S1'])}
+    assert dataset_schema.check_references(frames) == ["demographics: 1 duplicate SUBJID values (e.g. 'S1')"]
+
+    frame = demographics(['S1', 'S2', 'S3'])
+    frame['SUBJID'] = frame['SUBJID'].cat.remove_categories(['S2'])
+    assert dataset_schema.check_references({'demographics': frame}) == ["demographics: 1 rows without SUBJID"]
+    assert dataset_schema.check_references({'disposition': disposition(['S9'])}) == []
+
+
+def test_invalid_study_fails_to_load_with_every_problem(tmp_path):
+    study_dir = tmp_path / 'bad'
+    shutil.copytree(DATA_DIR, study_dir, ignore=shutil.ignore_patterns('.*', '*.sqlite'))
+    for name, column, value in (('vital_signs', 'SBP', 'high'), ('disposition', 'SUBJID', 'NOBODY')):
+        path = study_dir / DATASETS[name]
+        frame = pd.read_csv(path, dtype=str)
+        frame.loc[0, column] = value
+        frame.to_csv(path, index=False)
+    registry = study_registry.StudyRegistry(root=str(tmp_path), default_data_path=str(study_dir))
+
+    with pytest.raises(dataset_schema.SchemaError) as error:
+        registry.datasets('bad', DATASETS)
+    assert error.value.study == 'bad'
+    assert error.value.problems == [
+        "vital_signs.SBP: 1 values are not numeric (e.g. 'high')",
+        "disposition: 1 rows for 1 subjects not in demographics (e.g. 'NOBODY')",
+    ]
+    assert registry.studies['bad'].frames is None
+    assert not os.path.exists(study_dir / study_registry.SPILL_DIR)
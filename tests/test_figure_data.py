@@ -0,0 +1,42 @@
+import pytest
+
+import app
+
+
+@pytest.fixture
+def client():
+    return app.app.test_client()
+
+
+def figure(client, name, options):
+    return client.post('/api/figure_data', json={'figure': name, 'options': options})
+
+
+def test_spaghetti_unknown_parameter_is_empty(client):
+    response = figure(client, 'spaghetti', {'parameter': 'NOPE'})
+    assert response.status_code == 200
+    body = response.get_json()
+    assert body['parameter'] == 'NOPE'
+    assert body['subjects'] == [] and body['points_total'] == 0
+
+
+def test_spaghetti_known_parameter(client):
+    body = figure(client, 'spaghetti', {'parameter': 'ALT'}).get_json()
+    assert body['parameter'] == 'ALT' and body['subjects']
+
+
+@pytest.mark.parametrize('name,options', [
+    ('spaghetti', {'parameter': ['ALT']}),
+    ('mean_over_time', {'domain': 'laboratory', 'parameters': 'ALT'}),
+    ('mean_over_time', {'domain': 'laboratory', 'parameters': ['ALT', 3]}),
+    ('box_plot', {'parameters': 'A'}),
+])
+def test_parameter_options_are_type_checked(client, name, options):
+    response = figure(client, name, options)
+    assert response.status_code == 400
+    assert 'parameter' in response.get_json()['error']
+
+
+def test_mean_over_time_parameters_match_whole_names(client):
+    body = figure(client, 'mean_over_time', {'domain': 'laboratory', 'parameters': ['ALT']}).get_json()
+    assert {series['parameter'] for series in body['series']} == {'ALT'}
@@ -0,0 +1,97 @@
+import sqlite3
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import filter_language
+import sql_backend
+from table_generator import TableGenerator
+
+SEX_F = {'column': 'SEX', 'eq': 'F'}
+NAUSEA = {'column': 'AETERM', 'eq': 'Nausea'}
+DEMOGRAPHIC_COLUMNS = {'SUBJID', 'TRT', 'SEX', 'AGE'}
+
+NOT_AND = {'where': {'not': {'and': [SEX_F, NAUSEA]}}}
+OR = {'where': {'or': [SEX_F, NAUSEA]}}
+
+
+def bind(filters, columns=DEMOGRAPHIC_COLUMNS):
+    return filter_language.compile_filters(filters).bind(columns)
+
+
+def test_prune_drops_absent_and_terms():
+    assert bind({'where': {'and': [SEX_F, NAUSEA]}}) == {'column': 'SEX', 'op': 'eq', 'value': 'F'}
+
+
+def test_prune_drops_or_and_not_with_absent_columns_whole():
+    assert bind(NOT_AND) is None
+    assert bind(OR) is None
+    assert bind({'sex': ['F'], 'where': {'not': {'and': [SEX_F, NAUSEA]}}}) == \
+        {'column': 'SEX', 'op': 'in', 'value': ['F']}
+
+
+def test_prune_keeps_or_and_not_with_present_columns():
+    tree = {'or': [SEX_F, {'not': {'column': 'AGE', 'gt': 60}}]}
+    assert bind({'where': tree}) == filter_language.compile_filters({'where': tree}).tree
+
+
+def test_split_keeps_mixed_terms_together():
+    compiled = filter_language.compile_filters({'sex': ['F'], 'where': {'or': [SEX_F, NAUSEA]}})
+    subject, rows = compiled.split(DEMOGRAPHIC_COLUMNS)
+    assert subject.tree == {'column': 'SEX', 'op': 'in', 'value': ['F']}
+    assert rows.tree == filter_language.compile_filters(OR).tree
+
+
+@pytest.mark.parametrize('backend', ['pandas', 'sqlite'])
+@pytest.mark.parametrize('filters', [NOT_AND, OR], ids=['not_and', 'or'])
+def test_record_level_or_not_leaves_denominators_unfiltered(backend, filters):
+    generator = TableGenerator(backend=backend, cubes=False)
+    assert generator.population_counts(filters) == generator.population_counts({})
+
+    result = generator.generate_table('adverse_events', filters)
+    totals = generator.population_counts({})
+    for row in result['data']:
+        for arm, total in totals.items():
+            assert row[f'{arm}_total'] == total
+
+
+@pytest.mark.parametrize('backend', ['pandas', 'sqlite'])
+@pytest.mark.parametrize('table', ['adverse_events', 'concomitant_meds'])
+def test_start_date_shortcut_applies_to_each_domain(backend, table):
+    generator = TableGenerator(backend=backend, cubes=False)
+    assert generator.generate_table(table, {'start_date_from': '2999-01-01'})['data'] == []
+    assert generator.generate_table(table, {'start_date_to': '2999-01-01'})['data'] == \
+        generator.generate_table(table, {})['data']
+
+
+MISSING = pd.DataFrame({
+    'AEOUT': pd.Series(['Recovered', None, 'Unknown', None], dtype='category'),
+    'LBVAL': pd.array([50, None, 150, 80], dtype='Int64'),
+})
+
+
+@pytest.mark.parametrize('tree, expected', [
+    ({'column': 'AEOUT', 'eq': 'Recovered'}, [True, False, False, False]),
+    ({'column': 'AEOUT', 'ne': 'Recovered'}, [False, True, True, True]),
+    ({'column': 'AEOUT', 'in': ['Unknown']}, [False, False, True, False]),
+    ({'column': 'AEOUT', 'not_in': ['Unknown']}, [True, True, False, True]),
+    ({'not': {'column': 'AEOUT', 'eq': 'Recovered'}}, [False, True, True, True]),
+    ({'column': 'LBVAL', 'ne': 50}, [False, True, True, True]),
+    ({'not': {'column': 'LBVAL', 'gt': 60}}, [True, True, False, False]),
+    ({'not': {'and': [{'column': 'AEOUT', 'eq': 'Unknown'}, {'column': 'LBVAL', 'gt': 100}]}},
+     [True, True, False, True]),
+], ids=['eq', 'ne', 'in', 'not_in', 'not', 'ne_nullable', 'not_numeric', 'not_and'])
+def test_missing_values_match_only_negations_in_pandas_and_sql(tree, expected):
+    compiled = filter_language.compile_filters({'where': tree})
+    assert compiled.mask(MISSING).tolist() == expected
+
+    conn = sqlite3.connect(':memory:')
+    conn.execute("CREATE TABLE t (AEOUT TEXT, LBVAL REAL)")
+    conn.executemany("INSERT INTO t VALUES (?, ?)", [
+        (None if pd.isna(out) else out, None if pd.isna(value) else float(value))
+        for out, value in zip(MISSING['AEOUT'], MISSING['LBVAL'])
+    ])
+    clause, params = sql_backend.expression_to_sql(compiled.tree)
+    rows = conn.execute(f"SELECT rowid - 1 FROM t WHERE {clause}", params).fetchall()
+    assert np.isin(np.arange(len(MISSING)), [row[0] for row in rows]).tolist() == expected
@@ -0,0 +1,57 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import lab_grading
+
+ALT = {'term': 'ALT increased', 'test': 'ALT', 'unit': 'U/L',
+       'direction': 'high', 'uln': 40, 'multiples': [1, 3, 5, 20]}
+HYPOGLYCEMIA = {'term': 'Hypoglycemia', 'test': 'Glucose', 'unit': 'mg/dL',
+                'direction': 'low', 'edges': [70, 55, 40, 30]}
+
+
+def grades(entry, values):
+    return lab_grading.Criterion(entry).grade(np.asarray(values, dtype=np.float64)).tolist()
+
+
+def test_high_grade_boundaries():
+    # ULN 40: grade 1 is > ULN - 3x, grade 2 > 3x - 5x, grade 3 > 5x - 20x, grade 4 > 20x
+    assert grades(ALT, [39.9, 40, 40.01, 120, 120.01, 200, 200.01, 800, 800.01]) == \
+        [0, 0, 1, 1, 2, 2, 3, 3, 4]
+
+
+def test_low_grade_boundaries():
+    # LLN 70: grade 1 is < LLN - 55, grade 2 < 55 - 40, grade 3 < 40 - 30, grade 4 < 30
+    assert grades(HYPOGLYCEMIA, [70.1, 70, 69.99, 55, 54.99, 40, 39.99, 30, 29.99]) == \
+        [0, 0, 1, 1, 2, 2, 3, 3, 4]
+
+
+@pytest.mark.parametrize('entry', [
+    dict(ALT, multiples=[3, 1, 5, 20]),
+    dict(HYPOGLYCEMIA, edges=[30, 40, 55, 70]),
+    dict(ALT, direction='up'),
+])
+def test_invalid_criteria_are_rejected(entry):
+    with pytest.raises(ValueError):
+        lab_grading.Criterion(entry)
+
+
+def test_worst_grade_counts_take_each_subjects_worst_record():
+    grading = lab_grading.Grading([lab_grading.Criterion(ALT), lab_grading.Criterion(HYPOGLYCEMIA)])
+    records = pd.DataFrame({
+        'SUBJID': ['S1', 'S1', 'S2', 'S3', 'S3', 'S4'],
+        'TRT': ['A', 'A', 'A', 'B', 'B', 'B'],
+        'LBTEST': ['ALT', 'ALT', 'ALT', 'ALT', 'Glucose', 'ALT'],
+        'LBUNIT': ['U/L', 'U/L', 'U/L', 'U/L', 'mg/dL', 'IU/mL'],
+        'LBVAL': [130, 41, 20, np.nan, 50, 900],
+    })
+    counts = lab_grading.worst_grade_counts(
+        grading, records['SUBJID'], records['TRT'], records['LBTEST'],
+        records['LBUNIT'], records['LBVAL'],
+    )
+    # S4's unit has no criterion and S3's ALT has no value: neither is graded for ALT
+    assert counts.to_dict() == {
+        ('ALT increased', 'A', 0): 1,
+        ('ALT increased', 'A', 2): 1,
+        ('Hypoglycemia', 'B', 2): 1,
+    }
@@ -0,0 +1,35 @@
+import study_registry
+from live_updates import LiveHub
+
+
+def events(subscription):
+    names = []
+    while not subscription.events.empty():
+        names.append(subscription.events.get_nowait().split('\n', 1)[0])
+    return names
+
+
+def test_failed_refresh_is_retried_until_it_succeeds(monkeypatch):
+    hub = LiveHub()
+    subscription, _ = hub.subscribe(study_registry.DEFAULT_STUDY, 'demographics', {})
+    view = hub.views[subscription.view_key]
+    monkeypatch.setattr(hub, '_signature', lambda study, table_type: ('changed',))
+
+    attempts = []
+
+    def refresh(view):
+        attempts.append(1)
+        if len(attempts) < 3:
+            raise OSError("dataset is being written")
+
+    monkeypatch.setattr(hub, 'refresh', refresh)
+    hub.check_once()
+    hub.check_once()
+    assert view['signature'] != ('changed',)
+    # One refresh_error per failing signature, however many retries
+    assert events(subscription) == ['event: refresh_error']
+
+    hub.check_once()
+    assert view['signature'] == ('changed',)
+    hub.check_once()
+    assert len(attempts) == 3
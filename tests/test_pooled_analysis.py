@@ -0,0 +1,124 @@
+import os
+import re
+
+import pandas as pd
+import pytest
+
+import study_registry
+import table_engine
+from pooled_analysis import PooledTableGenerator, SharedDictionary
+from table_generator import DATASETS, TableGenerator
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'data')
+
+FILTER_SETS = [
+    {},
+    {'treatment': ['Drug A 20mg']},
+    {'sex': ['F'], 'where': {'column': 'AETERM', 'in': ['Nausea', 'Headache']}},
+]
+
+NUMBER = r'-?\d+(?:\.\d+)?'
+
+
+def register(tmp_path_factory, study, frames):
+    path = tmp_path_factory.mktemp(study)
+    for name, frame in frames.items():
+        frame.to_csv(path / DATASETS[name], index=False)
+    study_registry.get_registry().register(study, str(path))
+    return study
+
+
+def split_study(tmp_path_factory, respell=None):
+    """Register the sample data as two studies holding alternate subjects
+
+    Returns the two studies and a third holding their rows concatenated.
+    """
+    suffix = '_respelled' if respell else ''
+    data = {name: pd.read_csv(os.path.join(DATA_DIR, filename)) for name, filename in DATASETS.items()}
+    subjects = data['demographics']['SUBJID']
+    halves = [{name: frame[frame['SUBJID'].isin(set(part))] for name, frame in data.items()}
+              for part in (subjects[::2], subjects[1::2])]
+    concatenated = {name: pd.concat([half[name] for half in halves]) for name in data}
+    if respell:
+        halves[1] = {name: respell(frame) for name, frame in halves[1].items()}
+    studies = [register(tmp_path_factory, f'half{i}{suffix}', half) for i, half in enumerate(halves)]
+    return studies, register(tmp_path_factory, f'concatenated{suffix}', concatenated)
+
+
+@pytest.fixture(scope='module')
+def halves(tmp_path_factory):
+    return split_study(tmp_path_factory)
+
+
+def shout(frame):
+    """The second study spells treatments and terms in upper case"""
+    for column in ('TRT', 'AETERM', 'LBTEST'):
+        if column in frame:
+            frame = frame.assign(**{column: frame[column].str.upper()})
+    return frame
+
+
+@pytest.fixture(scope='module')
+def respelled_halves(tmp_path_factory):
+    return split_study(tmp_path_factory, respell=shout)
+
+
+def numbers(value):
+    """Text of a cell with its numbers taken out, and the numbers"""
+    text = str(value)
+    return re.sub(NUMBER, '#', text), [float(n) for n in re.findall(NUMBER, text)]
+
+
+def assert_same_table(pooled, single):
+    # Pooled means and SDs are merged from per-study moments, so they can
+    # differ from the concatenated study's in the last rounded digit
+    assert len(pooled['data']) == len(single['data'])
+    for pooled_row, single_row in zip(pooled['data'], single['data']):
+        assert pooled_row.keys() == single_row.keys()
+        for column in single_row:
+            pooled_text, pooled_numbers = numbers(pooled_row[column])
+            single_text, single_numbers = numbers(single_row[column])
+            assert pooled_text == single_text, (column, pooled_row, single_row)
+            assert pooled_numbers == pytest.approx(single_numbers, abs=0.011), (column, pooled_row, single_row)
+    assert pooled['columns'] == single['columns']
+    assert pooled.get('total_subjects') == single.get('total_subjects')
+
+
+@pytest.mark.parametrize('backend', ['pandas', 'pandas+cubes', 'sqlite'])
+def test_pooling_two_studies_equals_the_concatenated_study(halves, backend):
+    studies, concatenated = halves
+    engine, _, cubes = backend.partition('+')
+    pooled = PooledTableGenerator(studies, backend=engine, cubes=bool(cubes))
+    single = TableGenerator(backend=engine, cubes=bool(cubes), study=concatenated)
+    for table in table_engine.PLANS:
+        for filters in FILTER_SETS:
+            assert_same_table(pooled.generate_table(table, filters), single.generate_table(table, filters))
+
+
+def test_differently_spelled_levels_pool_into_one(respelled_halves):
+    # Synonyms pin the shared label to the original spelling for every level
+    synonyms = {}
+    for column, dataset in (('TRT', 'demographics'), ('AETERM', 'adverse_events'), ('LBTEST', 'laboratory')):
+        values = pd.read_csv(os.path.join(DATA_DIR, DATASETS[dataset]))[column].dropna().unique()
+        synonyms[column] = {value.upper(): value for value in values}
+    studies, concatenated = respelled_halves
+    pooled, single = PooledTableGenerator(studies, synonyms=synonyms), TableGenerator(study=concatenated)
+    for table in table_engine.PLANS:
+        for filters in FILTER_SETS:
+            assert_same_table(pooled.generate_table(table, filters), single.generate_table(table, filters))
+
+
+def test_shared_dictionary_uses_the_first_spelling():
+    dictionary = SharedDictionary()
+    dictionary.add('a', 'AETERM', ['Nausea', 'Dry  mouth'])
+    dictionary.add('b', 'AETERM', ['NAUSEA', 'dry mouth', 'Rash'])
+    assert dictionary.shared('b', 'AETERM', 'NAUSEA') == 'Nausea'
+    assert dictionary.shared('b', 'AETERM', 'Rash') == 'Rash'
+    assert dictionary.spellings('b', 'AETERM', 'Dry  mouth') == ['dry mouth']
+    assert dictionary.report() == {'AETERM': {'Nausea': {'a': ['Nausea'], 'b': ['NAUSEA']},
+                                              'Dry  mouth': {'a': ['Dry  mouth'], 'b': ['dry mouth']}}}
+
+
+def test_pooled_generator_needs_a_study():
+    with pytest.raises(ValueError):
+        PooledTableGenerator([])
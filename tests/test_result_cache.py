@@ -0,0 +1,103 @@
+import threading
+import time
+
+import pytest
+
+from result_cache import ResultCache
+
+CALLERS = 4
+
+
+def run_concurrently(cache, key, compute):
+    """get_or_compute from CALLERS threads at once: ([results], [exceptions])"""
+    results, errors = [], []
+
+    def call():
+        try:
+            results.append(cache.get_or_compute(key, compute))
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=call) for _ in range(CALLERS)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(timeout=10)
+    return results, errors
+
+
+def blocking(cache, outcome):
+    """compute() that returns (or raises) outcome once every caller is waiting on it"""
+    calls = []
+
+    def compute():
+        calls.append(1)
+        deadline = time.monotonic() + 5
+        while cache.coalesced < CALLERS - 1 and time.monotonic() < deadline:
+            time.sleep(0.001)
+        if isinstance(outcome, BaseException):
+            raise outcome
+        return outcome
+
+    return compute, calls
+
+
+def test_concurrent_misses_share_one_result():
+    cache = ResultCache()
+    payload = {'data': [1, 2, 3]}
+    compute, calls = blocking(cache, payload)
+
+    results, errors = run_concurrently(cache, 'key', compute)
+    assert not errors
+    assert len(calls) == 1
+    assert len(results) == CALLERS and all(result is payload for result in results)
+    assert cache.get('key') is payload
+    assert cache.in_flight() == 0
+
+
+def test_concurrent_misses_share_one_exception():
+    cache = ResultCache()
+    error = ValueError("bad table")
+    compute, calls = blocking(cache, error)
+
+    results, errors = run_concurrently(cache, 'key', compute)
+    assert not results
+    assert len(calls) == 1
+    assert len(errors) == CALLERS and all(e is error for e in errors)
+    assert 'key' not in cache
+    assert cache.in_flight() == 0
+
+
+def fail():
+    raise ValueError("bad table")
+
+
+def test_failed_key_is_computed_again():
+    cache = ResultCache()
+    with pytest.raises(ValueError):
+        cache.get_or_compute('key', fail)
+    assert cache.get_or_compute('key', lambda: {'data': []}) == {'data': []}
+
+
+def test_interrupted_leader_fails_waiters():
+    cache = ResultCache()
+    compute, _ = blocking(cache, KeyboardInterrupt())
+    results, errors = [], []
+
+    def call():
+        try:
+            results.append(cache.get_or_compute('key', compute))
+        except KeyboardInterrupt:
+            errors.append('interrupted')
+        except RuntimeError as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=call) for _ in range(CALLERS)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(timeout=10)
+    assert not results
+    assert errors.count('interrupted') == 1
+    assert sum(isinstance(e, RuntimeError) for e in errors) == CALLERS - 1
+    assert cache.in_flight() == 0
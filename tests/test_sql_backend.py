@@ -0,0 +1,98 @@
+import os
+import shutil
+import threading
+
+import pandas as pd
+
+import sql_backend
+import study_registry
+from table_generator import DATASETS, TableGenerator
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'data')
+
+
+def copy_data(tmp_path):
+    for filename in DATASETS.values():
+        shutil.copy(os.path.join(DATA_DIR, filename), tmp_path / filename)
+    return str(tmp_path)
+
+
+def row_count(store, name):
+    return store.fetchall(f"SELECT COUNT(*) FROM {name}")[0][0]
+
+
+def test_generators_share_one_store(tmp_path):
+    study_registry.get_registry().register('shared_store', copy_data(tmp_path))
+    first = TableGenerator(backend='sqlite', cubes=False, study='shared_store')
+    second = TableGenerator(backend='sqlite', cubes=False, study='shared_store')
+    assert first.store is second.store
+    assert os.path.exists(tmp_path / 'study.sqlite')
+
+
+def test_concurrent_imports_do_not_duplicate_rows(tmp_path):
+    data_path = copy_data(tmp_path)
+    # Separate stores have separate connections, like separate worker processes
+    stores, errors = [], []
+
+    def open_store():
+        try:
+            stores.append(sql_backend.SQLStore(data_path, DATASETS))
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=open_store) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert not errors
+
+    for name, filename in DATASETS.items():
+        expected = len(pd.read_csv(os.path.join(data_path, filename)))
+        assert all(row_count(store, name) == expected for store in stores)
+    for store in stores:
+        store.close()
+
+
+def test_store_reimports_changed_csv(tmp_path):
+    data_path = copy_data(tmp_path)
+    store = sql_backend.get_store(data_path, DATASETS)
+    before = row_count(store, 'disposition')
+
+    csv_path = os.path.join(data_path, DATASETS['disposition'])
+    frame = pd.read_csv(csv_path)
+    frame.head(5).to_csv(csv_path, index=False)
+    os.utime(csv_path, (os.path.getmtime(csv_path) + 10,) * 2)
+
+    assert sql_backend.get_store(data_path, DATASETS) is store
+    assert row_count(store, 'disposition') == 5 < before
+
+
+def test_store_reimports_csv_restored_with_an_older_mtime(tmp_path):
+    data_path = copy_data(tmp_path)
+    csv_path = os.path.join(data_path, DATASETS['disposition'])
+    original = pd.read_csv(csv_path)
+    os.utime(csv_path, (1_000_000_000,) * 2)
+    store = sql_backend.SQLStore(data_path, DATASETS)
+    assert row_count(store, 'disposition') == len(original)
+
+    # An older revision, copied in with its own (older) mtime preserved
+    original.head(5).to_csv(csv_path, index=False)
+    os.utime(csv_path, (900_000_000,) * 2)
+    store.refresh()
+    assert row_count(store, 'disposition') == 5
+    store.close()
+
+
+def test_store_recorded_without_sizes_is_reimported(tmp_path):
+    data_path = copy_data(tmp_path)
+    store = sql_backend.SQLStore(data_path, DATASETS)
+    store.conn.execute("DROP TABLE _sources")
+    store.conn.execute("CREATE TABLE _sources (name TEXT PRIMARY KEY, mtime DOUBLE)")
+    store.conn.execute("DELETE FROM disposition")
+    store.conn.commit()
+
+    store.refresh()
+    expected = len(pd.read_csv(os.path.join(data_path, DATASETS['disposition'])))
+    assert row_count(store, 'disposition') == expected
+    store.close()
@@ -0,0 +1,94 @@
+import os
+import shutil
+import threading
+
+import pandas as pd
+
+import study_registry
+from table_generator import DATASETS
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'data')
+
+
+def make_registry(tmp_path, studies=('a', 'b', 'c')):
+    """Registry over copies of the sample data, one subdirectory per study"""
+    root = tmp_path / 'studies'
+    for study in studies:
+        (root / study).mkdir(parents=True)
+        for filename in DATASETS.values():
+            shutil.copy(os.path.join(DATA_DIR, filename), root / study / filename)
+    return study_registry.StudyRegistry(root=str(root), default_data_path=str(root / studies[0]))
+
+
+def loaded(registry):
+    return [study for study in registry.studies if registry.studies[study].frames is not None]
+
+
+def test_memory_budget_evicts_least_recently_used_studies(tmp_path):
+    registry = make_registry(tmp_path)
+    registry.datasets('a', DATASETS)
+    # Room for two studies
+    registry.memory_budget = int(registry.studies['a'].nbytes * 2.5)
+
+    registry.datasets('b', DATASETS)
+    assert loaded(registry) == ['a', 'b']
+    registry.datasets('a', DATASETS)
+    registry.datasets('c', DATASETS)
+    # b was used least recently
+    assert sorted(loaded(registry)) == ['a', 'c']
+    assert list(registry._loaded) == ['a', 'c']
+    assert registry.memory_used() <= registry.memory_budget
+
+    # An evicted study is spilled and reads back the same frames
+    assert os.path.isdir(tmp_path / 'studies' / 'b' / study_registry.SPILL_DIR)
+    frames = registry.datasets('b', DATASETS)
+    pd.testing.assert_frame_equal(frames['adverse_events'], registry.studies['c'].frames['adverse_events'])
+    assert sorted(loaded(registry)) == ['b', 'c']
+
+
+def test_a_single_study_over_budget_stays_loaded(tmp_path):
+    registry = make_registry(tmp_path, studies=('a',))
+    registry.memory_budget = 1
+    assert registry.datasets('a', DATASETS) is registry.studies['a'].frames
+    assert loaded(registry) == ['a']
+
+
+def test_cold_study_load_does_not_block_loaded_studies(tmp_path, monkeypatch):
+    registry = make_registry(tmp_path, studies=('a', 'b'))
+    registry.datasets('a', DATASETS)
+
+    started, release = threading.Event(), threading.Event()
+    load = study_registry.Study.load
+
+    def slow_load(study, datasets):
+        if study.study_id == 'b':
+            started.set()
+            release.wait(10)
+        load(study, datasets)
+
+    monkeypatch.setattr(study_registry.Study, 'load', slow_load)
+    cold = threading.Thread(target=registry.datasets, args=('b', DATASETS))
+    cold.start()
+    try:
+        assert started.wait(10)
+        served = []
+        warm = threading.Thread(target=lambda: served.append(registry.datasets('a', DATASETS)))
+        warm.start()
+        warm.join(timeout=2)
+        assert served, "loaded study waited for another study's load"
+        registry.report()
+    finally:
+        release.set()
+        cold.join(timeout=10)
+    assert sorted(loaded(registry)) == ['a', 'b']
+
+
+def test_changed_dataset_is_reloaded(tmp_path):
+    registry = make_registry(tmp_path, studies=('a',))
+    before = registry.datasets('a', DATASETS)['disposition']
+    path = tmp_path / 'studies' / 'a' / DATASETS['disposition']
+    pd.read_csv(path).head(5).to_csv(path, index=False)
+    os.utime(path, (os.path.getmtime(path) + 10,) * 2)
+
+    after = registry.datasets('a', DATASETS)['disposition']
+    assert len(after) == 5 < len(before)
@@ -0,0 +1,89 @@
+import math
+
+import pytest
+
+import app
+import subgroup_analysis
+import table_engine
+from table_generator import TableGenerator
+
+ARMS = {'treatment': ['Placebo', 'Drug A 20mg']}
+
+# Filters selecting the same subjects as each AGEGR level
+AGE_FILTERS = {'<40': {'age_max': 39}, '40-64': {'age_min': 40, 'age_max': 64}, '>=65': {'age_min': 65}}
+
+_GENERATORS = {}
+
+
+def generator(backend):
+    if backend not in _GENERATORS:
+        engine, _, cubes = backend.partition('+')
+        _GENERATORS[backend] = TableGenerator(backend=engine, cubes=bool(cubes))
+    return _GENERATORS[backend]
+
+
+def level_filters(subgroup, level):
+    return {'sex': [level]} if subgroup == 'SEX' else dict(AGE_FILTERS[level])
+
+
+@pytest.mark.parametrize('backend', ['pandas', 'pandas+cubes', 'sqlite'])
+@pytest.mark.parametrize('table', table_engine.PLANS)
+def test_every_level_matches_the_filtered_table(table, backend):
+    filters = {} if table == 'demographics' else ARMS
+    result = generator(backend).generate_subgroup_tables(table, ['SEX', 'AGEGR'], filters)
+    for subgroup, levels in result['subgroups'].items():
+        assert levels, subgroup
+        for level in levels:
+            expected = generator(backend).generate_table(
+                table, dict(filters, **level_filters(subgroup, level['level'])))
+            assert level['data'] == expected['data'], (subgroup, level['level'])
+            assert level.get('total_subjects') == expected.get('total_subjects')
+
+
+def test_levels_follow_band_order_and_skip_absent_levels():
+    plan = table_engine.PLANS['adverse_events']
+    levels = [level for level, _ in subgroup_analysis.run_subgroup(plan, generator('pandas'), {}, 'BMIGR')]
+    labels = subgroup_analysis.SUBGROUPS['BMIGR']['labels']
+    assert levels == [label for label in labels if label in levels]
+
+    only_young = [level for level, _ in subgroup_analysis.run_subgroup(
+        plan, generator('pandas'), {'age_max': 39}, 'AGEGR')]
+    assert only_young == ['<40']
+
+
+def test_unknown_subgroup_is_rejected():
+    with pytest.raises(ValueError, match='Unknown subgroup'):
+        subgroup_analysis.run_subgroup(table_engine.PLANS['adverse_events'], generator('pandas'), {}, 'EYES')
+    response = app.app.test_client().post('/api/subgroup_matrix', json={'subgroups': ['EYES']})
+    assert response.status_code == 400
+
+
+def test_risk_difference():
+    diff, lower, upper = subgroup_analysis.risk_difference(30, 100, 20, 100)
+    se = math.sqrt(0.3 * 0.7 / 100 + 0.2 * 0.8 / 100)
+    assert diff == 10.0
+    assert lower == round((0.1 - subgroup_analysis.Z_95 * se) * 100, 2)
+    assert upper == round((0.1 + subgroup_analysis.Z_95 * se) * 100, 2)
+
+
+def test_forest_data_for_incidence_tables():
+    forest = generator('pandas').generate_subgroup_tables('adverse_events', ['SEX'], {})['forest']
+    assert {record['level'] for record in forest} == {'F', 'M'}
+    for record in forest:
+        assert record['percent'] == round(record['n'] / record['N'] * 100, 1)
+        if record['arm'] == subgroup_analysis.REFERENCE_ARM:
+            assert 'risk_difference' not in record
+            continue
+        reference = next(r for r in forest if r['arm'] == subgroup_analysis.REFERENCE_ARM
+                         and (r['level'], r['row']) == (record['level'], record['row']))
+        expected = subgroup_analysis.risk_difference(record['n'], record['N'], reference['n'], reference['N'])
+        assert (record['risk_difference'], record['ci_lower'], record['ci_upper']) == expected
+
+
+def test_forest_data_for_descriptive_tables():
+    forest = generator('pandas').generate_subgroup_tables('vital_signs', ['SEX'], {})['forest']
+    assert forest
+    for record in forest:
+        assert record['subgroup'] == 'SEX' and record['n'] > 0
+        if record['ci_lower'] is not None:
+            assert record['ci_lower'] <= record['mean'] <= record['ci_upper']
@@ -0,0 +1,103 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import app
+from subject_sets import SubjectIndex, SubjectSet, SubjectSetColumn
+from table_generator import TableGenerator
+
+UNIVERSE = 21
+A = [0, 3, 7, 8, 20]
+B = [3, 4, 8, 9]
+
+
+def members(subject_set):
+    return set(subject_set.indexes().tolist())
+
+
+def test_set_algebra_matches_python_sets():
+    a = SubjectSet.from_indexes(A, UNIVERSE)
+    b = SubjectSet.from_mask(np.isin(np.arange(UNIVERSE), B))
+    assert members(a & b) == set(A) & set(B)
+    assert members(a | b) == set(A) | set(B)
+    assert members(a - b) == set(A) - set(B)
+    assert members(~a) == set(range(UNIVERSE)) - set(A)
+    assert len(a) == len(A) and len(~a) == UNIVERSE - len(A)
+    assert a == SubjectSet.from_indexes(list(reversed(A)), UNIVERSE)
+    assert len(SubjectSet.full(UNIVERSE)) == UNIVERSE
+    assert members(SubjectSet.union_all([a, b], UNIVERSE)) == set(A) | set(B)
+    assert len(SubjectSet.union_all([], UNIVERSE)) == 0
+
+
+def test_out_of_range_indexes_are_ignored_and_unknown_codes_are_not_members():
+    subject_set = SubjectSet.from_indexes([-1, 2, UNIVERSE, 5], UNIVERSE)
+    assert members(subject_set) == {2, 5}
+    assert subject_set.contains([2, -1, 3, 5]).tolist() == [True, False, False, True]
+    assert subject_set.dense().tolist() == [i in (2, 5) for i in range(UNIVERSE)]
+
+
+def test_sets_of_different_studies_do_not_combine():
+    with pytest.raises(ValueError):
+        SubjectSet.from_indexes(A, UNIVERSE) & SubjectSet.from_indexes(A, UNIVERSE + 1)
+
+
+def test_subject_set_column_union_counts():
+    rng = np.random.default_rng(0)
+    cells = rng.integers(0, 6, size=200)
+    subjects = rng.integers(-1, UNIVERSE, size=200)
+    column = SubjectSetColumn(cells, subjects, 6, UNIVERSE)
+    for cell in range(6):
+        assert members(column[cell]) == set(subjects[(cells == cell) & (subjects >= 0)].tolist())
+
+    # Cells 0-2 form group 0 and cells 3-5 group 1; shared subjects count once
+    counts = column.union_counts(np.arange(6), np.array([0, 0, 0, 1, 1, 1]), 3)
+    expected = [len(set(subjects[np.isin(cells, group) & (subjects >= 0)].tolist()))
+                for group in ([0, 1, 2], [3, 4, 5])]
+    assert counts.tolist() == expected + [0]
+
+
+def test_subject_index_round_trip():
+    index = SubjectIndex(pd.Series(['S3', 'S1', 'S2']))
+    assert index.codes(pd.Series(['S2', 'S9', 'S3'])).tolist() == [2, -1, 0]
+    assert index.to_ids(index.from_codes([2, 0])) == ['S3', 'S2']
+
+
+def subjects_where(frame, mask):
+    return set(frame.loc[mask, 'SUBJID'].astype(str))
+
+
+def post(query, **extra):
+    return app.app.test_client().post('/api/subjects', json=dict(query=query, **extra))
+
+
+def test_subjects_endpoint_matches_the_data():
+    generator = TableGenerator(cubes=False)
+    ae, demographics = generator.adverse_events, generator.demographics
+    nausea = subjects_where(ae, ae['AETERM'] == 'Nausea')
+    women = subjects_where(demographics, demographics['SEX'] == 'F')
+    everyone = set(demographics['SUBJID'].astype(str))
+    nausea_query = {'domain': 'adverse_events', 'filters': {'where': {'column': 'AETERM', 'eq': 'Nausea'}}}
+    women_query = {'filters': {'sex': ['F']}}
+
+    cases = [
+        (nausea_query, nausea),
+        (women_query, women),
+        ({'all': [nausea_query, women_query]}, nausea & women),
+        ({'any': [nausea_query, women_query]}, nausea | women),
+        ({'not': nausea_query}, everyone - nausea),
+    ]
+    for query, expected in cases:
+        response = post(query, list_subjects=True)
+        assert response.status_code == 200
+        body = response.get_json()
+        assert body['count'] == len(expected)
+        assert set(body['subjects']) == expected
+    assert 'subjects' not in post(women_query).get_json()
+
+
+@pytest.mark.parametrize('query', [None, [], {'all': []}, {'domain': 'nope'},
+                                   {'filters': {'where': {'column': 'AGE', 'eq': 'x'}}}])
+def test_subjects_endpoint_rejects_bad_queries(query):
+    response = post(query)
+    assert response.status_code == 400
+    assert 'error' in response.get_json()
@@ -0,0 +1,33 @@
+import table_engine
+import warmup_scheduler
+from table_generator import TableGenerator
+
+
+def test_failing_table_does_not_stop_the_others(monkeypatch):
+    generate = TableGenerator.generate_table
+    failing = list(table_engine.PLANS)[0]
+
+    def generate_table(self, table_type, filters=None):
+        if table_type == failing and filters:
+            raise ValueError("broken filter set")
+        return generate(self, table_type, filters)
+
+    monkeypatch.setattr(TableGenerator, 'generate_table', generate_table)
+    scheduler = warmup_scheduler.WarmupScheduler(
+        {'studies': ['default'], 'filter_sets': [{}, {'sex': ['F']}]}, interval=60)
+    scheduler.check_once()
+
+    assert scheduler.errors == {('default', failing, 1): 'broken filter set'}
+    tables = scheduler.report()['studies']['default']['tables']
+    assert tables[failing]['state'] == 'failed'
+    assert tables[failing]['warm_filter_sets'] == 1
+    assert tables[failing]['errors'] == {1: 'broken filter set'}
+    assert all(tables[t]['state'] == 'warm' for t in table_engine.PLANS if t != failing)
+
+    # A successful warm-up of changed data clears the recorded failures
+    monkeypatch.setattr(TableGenerator, 'generate_table', generate)
+    scheduler.signatures.clear()
+    scheduler.check_once()
+    assert scheduler.errors == {}
+    assert all(table['state'] == 'warm'
+               for table in scheduler.report()['studies']['default']['tables'].values())
@@ -0,0 +1,173 @@
+"""
+Background warm-up of the default table set
+
+A daemon thread polls the data signature (mtime and size of every dataset
+file) of the configured studies every ``WARMUP_INTERVAL`` seconds. When a
+study's files change, or on the first poll, it precomputes every table for
+each configured filter set. The results go into the result cache, so the
+first reviewer after a data refresh gets a cached table.
+
+A table that fails for one filter set is recorded in the report and
+skipped; the remaining tables and filter sets of the study are still
+warmed.
+
+Studies and filter sets come from ``warmup.json`` (or ``WARMUP_CONFIG``).
+The unfiltered table is always warmed.
+"""
+
+import json
+import os
+import threading
+import time
+
+import analysis_cube
+import result_cache
+import study_registry
+import table_engine
+from table_generator import DATASETS, TableGenerator
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+WARMUP_CONFIG = os.environ.get('WARMUP_CONFIG', os.path.join(BASE_DIR, 'warmup.json'))
+WARMUP_INTERVAL = float(os.environ.get('WARMUP_INTERVAL', '5'))
+
+_SCHEDULER = None
+_SCHEDULER_LOCK = threading.Lock()
+
+
+def load_config(path=WARMUP_CONFIG):
+    """{'studies': [...], 'filter_sets': [...]} with the unfiltered set first"""
+    config = {}
+    if os.path.exists(path):
+        with open(path) as f:
+            config = json.load(f)
+    filter_sets = [{}] + [f for f in config.get('filter_sets', []) if f]
+    return {'studies': config.get('studies', ['default']), 'filter_sets': filter_sets}
+
+
+class WarmupScheduler:
+    """Recompute the default tables on a background thread whenever data changes"""
+
+    def __init__(self, config=None, interval=WARMUP_INTERVAL):
+        config = config or load_config()
+        self.studies = list(config['studies'])
+        self.filter_sets = list(config['filter_sets'])
+        self.interval = interval
+        self.signatures = {}
+        self.keys = {}
+        self.timings = {}
+        self.errors = {}
+        self.current = None
+        self._thread = None
+        self._stop = threading.Event()
+        self._wake = threading.Event()
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name='warmup-scheduler', daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._wake.set()
+
+    def trigger(self):
+        """Check for changed data now instead of at the next interval"""
+        self._wake.set()
+
+    def _run(self):
+        while not self._stop.is_set():
+            self.check_once()
+            self._wake.wait(self.interval)
+            self._wake.clear()
+
+    def check_once(self):
+        """Warm every study whose data signature changed since it was last warmed"""
+        for study in self.studies:
+            try:
+                data_path = study_registry.get_registry().data_path(study)
+                signature = analysis_cube.data_signature(data_path, DATASETS)
+                if signature and signature != self.signatures.get(study):
+                    self.warm(study, signature)
+            except Exception as e:
+                self.errors[study] = str(e)
+                print(f"Warm-up of study {study} failed: {e}")
+
+    def warm(self, study, signature):
+        """Compute every (table, filter set) for one study into the result cache
+
+        Failures are recorded per (study, table, filter set index) in
+        self.errors and do not stop the other tables.
+        """
+        generator = TableGenerator(study=study)
+        for key in [key for key in self.errors if key == study or key[0] == study]:
+            del self.errors[key]
+        for table_type in table_engine.PLANS:
+            for index, filters in enumerate(self.filter_sets):
+                self.current = (study, table_type, index)
+                started = time.perf_counter()
+                try:
+                    generator.generate_table(table_type, filters)
+                    self.keys[(study, table_type, index)] = generator.result_key(table_type, filters)
+                except Exception as e:
+                    self.errors[(study, table_type, index)] = str(e)
+                    print(f"Warm-up of {study}/{table_type} (filter set {index}) failed: {e}")
+                self.timings[(study, table_type, index)] = round(time.perf_counter() - started, 4)
+        self.current = None
+        self.signatures[study] = signature
+
+    def report(self):
+        """Warm/cold state of every table for each configured study"""
+        cache = result_cache.get_cache()
+        studies = {}
+        for study in self.studies:
+            tables = {}
+            for table_type in table_engine.PLANS:
+                warm = 0
+                for index in range(len(self.filter_sets)):
+                    key = self.keys.get((study, table_type, index))
+                    if key is not None and key in cache and self._is_current(study, key):
+                        warm += 1
+                errors = {index: self.errors[(study, table_type, index)]
+                          for index in range(len(self.filter_sets))
+                          if (study, table_type, index) in self.errors}
+                if self.current is not None and self.current[:2] == (study, table_type):
+                    state = 'warming'
+                elif warm == len(self.filter_sets):
+                    state = 'warm'
+                elif errors:
+                    state = 'failed'
+                else:
+                    state = 'cold'
+                tables[table_type] = {
+                    'state': state,
+                    'warm_filter_sets': warm,
+                    'filter_sets': len(self.filter_sets),
+                    'seconds': round(sum(self.timings.get((study, table_type, i), 0)
+                                         for i in range(len(self.filter_sets))), 4),
+                }
+                if errors:
+                    tables[table_type]['errors'] = errors
+            studies[study] = {'tables': tables}
+            if study in self.errors:
+                studies[study]['error'] = self.errors[study]
+        return {
+            'running': self._thread is not None and self._thread.is_alive(),
+            'interval_seconds': self.interval,
+            'filter_sets': self.filter_sets,
+            'studies': studies,
+            'cache': cache.stats(),
+        }
+
+    def _is_current(self, study, key):
+        """True if a warmed key still matches the study's data on disk"""
+        data_path = study_registry.get_registry().data_path(study)
+        return key[-1] == analysis_cube.data_signature(data_path, DATASETS)
+
+
+def get_scheduler():
+    """Process-wide warm-up scheduler (created on first use, not started)"""
+    global _SCHEDULER
+    with _SCHEDULER_LOCK:
+        if _SCHEDULER is None:
+            _SCHEDULER = WarmupScheduler()
+        return _SCHEDULER